@@ -0,0 +1,160 @@
+# Extract metadata from the image files inside zip and tar archives, without extracting them to disk first. Files in
+# an archive are named as the archive path followed by '!' and the path within the archive, e.g.
+#   photos-2015.zip!/holiday/IMG_0001.jpg
+#
+# The metadata segments of a JPEG file all come before the compressed image data, so only the leading bytes of each
+# JPEG file in an archive are read (and decompressed), as planned by ReadPlanner.py, and parsed with
+# JPEG.processFile's headerOnly option. TIFF and HEIF files can have their metadata anywhere in the file, so are read
+# in full.
+#
+# Tar archives (including compressed ones) are read as a stream, so each member is read in the order in which it is
+# stored and the archive is only read once. The members of a zip archive can be read independently, so are shared
+# out between a pool of worker processes.
+#
+# Used by CSV_from_JPEG_metadata.py's --archives option. Run directly to display the properties of the image files in
+# an archive:
+#   python ArchiveScanner.py photos.zip
+
+import sys
+import os
+import io
+import posixpath
+import tarfile
+import zipfile
+import zlib
+
+import FileTypes
+import ReadPlanner
+
+archiveFileExtensions = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+def isArchiveName(n) :
+    return n.lower().endswith(archiveFileExtensions)
+
+memberNameSeparator = "!/"
+
+def memberFileName(archiveName, memberName) :
+    # Tar archives made with e.g. 'tar cf archive.tar .' have member names starting with './'
+    return archiveName + memberNameSeparator + posixpath.normpath(memberName).lstrip("/")
+
+# Errors reading (decompressing) a single member of an archive: a damaged member, an encrypted member, a compression
+# method which isn't supported, or an archive which is cut short
+memberReadErrors = (OSError, EOFError, RuntimeError, NotImplementedError, zlib.error, tarfile.TarError, zipfile.BadZipFile)
+
+# As for files on disk, the record for a file we failed to process has just the name and size
+def failedMemberProperties(name, size) :
+    return {'filename' : name, 'bytes' : size}
+
+##
+###########################################################################
+##
+
+# Extract the properties of an image file in an archive, reading from the member's file object. Returns None if the
+# file isn't an image file we can handle. The reads are planned separately for each folder in the archive.
+def memberProperties(name, size, memberFile) :
+    key = posixpath.dirname(name)
+    try :
+        data = memberFile.read(ReadPlanner.defaultPlanner.readSize(key))
+    except memberReadErrors as e :
+        print("*** Error reading archive member:", name, " : ", e, file=sys.stderr)
+        return failedMemberProperties(name, size)
+    fileType = FileTypes.fileTypeFromSignature(data[0:FileTypes.signatureLength])
+    if fileType is None :
+        return None
+
+    headerOnly = fileType == "JPEG"
+    try :
+        if headerOnly :
+            data = ReadPlanner.readHeader(memberFile, key=key, data=data)
+        else :
+            data += memberFile.read()
+    except memberReadErrors as e :
+        print("*** Error reading archive member:", name, " : ", e, file=sys.stderr)
+        return failedMemberProperties(name, size)
+
+    try :
+        p = FileTypes.processImageFile(name, fileType, fileObject=io.BytesIO(data), headerOnly=headerOnly)
+    except Exception as e :
+        print("Exception processing image file:", name, " : ", e, file=sys.stderr)
+        p = None
+
+    if p is None :
+        return failedMemberProperties(name, size)
+    p['bytes'] = size
+    return p
+
+def tarMembersProperties(archiveName) :
+    with tarfile.open(archiveName, "r|*") as tar :
+        for member in tar :
+            if not member.isfile() :
+                continue
+            p = memberProperties(memberFileName(archiveName, member.name), member.size, tar.extractfile(member))
+            if p is not None :
+                yield p
+
+# Zip archives opened by this process, so that each worker process only reads an archive's directory once
+openZipFiles = {}
+
+def zipMemberProperties(archiveAndMember) :
+    archiveName, memberName = archiveAndMember
+    name = memberFileName(archiveName, memberName)
+    size = ''
+    try :
+        archive = openZipFiles.get(archiveName)
+        if archive is None :
+            archive = zipfile.ZipFile(archiveName)
+            openZipFiles[archiveName] = archive
+        info = archive.getinfo(memberName)
+        size = info.file_size
+        # Opening the member checks its local header, and fails for encrypted members and unsupported compression
+        # methods. Reading it checks the CRC once the end of the member is reached.
+        with archive.open(info) as memberFile :
+            return memberProperties(name, size, memberFile)
+    except memberReadErrors as e :
+        print("*** Error reading archive member:", name, " : ", e, file=sys.stderr)
+        return failedMemberProperties(name, size)
+
+def zipMembersProperties(archiveName, workers=None, batchSize=64) :
+    import concurrent.futures
+
+    with zipfile.ZipFile(archiveName) as archive :
+        memberNames = [info.filename for info in archive.infolist() if not info.is_dir()]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor :
+        for p in executor.map(zipMemberProperties, [(archiveName, memberName) for memberName in memberNames], chunksize=batchSize) :
+            if p is not None :
+                yield p
+
+# Properties of each image file in a zip or tar archive, in the order they are stored in the archive
+def archiveProperties(archiveName, workers=None) :
+    try :
+        if zipfile.is_zipfile(archiveName) :
+            yield from zipMembersProperties(archiveName, workers)
+        else :
+            yield from tarMembersProperties(archiveName)
+    except memberReadErrors as e :
+        # e.g. a tar archive which is cut short, so the following members can't be found
+        print("*** Error reading archive:", archiveName, " : ", e, file=sys.stderr)
+
+#
+####################################
+#
+
+def main(archiveName) :
+    if not os.path.isfile(archiveName) :
+        print("***",  archiveName, "is not a file", file=sys.stderr)
+        return
+
+    import JPEGDisplay
+    for p in archiveProperties(archiveName) :
+        print()
+        print(p['filename'])
+        JPEGDisplay.displayMainProperties(p)
+
+if __name__ == "__main__" :
+
+    if len(sys.argv) == 1 :
+        print("No archive filename command line argument provided")
+        exit()
+
+    main(sys.argv[1])
@@ -0,0 +1,35 @@
+# Build the optional C accelerator module _jpegaccel from _jpegaccel.c, in this folder, using the C compiler and
+# settings Python itself was built with. Needs a C compiler and the Python development headers. If the module isn't
+# built (or can't be loaded), JPEG.py uses its pure Python versions of the same functions.
+#
+# Usage:
+#   python BuildAccelerator.py
+
+import sys
+import os
+import shlex
+import sysconfig
+import subprocess
+
+def build() :
+    folder = os.path.dirname(os.path.abspath(__file__))
+    source = os.path.join(folder, "_jpegaccel.c")
+    target = os.path.join(folder, "_jpegaccel" + sysconfig.get_config_var("EXT_SUFFIX"))
+
+    compiler = shlex.split(sysconfig.get_config_var("CC") or "cc")
+    flags = shlex.split(sysconfig.get_config_var("CFLAGS") or "") + shlex.split(sysconfig.get_config_var("CCSHARED") or "")
+    linkFlags = shlex.split(sysconfig.get_config_var("LDSHARED") or "")[1:] or ["-shared"]
+    includes = ["-I" + sysconfig.get_paths()["include"], "-I" + sysconfig.get_paths()["platinclude"]]
+
+    command = compiler + flags + ["-O3"] + includes + linkFlags + [source, "-o", target]
+    print(" ".join(command))
+    result = subprocess.run(command)
+    if result.returncode != 0 :
+        print("*** Build of the accelerator module failed, the pure Python code will be used", file=sys.stderr)
+        return False
+
+    print("Built", target)
+    return True
+
+if __name__ == "__main__" :
+    build()
@@ -1,23 +1,46 @@
 import os
 import sys
-import re
-import csv
+import contextlib
 
-import JPEG  
-import MapURLs
+import FileTypes
+
+# Modules only needed for some of the options (csv, json, sqlite3, MapURLs, FolderWatcher, MetadataSummary, ...) are
+# imported by the functions which use them, so that importing this module (e.g. to use imageFileProperties) is quick.
 
 def getCSVHeader() :
     return ["Filename", "Size (bytes)", "Make", "Model", "Software", "Timestamp", "Columns", "Rows", "Latitude", "Longitude", "Altitude (m)", "FromGPS", 
+            "Encoding", "Scans", "Restart interval", "Original timestamp", "Subsecond",
+            "Place", "Region", "Country", "Place distance (km)",
             "OSMaps URL", "Google Maps URL", "Google Street View URL" ]
 
-def processJpegFile(dirName, jpegFileName) :
-    fullPath = dirName + "\\" + jpegFileName
+def processJpegFile(dirName, jpegFileName, writeIndex=False, fileType=None) :
+    p = imageFileProperties(dirName, jpegFileName, writeIndex, fileType)
+    return str(p), CSVRecordForProperties(p)
+
+# If headerOnly is set, JPEG files are only read as far as the start of the scan data (see JPEG.processFile), so
+# the number of scans isn't known
+def imageFileProperties(dirName, jpegFileName, writeIndex=False, fileType=None, headerOnly=False) :
+    fullPath = os.path.join(dirName, jpegFileName)
 
+    # Despite the name, also handles TIFF/DNG and HEIF files, dispatching on the signature bytes at the start of the file
     try :
-        p = JPEG.processFile(fullPath)
+        p = FileTypes.processImageFile(fullPath, fileType, writeIndex=writeIndex, headerOnly=headerOnly)
+        if p is not None and headerOnly :
+            p['bytes'] = os.path.getsize(fullPath)
     except Exception as e :
-        print("Exception processing JPEG file:", fullPath, " : ", e, file=sys.stderr)
-        p = ""
+        print("Exception processing image file:", fullPath, " : ", e, file=sys.stderr)
+        p = None
+
+    # Still produce a record for a file we failed to process, with just the name and size
+    if p is None :
+        p = {}
+        p['filename'] = fullPath
+        p['bytes'] = os.path.getsize(fullPath) if os.path.isfile(fullPath) else ''
+
+    return p
+
+def CSVRecordForProperties(p) :
+    import MapURLs
 
     l = []
     l.append(p['filename'])
@@ -35,6 +58,16 @@ def processJpegFile(dirName, jpegFileName) :
     if 'latitude' in p :
         fromGPS = 'Y' if p['fromGPS'] else 'N'
     l.append(fromGPS)
+    l.append(p['encoding'] if 'encoding' in p else '')
+    l.append(p['scans'] if 'scans' in p else '')
+    l.append(p['restartInterval'] if 'restartInterval' in p else '')
+    l.append(p['originalTimestamp'] if 'originalTimestamp' in p else '')
+    l.append(p['subSecond'] if 'subSecond' in p else '')
+    # Only present if the run has a gazetteer, see Gazetteer.py
+    l.append(p['place'] if 'place' in p else '')
+    l.append(p['region'] if 'region' in p else '')
+    l.append(p['country'] if 'country' in p else '')
+    l.append(p['placeDistance'] if 'placeDistance' in p else '')
 
     if 'latitude' in p and 'longitude' in p:
         zoomLevel = 16
@@ -42,16 +75,16 @@ def processJpegFile(dirName, jpegFileName) :
         l.append(MapURLs.urlForGoogleMaps(p['latitude'], p['longitude'], zoomLevel))
         l.append(MapURLs.urlForGoogleMapsStreetView(p['latitude'], p['longitude']))
 
-    # Convert to a CSV line for output
-    return str(p), l
+    return l
 
-# Only deal with files with a .jpeg or .jpeg file extension
-p = re.compile(r"^.*\.jpe?g$", re.IGNORECASE)
-def isJpegName(n) :
-    return p.match(n)
+# Only deal with files with a .jpg or .jpeg file extension, or the extension of another format containing Exif
+# metadata: TIFF, raw DNG, HEIF. (The file contents determine how it is handled.)
+imageFileExtensions = (".jpg", ".jpeg", ".tif", ".tiff", ".dng", ".heic", ".heif")
+def isImageName(n) :
+    return n.lower().endswith(imageFileExtensions)
 
-# Extract a list of (directory-path, filename) tuples for all the JPEG files under
-# this directory, recursing into sub-directories.
+# Extract a list of (directory-path, filename) tuples for all the files under this directory, recursing into
+# sub-directories. Which ones are image files is determined by sniffFiles.
 def processDirectory(topdir) :
     outputList = []
     
@@ -62,55 +95,440 @@ def processDirectory(topdir) :
     # - list of files in this directory
 
     for dirpath, dirnamesList, filenamesList in os.walk(topdir) :
-        outputList.extend([(dirpath, name) for name in filenamesList if isJpegName(name)])
+        outputList.extend([(dirpath, name) for name in filenamesList])
 
     return outputList
 
+# Read the first few bytes of each file and work out the file type from these signature bytes, so that only files
+# we can handle are scheduled for a full parse. Files are read a batch at a time into one buffer which is reused
+# for every batch, with a slot of FileTypes.signatureLength bytes per file.
+# Returns:
+# - a list of (directory-path, filename, file type) tuples for the files to process, including image files without
+#   an image file name
+# - a dictionary of the files with an image file name which are not in fact image files we can handle, keyed on
+#   what they appear to be instead, with a list of file paths for each
+def sniffFiles(filesList, batchSize=256) :
+    slotSize = FileTypes.signatureLength
+    buffer = bytearray(batchSize * slotSize)
+    view = memoryview(buffer)
+    readLengths = [0] * batchSize
+
+    imageFilesList = []
+    rejected = {}
+
+    for batchStart in range(0, len(filesList), batchSize) :
+        batch = filesList[batchStart:batchStart+batchSize]
+        for i, (dirpath, name) in enumerate(batch) :
+            try :
+                with open(os.path.join(dirpath, name), "rb", buffering=0) as f :
+                    readLengths[i] = f.readinto(view[i*slotSize:(i+1)*slotSize])
+            except OSError as e :
+                print("*** Error reading file:", os.path.join(dirpath, name), " : ", e, file=sys.stderr)
+                readLengths[i] = -1
+
+        for i, (dirpath, name) in enumerate(batch) :
+            if readLengths[i] < 0 :
+                if isImageName(name) :
+                    rejected.setdefault("Unreadable", []).append(os.path.join(dirpath, name))
+                continue
+            headerBytes = view[i*slotSize:i*slotSize+readLengths[i]]
+            fileType = FileTypes.fileTypeFromSignature(headerBytes)
+            if fileType :
+                imageFilesList.append( (dirpath, name, fileType) )
+            elif isImageName(name) :
+                rejected.setdefault(FileTypes.describeSignature(headerBytes), []).append(os.path.join(dirpath, name))
+
+    return imageFilesList, rejected
+
+def reportRejectedFiles(rejected, maxListed=10) :
+    total = sum(len(l) for l in rejected.values())
+    if total == 0 :
+        return
+    print("Skipped", total, "file(s) with an image file name which are not image files that can be handled:")
+    for description, pathsList in sorted(rejected.items()) :
+        print("-", description, ":", len(pathsList), "file(s)")
+        for path in pathsList[0:maxListed] :
+            print("   ", path)
+        if len(pathsList) > maxListed :
+            print("    ...")
+
+
+# Process the files, writing a CSV record for each file unless CSVFileName is None, and adding the properties of each
+# file to the summary if there is one. (Only the summary is kept in memory, so a large folder tree can be summarised
+# without producing a CSV file.)
+# If archivesList is given, the image files inside each of the zip/tar archive files listed are also processed (see
+# ArchiveScanner.py), with zip archives shared out between worker processes.
+# If a gazetteer is given, the nearest place to each file's location is added to its properties (see Gazetteer.py).
+def writeCSVFile(CSVFileName, jpegFilesList, writeIndex=False, summary=None, archivesList=(), workers=None, headerOnly=False, gazetteer=None) :
+    import csv
+
+    with contextlib.ExitStack() as stack :
+        myCSVWriter = None
+        if CSVFileName is not None :
+            csvfile = stack.enter_context(open(CSVFileName, "w", newline=""))
+            myCSVWriter = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            csvHeader = getCSVHeader()
+            myCSVWriter.writerow(csvHeader)
+
+        def writeProperties(p) :
+            if gazetteer is not None :
+                gazetteer.enrichProperties(p)
+            if summary is not None :
+                summary.add(p)
+            if myCSVWriter is not None :
+                myCSVWriter.writerow(CSVRecordForProperties(p))
+
+        n = 0
+        for dirName, jpegFileName, fileType in jpegFilesList :
+            n += 1
+            writeProperties(imageFileProperties(dirName, jpegFileName, writeIndex, fileType, headerOnly))
+            if n % 10 == 0 :
+                print(" .. ", n, "/", len(jpegFilesList), " .. ", dirName, jpegFileName)
+
+        if archivesList :
+            import ArchiveScanner
+            for archiveName in archivesList :
+                print(" .. reading archive", archiveName)
+                for p in ArchiveScanner.archiveProperties(archiveName, workers) :
+                    writeProperties(p)
+
+##
+###########################################################################
+##
+
+# For very large folder trees, the work can be split into 'shards', each producing its own CSV file, so that:
+# - a run which fails part way through can be resumed, skipping the shards which have already been completed
+# - several machines with the folder tree on a shared mount can each work on different shards of the same job
+# Files are assigned to shards using a hash of their directory path, so every run (and every machine) assigns
+# them in the same way, and files in the same directory are processed together. Within a shard, files are
+# processed in order of their path.
+#
+# Each shard's CSV file is written under a temporary name and then renamed, so a shard's CSV file only exists
+# once it is complete. Completed shards are then recorded in a manifest file, one line of JSON per shard. When all
+# the shards are complete, their CSV files are combined into a single CSV file in the same folder, by whichever run
+# completes the last shard.
+shardsDirectoryName = "JPEGs.shards"
+manifestFileName = "manifest.jsonl"
+combinedCSVFileName = "JPEGs.csv"
+
+def shardForDirectory(dirName, shardCount) :
+    import zlib
+    return zlib.crc32(os.fsencode(dirName)) % shardCount
+
+def shardCSVFileName(outputDir, shardIndex, shardCount) :
+    return os.path.join(outputDir, "shard-{0:04d}-of-{1:04d}.csv".format(shardIndex, shardCount))
+
+# The shards recorded in the manifest as completed for this job (same location and shard count), where the shard
+# CSV file is present
+def completedShards(outputDir, location, shardCount) :
+    import json
+    completed = set()
+    try :
+        with open(os.path.join(outputDir, manifestFileName)) as f :
+            for line in f :
+                try :
+                    entry = json.loads(line)
+                except ValueError :
+                    # A partly written last line
+                    continue
+                if entry['location'] == location and entry['shards'] == shardCount and os.path.isfile(shardCSVFileName(outputDir, entry['shard'], shardCount)) :
+                    completed.add(entry['shard'])
+    except OSError :
+        pass
+    return completed
+
+def recordCompletedShard(outputDir, location, shardIndex, shardCount, fileCount) :
+    import json
+    import time
+    import socket
+
+    entry = {'location' : location, 'shard' : shardIndex, 'shards' : shardCount, 'files' : fileCount,
+                'host' : socket.gethostname(), 'completed' : time.strftime("%Y-%m-%d %H:%M:%S")}
+    # A single write of a complete line to a file opened for appending, so that entries from more than one process
+    # don't get mixed up
+    fd = os.open(os.path.join(outputDir, manifestFileName), os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+    try :
+        os.write(fd, (json.dumps(entry) + "\n").encode())
+    finally :
+        os.close(fd)
+
+# Written under a unique temporary name and then renamed, as runs on two machines can complete their last shards at
+# the same time
+def combineShards(outputDir, shardCount) :
+    import csv
+    import tempfile
+
+    CSVFileName = os.path.join(outputDir, combinedCSVFileName)
+    fd, tempName = tempfile.mkstemp(prefix=combinedCSVFileName + ".", suffix=".tmp", dir=outputDir)
+    with open(fd, "w", newline="") as csvfile :
+        csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL).writerow(getCSVHeader())
+        for shardIndex in range(0, shardCount) :
+            with open(shardCSVFileName(outputDir, shardIndex, shardCount), newline="") as shardFile :
+                # Skip the header line
+                shardFile.readline()
+                for line in shardFile :
+                    csvfile.write(line)
+    os.replace(tempName, CSVFileName)
+    return CSVFileName
+
+# Process the shards of the job, or just the shards in shardIndexes if given. Archive files are assigned to shards in
+# the same way as other files, by the directory they are in.
+def runShards(location, shardCount, shardIndexes=None, resume=False, outputDir=shardsDirectoryName, writeIndex=False,
+                readArchives=False, workers=None, headerOnly=False, gazetteer=None) :
+    os.makedirs(outputDir, exist_ok=True)
+    if shardIndexes is None :
+        shardIndexes = range(0, shardCount)
+
+    toDo = set(shardIndexes)
+    if resume :
+        skipped = toDo & completedShards(outputDir, location, shardCount)
+        if skipped :
+            print("Skipping", len(skipped), "shard(s) already completed")
+        toDo -= skipped
+
+    if toDo :
+        filesList = [(dirName, name) for dirName, name in processDirectory(location) if shardForDirectory(dirName, shardCount) in toDo]
+        filesList.sort()
+        print("Found", len(filesList), "file(s) under", location, "in", len(toDo), "shard(s) to process")
+
+        for shardIndex in sorted(toDo) :
+            shardFilesList = [(dirName, name) for dirName, name in filesList if shardForDirectory(dirName, shardCount) == shardIndex]
+            shardFilesList, archivesList = splitArchives(shardFilesList, readArchives)
+            jpegFilesList, rejected = sniffFiles(shardFilesList)
+            print("Shard", shardIndex, ":", len(jpegFilesList), "JPEG file(s) to process")
+            if archivesList :
+                print("Shard", shardIndex, ":", len(archivesList), "archive file(s) to read")
+            reportRejectedFiles(rejected)
+
+            CSVFileName = shardCSVFileName(outputDir, shardIndex, shardCount)
+            tempName = CSVFileName + ".tmp"
+            writeCSVFile(tempName, jpegFilesList, writeIndex, None, archivesList, workers, headerOnly, gazetteer)
+            os.replace(tempName, CSVFileName)
+            recordCompletedShard(outputDir, location, shardIndex, shardCount, len(jpegFilesList))
+
+    remaining = shardCount - len(completedShards(outputDir, location, shardCount))
+    if remaining == 0 :
+        CSVFileName = combineShards(outputDir, shardCount)
+        print("All", shardCount, "shard(s) complete, produced CSV file:", CSVFileName)
+    else :
+        print(remaining, "shard(s) still to be completed")
+
+##
+###########################################################################
+##
+
+# In watch mode, the records are kept in a SQLite database rather than written to a CSV file, so that they can be
+# updated as files are added, modified and removed, and so that when watching restarts only files which have changed
+# since they were last processed need to be processed again. Each file's record is held as the JSON of its CSV record,
+# along with the file size and modification time it was produced from.
+storeFileName = "JPEGs.db"
+
+def openStore(storeName) :
+    import sqlite3
+
+    conn = sqlite3.connect(storeName)
+    conn.execute("CREATE TABLE IF NOT EXISTS images (filename TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, record TEXT)")
+    conn.commit()
+    return conn
+
+def storedFileStates(conn) :
+    return {filename : (size, mtime) for filename, size, mtime in conn.execute("SELECT filename, size, mtime FROM images")}
+
+# Process the files and insert or replace their records in the store, committing every batchSize files
+def updateStore(conn, jpegFilesList, writeIndex=False, batchSize=100) :
+    import json
+    import FolderWatcher
+
+    n = 0
+    for dirName, jpegFileName, fileType in jpegFilesList :
+        fullPath = os.path.join(dirName, jpegFileName)
+        state = FolderWatcher.fileState(fullPath)
+        (dict, summaryList) = processJpegFile(dirName, jpegFileName, writeIndex, fileType)
+        size, mtime = state if state else (None, None)
+        conn.execute("INSERT OR REPLACE INTO images (filename, size, mtime, record) VALUES (?, ?, ?, ?)",
+                        (fullPath, size, mtime, json.dumps(summaryList)))
+        n += 1
+        if n % batchSize == 0 :
+            conn.commit()
+            print(" .. ", n, "/", len(jpegFilesList), " .. ", dirName, jpegFileName)
+    conn.commit()
+
+# Remove the records for files, or for all the files under a folder
+def removeFromStore(conn, paths) :
+    for path in paths :
+        conn.execute("DELETE FROM images WHERE filename = ? OR substr(filename, 1, ?) = ?", (path, len(path)+1, os.path.join(path, "")))
+    conn.commit()
+
+def exportStore(conn, CSVFileName) :
+    import csv
+    import json
+
+    with open(CSVFileName, "w", newline="") as csvfile:
+        myCSVWriter = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        myCSVWriter.writerow(getCSVHeader())
+        for (record,) in conn.execute("SELECT record FROM images ORDER BY filename") :
+            myCSVWriter.writerow(json.loads(record))
+
+# Process files which have been added or modified. Files which are no longer image files we can handle are removed.
+def filesChanged(conn, paths, writeIndex=False) :
+    jpegFilesList, rejected = sniffFiles([os.path.split(path) for path in paths])
+    reportRejectedFiles(rejected)
+    imagePaths = set(os.path.join(dirName, name) for dirName, name, fileType in jpegFilesList)
+    removeFromStore(conn, [path for path in paths if path not in imagePaths])
+    if jpegFilesList :
+        print("Processing", len(jpegFilesList), "new or modified file(s)")
+        updateStore(conn, jpegFilesList, writeIndex)
+
+def watch(location, writeIndex=False, usePolling=False) :
+    import FolderWatcher
+
+    conn = openStore(storeFileName)
+
+    # Start watching before the initial scan, collecting the changes seen during the scan to apply after it, so that
+    # files changed while the scan is running aren't missed
+    watcher = FolderWatcher.startWatcher(location, usePolling=usePolling)
+    changeBuffer = FolderWatcher.ChangeBuffer(watcher)
+
+    try :
+        try :
+            # Initial scan, only processing files which are new or have changed since they were last processed, and
+            # removing records for files which no longer exist
+            filesList = processDirectory(location)
+            storedStates = storedFileStates(conn)
+            changedFilesList = [(dirName, name) for dirName, name in filesList if storedStates.get(os.path.join(dirName, name)) != FolderWatcher.fileState(os.path.join(dirName, name))]
+            existingPaths = set(os.path.join(dirName, name) for dirName, name in filesList)
+            prefix = os.path.join(location, "")
+            removeFromStore(conn, [path for path in storedStates if path.startswith(prefix) and path not in existingPaths])
+
+            jpegFilesList, rejected = sniffFiles(changedFilesList)
+            print("Found", len(jpegFilesList), "new or modified JPEG file(s) to process under", location)
+            reportRejectedFiles(rejected)
+            updateStore(conn, jpegFilesList, writeIndex)
+        finally :
+            bufferedChanges = changeBuffer.stop()
+
+        FolderWatcher.watchFolder(location,
+                                    lambda paths : filesChanged(conn, paths, writeIndex),
+                                    lambda paths : removeFromStore(conn, paths),
+                                    watcher=watcher, bufferedChanges=bufferedChanges)
+    except KeyboardInterrupt :
+        pass
+    finally :
+        watcher.close()
+        conn.close()
 
 #
 ####################################
 #
 
-def main(location) :
+# Separate the zip and tar archive files from the other files, if archives are to be read
+def splitArchives(filesList, readArchives) :
+    if not readArchives :
+        return filesList, []
+    import ArchiveScanner
+    archivesList = [os.path.join(dirName, name) for dirName, name in filesList if ArchiveScanner.isArchiveName(name)]
+    filesList = [(dirName, name) for dirName, name in filesList if not ArchiveScanner.isArchiveName(name)]
+    return filesList, archivesList
+
+def loadGazetteer(gazetteerFileName) :
+    if not gazetteerFileName :
+        return None
+    import Gazetteer
+    gazetteer = Gazetteer.Gazetteer().load(gazetteerFileName)
+    print("Loaded", len(gazetteer.names), "places from gazetteer file:", gazetteerFileName)
+    return gazetteer
+
+# If summaryFileName is given, a JSON summary of the files is also produced, and the CSV file can be skipped
+# If readArchives is set, zip and tar archive files are read too, processing the image files inside them.
+def main(location, writeIndex=False, summaryFileName=None, writeCSV=True, readArchives=False, workers=None, headerOnly=False, gazetteerFileName=None) :
 
     if os.path.isdir(location) :
-        jpegFilesList = processDirectory(location)
+        filesList = processDirectory(location)
     elif os.path.isfile(location) :
-        dirname, filename = os.path.split(location)
-        if isJpegName(filename) :
-            jpegFilesList = [(dirname, filename)]
-        else :
-            print('*** ', location, " is not a JPEG file name")
-            exit()
+        filesList = [os.path.split(location)]
     else :
         print('*** ', location, " is not a file or directory name")
         exit()
 
+    filesList, archivesList = splitArchives(filesList, readArchives)
+
+    jpegFilesList, rejected = sniffFiles(filesList)
+    if os.path.isfile(location) and not jpegFilesList and not archivesList :
+        print('*** ', location, " is not a JPEG file")
+        exit()
+
     print("Found", len(jpegFilesList), "JPEG file(s) to process under", location)
+    if archivesList :
+        print("Found", len(archivesList), "archive file(s) to read under", location)
+    reportRejectedFiles(rejected)
 
-    CSVFileName = "JPEGs.csv"
-    with open(CSVFileName, "w", newline="") as csvfile:
-        myCSVWriter = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-        csvHeader = getCSVHeader()
-        myCSVWriter.writerow(csvHeader)
-        n = 0
-        for dirName, jpegFileName in jpegFilesList :
-            n += 1
-            (dict, summaryList) = processJpegFile(dirName, jpegFileName)
-            myCSVWriter.writerow(summaryList)
-            if n % 10 == 0 :
-                print(" .. ", n, "/", len(jpegFilesList), " .. ", dirName, jpegFileName)
+    CSVFileName = "JPEGs.csv" if writeCSV else None
+    summary = None
+    if summaryFileName :
+        import MetadataSummary
+        summary = MetadataSummary.MetadataSummary()
+    gazetteer = loadGazetteer(gazetteerFileName)
 
-    print("Produced CSV file:", CSVFileName)
+    writeCSVFile(CSVFileName, jpegFilesList, writeIndex, summary, archivesList, workers, headerOnly, gazetteer)
+    if CSVFileName :
+        print("Produced CSV file:", CSVFileName)
+    if summary is not None :
+        MetadataSummary.writeSummary(summary, summaryFileName)
+        print("Produced summary file:", summaryFileName)
 #
 ####################################
 #
 
 if __name__ == "__main__" :
 
-    if len(sys.argv) == 1 :
-        print("No directory/file name command line argument provided")
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Extract basic metadata from JPEG files into a CSV file")
+    parser.add_argument("location", help="JPEG file, or folder to search for JPEG files")
+    parser.add_argument("--index", action="store_true", help="also save a segment index sidecar file for each JPEG file")
+    parser.add_argument("--watch", action="store_true", help="keep the records in " + storeFileName + " up to date as files are added, modified and removed under the folder")
+    parser.add_argument("--poll", action="store_true", help="with --watch, poll for changes rather than using inotify")
+    parser.add_argument("--export", action="store_true", help="just produce JPEGs.csv from the records in " + storeFileName)
+    parser.add_argument("--summary", metavar="FILE", default=None, help="also produce a JSON summary (counts per camera, per day and month, resolutions, GPS coverage)")
+    parser.add_argument("--no-csv", action="store_true", help="with --summary, just produce the summary, not the CSV file")
+    parser.add_argument("--shards", type=int, default=None, help="split the work into this many shards, each producing its own CSV file")
+    parser.add_argument("--shard-index", type=int, action="append", default=None, help="with --shards, only process this shard (can be repeated), e.g. to share a job between machines")
+    parser.add_argument("--resume", action="store_true", help="with --shards, skip shards already completed")
+    parser.add_argument("--output-dir", default=shardsDirectoryName, help="with --shards, folder for the shard CSV files, manifest and combined " + combinedCSVFileName + " (default: %(default)s)")
+    parser.add_argument("--archives", action="store_true", help="also process the image files inside zip and tar archive files, without extracting them")
+    parser.add_argument("--workers", type=int, default=None, help="with --archives, number of worker processes for reading zip archives (default: one per CPU)")
+    parser.add_argument("--header-only", action="store_true", help="only read JPEG files as far as the start of the image data, e.g. for files on a network file system (the number of scans isn't reported)")
+    parser.add_argument("--gazetteer", metavar="FILE", default=None, help="add the nearest place, region and country to each file with a location, from a GeoNames gazetteer file (e.g. cities1000.txt)")
+    args = parser.parse_args()
+
+    if args.gazetteer and not os.path.isfile(args.gazetteer) :
+        print('*** ', args.gazetteer, " is not a file")
         exit()
 
-    location = sys.argv[1]
-    main(location)
+    if args.export :
+        with contextlib.closing(openStore(storeFileName)) as conn :
+            exportStore(conn, "JPEGs.csv")
+        print("Produced CSV file: JPEGs.csv")
+    elif args.watch :
+        if not os.path.isdir(args.location) :
+            print('*** ', args.location, " is not a directory name")
+            exit()
+        watch(args.location, args.index, args.poll)
+    elif args.shards :
+        if not os.path.isdir(args.location) :
+            print('*** ', args.location, " is not a directory name")
+            exit()
+        if args.shard_index and not all(0 <= i < args.shards for i in args.shard_index) :
+            print('*** Shard indexes must be between 0 and', args.shards-1)
+            exit()
+        # The summary counts would need combining across the shards, possibly processed on different machines
+        if args.summary or args.no_csv :
+            print('*** --summary and --no-csv can\'t be used with --shards')
+            exit()
+        runShards(args.location, args.shards, args.shard_index, args.resume, args.output_dir, args.index,
+                    args.archives, args.workers, args.header_only, loadGazetteer(args.gazetteer))
+    else :
+        if args.no_csv and not args.summary :
+            print('*** --no-csv only makes sense with --summary')
+            exit()
+        main(args.location, args.index, args.summary, not args.no_csv, args.archives, args.workers, args.header_only, args.gazetteer)
@@ -0,0 +1,185 @@
+# Check that the C accelerator module (see BuildAccelerator.py) gives exactly the same results as the pure Python
+# code in JPEG.py, and compare their speed:
+# - the two inner functions, on randomly generated data with many <FF> bytes, RST markers, and truncated IFDs and negative IFD offsets
+# - processing each file in a corpus both ways, comparing the properties extracted, the restart marker offsets found
+#   and the JPEGValidate verdicts. The corpus is the files under a folder if one is given, otherwise the seed files
+#   generated by FuzzParsers.py together with damaged versions of them, so that no files are needed.
+#
+# Usage:
+#   python CompareAccelerator.py [folder]
+# Exits with status 1 if any differences are found.
+
+import sys
+import os
+import io
+import time
+import random
+import contextlib
+from array import array
+
+import JPEG
+import FileTypes
+import JPEGValidate
+import FuzzParsers
+
+randomCases = 2000
+
+# Damaged versions of the seed files in the generated corpus
+generatedCases = 500
+
+def bothWays(function) :
+    JPEG.useAccelerator(False)
+    pythonResult = function()
+    JPEG.useAccelerator(True)
+    acceleratedResult = function()
+    return pythonResult, acceleratedResult
+
+# Random scan-like data, with extra <FF> bytes followed by the bytes of interest
+def randomScanData(rng, length) :
+    data = bytearray(rng.getrandbits(8) for i in range(0, length))
+    for i in range(0, length // 8) :
+        n = rng.randrange(0, length)
+        data[n] = 0xFF
+        if n + 1 < length :
+            data[n+1] = rng.choice([0x00, 0x00, 0x00, 0xFF, 0xD0 + rng.randrange(0, 8), 0xD9, 0xC4])
+    return bytes(data)
+
+# The result of the function, or the type of exception it raised
+def resultOrException(function, *args) :
+    try :
+        return function(*args)
+    except Exception as e :
+        return type(e)
+
+def compareFunctions(rng) :
+    differences = 0
+    for case in range(0, randomCases) :
+        data = randomScanData(rng, rng.randrange(0, 200))
+        n = rng.randrange(0, len(data) + 2)
+        blockOffset = rng.randrange(0, 1 << 40)
+        pythonOffsets, acceleratedOffsets = array('Q'), array('Q')
+        JPEG.useAccelerator(False)
+        pythonResult = JPEG.scanEntropyCodedData(data, n, pythonOffsets, blockOffset)
+        JPEG.useAccelerator(True)
+        acceleratedResult = JPEG.scanEntropyCodedData(data, n, acceleratedOffsets, blockOffset)
+        if pythonResult != acceleratedResult or pythonOffsets != acceleratedOffsets :
+            differences += 1
+            print("*** scanEntropyCodedData differs:", data.hex(), n, pythonResult, acceleratedResult, file=sys.stderr)
+
+        # Including negative offsets (e.g. from a damaged signed offset tag), which both should reject
+        order = rng.choice(["MM", "II"])
+        IFDOffset = rng.randrange(-len(data) - 16, len(data) + 16) if case % 4 == 0 else rng.randrange(0, len(data) + 16)
+        elementCount = rng.randrange(0, 20)
+        pythonResult, acceleratedResult = bothWays(lambda : resultOrException(JPEG.unpackIFDEntries, data, IFDOffset, elementCount, order))
+        if pythonResult != acceleratedResult :
+            differences += 1
+            print("*** unpackIFDEntries differs:", data.hex(), IFDOffset, elementCount, order, file=sys.stderr)
+
+    print("Compared the functions on", randomCases, "random cases:", differences, "difference(s)")
+    return differences
+
+# As resultOrException, without the messages the parsers print about damaged files
+def quietly(function, *args) :
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull) :
+        return resultOrException(function, *args)
+
+def processBothWays(name, contents) :
+    def process() :
+        p = quietly(FileTypes.processImageBytes, name, contents)
+        verdict = None
+        if FileTypes.isJPEGSignature(contents) :
+            verdict = JPEGValidate.Verdict(name)
+            verdict.bytes = len(contents)
+            quietly(JPEGValidate.checkStructure, contents, verdict)
+            verdict = verdict.asDict()
+        return p, verdict
+    return bothWays(process)
+
+# The files under the folder, as (name, data) tuples
+def folderCorpus(folder) :
+    corpus = []
+    for dirpath, dirnamesList, filenamesList in os.walk(folder) :
+        for name in sorted(filenamesList) :
+            filename = os.path.join(dirpath, name)
+            with open(filename, "rb") as f :
+                corpus.append( (filename, f.read()) )
+    return corpus
+
+# The FuzzParsers seed files, followed by cases damaged in the same ways as when fuzzing
+def generatedCorpus(rng) :
+    seeds = FuzzParsers.seedCorpus(rng)
+    corpus = list(seeds)
+    for case in range(0, generatedCases) :
+        name, applied, data = FuzzParsers.fuzzCase(rng, seeds)
+        corpus.append( (name + " (" + ", ".join(applied) + ", case " + str(case) + ")", data) )
+    return corpus
+
+def compareCorpus(corpus, description) :
+    differences = 0
+    for name, data in corpus :
+        pythonResult, acceleratedResult = processBothWays(name, data)
+        if pythonResult != acceleratedResult :
+            differences += 1
+            print("*** Results differ for:", name, file=sys.stderr)
+            print("    Python     :", pythonResult, file=sys.stderr)
+            print("    Accelerated:", acceleratedResult, file=sys.stderr)
+
+        pythonScans, acceleratedScans = bothWays(lambda : quietly(readScans, data))
+        if pythonScans != acceleratedScans :
+            differences += 1
+            print("*** Scan data or restart marker offsets differ for:", name, file=sys.stderr)
+
+    print("Compared the results for", len(corpus), description, ":", differences, "difference(s)")
+    return differences
+
+# Read the data following each SOS marker in the file data as scan data, using several block sizes so that <FF> bytes
+# and markers fall across block boundaries, returning the results with the RST marker offsets found
+def readScans(data) :
+    results = []
+    SOSOffset = data.find(b'\xff\xda')
+    try :
+        while SOSOffset >= 0 :
+            headerLength = int.from_bytes(data[SOSOffset+2:SOSOffset+4], byteorder='big')
+            for blockSize in [1, 2, 3, 7, 64, 64 * 1024] :
+                JPEG.entropyCodedDataBlockSize = blockSize
+                f = io.BytesIO(data)
+                f.seek(SOSOffset + 2 + headerLength)
+                offsets = array('Q')
+                results.append( (JPEG.readEntropyCodedDataSegment(f, offsets), offsets, f.tell()) )
+            SOSOffset = data.find(b'\xff\xda', SOSOffset + 2)
+    finally :
+        JPEG.entropyCodedDataBlockSize = 64 * 1024
+    return results
+
+def timeCorpus(corpus) :
+    def processAll() :
+        start = time.perf_counter()
+        for name, data in corpus :
+            quietly(FileTypes.processImageBytes, name, data)
+        return time.perf_counter() - start
+
+    pythonTime, acceleratedTime = bothWays(processAll)
+    print("Time to process {0} file(s): Python {1:.3f}s, accelerated {2:.3f}s".format(len(corpus), pythonTime, acceleratedTime))
+
+#
+####################################
+#
+
+if __name__ == "__main__" :
+
+    if not JPEG.accelerated :
+        print("*** The accelerator module has not been built, run BuildAccelerator.py first", file=sys.stderr)
+        exit(1)
+
+    differences = compareFunctions(random.Random(1234))
+    if len(sys.argv) > 1 :
+        folder = sys.argv[1]
+        corpus = folderCorpus(folder)
+        differences += compareCorpus(corpus, "file(s) under " + folder)
+        timeCorpus(corpus)
+    else :
+        corpus = generatedCorpus(random.Random(1234))
+        differences += compareCorpus(corpus, "generated file(s), seed files and damaged versions of them")
+        timeCorpus(corpus)
+
+    exit(1 if differences else 0)
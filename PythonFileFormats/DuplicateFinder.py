@@ -0,0 +1,219 @@
+# Find photos which are probably the same photo - edited, resized or re-saved copies have different bytes, but keep
+# the Exif details of when, where and with what camera the photo was taken. Each photo is given a 'fingerprint' of:
+# - the original date/time it was taken (Exif DateTimeOriginal), or the IFD0 date/time if there isn't one
+# - fractions of a second (Exif SubSecTimeOriginal), if recorded, to separate photos taken in a burst
+# - camera make and model, ignoring case and extra spaces
+# - latitude and longitude, rounded to 4 decimal places (about 10 metres)
+# and photos with the same fingerprint are grouped together as a cluster of candidate duplicates. Image dimensions
+# aren't included, as resizing a photo is one of the things which produces a copy. Photos with no date/time at all
+# can't be fingerprinted and are ignored.
+#
+# Grouping uses a dictionary keyed on the fingerprint, so takes one pass over the photos. For archives too big for
+# the dictionary to fit in memory, the photos are first written out to partition files according to the start of
+# their date/time (year, month or day) - duplicates always have the same date/time so are always in the same
+# partition - and each partition is then grouped in turn.
+#
+# Photos can be read from a CSV file produced by CSV_from_JPEG_metadata.py, or by processing the image files under
+# a folder.
+#
+# Usage:
+#   python DuplicateFinder.py JPEGs.csv
+#   python DuplicateFinder.py ~/Pictures --partition-by month
+
+import sys
+import os
+import csv
+import shutil
+import tempfile
+
+defaultOutputFileName = "JPEG-duplicates.csv"
+
+# Number of characters of the 'YYYY-MM-DD hh:mm:ss' timestamp to use as the partition key
+partitionPrefixLengths = { 'year' : 4, 'month' : 7, 'day' : 10 }
+
+# Limit on the number of partition files kept open at once while partitioning
+maxOpenPartitions = 256
+
+# CSV_from_JPEG_metadata.py column heading => property name
+CSVColumnProperties = {
+    "Filename" : 'filename',
+    "Size (bytes)" : 'bytes',
+    "Make" : 'make',
+    "Model" : 'model',
+    "Timestamp" : 'timestamp',
+    "Latitude" : 'latitude',
+    "Longitude" : 'longitude',
+    "Original timestamp" : 'originalTimestamp',
+    "Subsecond" : 'subSecond',
+}
+
+##
+###########################################################################
+##
+
+def normalisedName(s) :
+    return " ".join(str(s).split()).casefold()
+
+def roundedCoordinate(value) :
+    if value is None or value == '' :
+        return ''
+    try :
+        return "{0:.4f}".format(float(value))
+    except ValueError :
+        return ''
+
+# The fingerprint of a photo from its properties, as a tuple of strings, or None if the photo has no date/time
+def fingerprint(p) :
+    timestamp = p.get('originalTimestamp') or p.get('timestamp')
+    if not timestamp :
+        return None
+
+    # Some software writes the date/time with colons throughout, as in the Exif data itself
+    timestamp = str(timestamp).strip()
+    if timestamp[4:5] == ':' and timestamp[7:8] == ':' :
+        timestamp = "{0:s}-{1:s}-{2:s}".format(timestamp[:4], timestamp[5:7], timestamp[8:])
+
+    return (timestamp,
+            str(p.get('subSecond') or '').strip(),
+            normalisedName(p.get('make') or ''),
+            normalisedName(p.get('model') or ''),
+            roundedCoordinate(p.get('latitude')),
+            roundedCoordinate(p.get('longitude')))
+
+fingerprintHeader = ["Timestamp", "Subsecond", "Make", "Model", "Latitude", "Longitude"]
+
+# Group (fingerprint, filename, size) records by fingerprint, returning a list of (fingerprint, [(filename, size), ...])
+# clusters with more than one photo, in fingerprint order
+def groupRecords(records) :
+    index = {}
+    for key, filename, size in records :
+        index.setdefault(key, []).append( (filename, size) )
+
+    return sorted( (key, sorted(members)) for key, members in index.items() if len(members) > 1 )
+
+##
+###########################################################################
+##
+
+# Photo properties from a CSV file produced by CSV_from_JPEG_metadata.py
+def propertiesFromCSVFile(CSVFileName) :
+    with open(CSVFileName, newline="") as csvfile :
+        reader = csv.reader(csvfile)
+        header = next(reader, [])
+        columns = [(i, CSVColumnProperties[heading]) for i, heading in enumerate(header) if heading in CSVColumnProperties]
+        for row in reader :
+            yield { name : row[i] for i, name in columns if i < len(row) }
+
+# Photo properties of the image files under a folder
+def propertiesFromFolder(folder) :
+    import CSV_from_JPEG_metadata
+
+    filesList = CSV_from_JPEG_metadata.processDirectory(folder)
+    imageFilesList, rejected = CSV_from_JPEG_metadata.sniffFiles(filesList)
+    print("Found", len(imageFilesList), "image file(s) to process under", folder)
+    for dirName, fileName, fileType in imageFilesList :
+        yield CSV_from_JPEG_metadata.imageFileProperties(dirName, fileName, fileType=fileType)
+
+# (fingerprint, filename, size) records for the photos which can be fingerprinted, counting those which can't
+def fingerprintRecords(propertiesList, counts) :
+    for p in propertiesList :
+        counts['photos'] += 1
+        key = fingerprint(p)
+        if key is None :
+            counts['noTimestamp'] += 1
+            continue
+        yield key, p.get('filename', ''), p.get('bytes', '')
+
+# Group all the records in one go, in memory
+def findClusters(records) :
+    yield from groupRecords(records)
+
+# Write the records to a partition file per timestamp prefix in tempDir, then group each partition in turn, so only
+# one partition's records are held in memory at a time. Partitions are grouped in timestamp order, so clusters are
+# still produced in fingerprint order.
+def findClustersPartitioned(records, prefixLength, tempDir) :
+    partitionFileNames = {}
+    openPartitions = {}
+
+    def partitionWriter(prefix) :
+        writer = openPartitions.get(prefix)
+        if writer is None :
+            if len(openPartitions) >= maxOpenPartitions :
+                # Close the partition opened longest ago, it will be re-opened for appending if needed again
+                oldestPrefix = next(iter(openPartitions))
+                openPartitions.pop(oldestPrefix)[0].close()
+            if prefix not in partitionFileNames :
+                partitionFileNames[prefix] = os.path.join(tempDir, "partition-{0:d}.csv".format(len(partitionFileNames)))
+            f = open(partitionFileNames[prefix], "a", newline="")
+            writer = (f, csv.writer(f))
+            openPartitions[prefix] = writer
+        return writer[1]
+
+    try :
+        for key, filename, size in records :
+            partitionWriter(key[0][:prefixLength]).writerow(list(key) + [filename, size])
+    finally :
+        for f, writer in openPartitions.values() :
+            f.close()
+
+    for prefix in sorted(partitionFileNames) :
+        with open(partitionFileNames[prefix], newline="") as f :
+            partitionRecords = ( (tuple(row[:-2]), row[-2], row[-1]) for row in csv.reader(f) )
+            clusters = groupRecords(partitionRecords)
+        os.remove(partitionFileNames[prefix])
+        yield from clusters
+
+def writeClusters(clusters, outputFileName) :
+    clusterCount = 0
+    duplicateCount = 0
+    with open(outputFileName, "w", newline="") as csvfile :
+        myCSVWriter = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        myCSVWriter.writerow(["Cluster"] + fingerprintHeader + ["Filename", "Size (bytes)"])
+        for key, members in clusters :
+            clusterCount += 1
+            duplicateCount += len(members) - 1
+            for filename, size in members :
+                myCSVWriter.writerow([clusterCount] + list(key) + [filename, size])
+    return clusterCount, duplicateCount
+
+def main(location, outputFileName=defaultOutputFileName, partitionBy=None) :
+    if os.path.isdir(location) :
+        propertiesList = propertiesFromFolder(location)
+    elif os.path.isfile(location) :
+        propertiesList = propertiesFromCSVFile(location)
+    else :
+        print("*** ", location, " is not a file or directory name", file=sys.stderr)
+        return
+
+    counts = { 'photos' : 0, 'noTimestamp' : 0 }
+    records = fingerprintRecords(propertiesList, counts)
+
+    if partitionBy is None :
+        clusterCount, duplicateCount = writeClusters(findClusters(records), outputFileName)
+    else :
+        tempDir = tempfile.mkdtemp(prefix="duplicates-", dir=os.path.dirname(os.path.abspath(outputFileName)))
+        try :
+            clusterCount, duplicateCount = writeClusters(findClustersPartitioned(records, partitionPrefixLengths[partitionBy], tempDir), outputFileName)
+        finally :
+            shutil.rmtree(tempDir, ignore_errors=True)
+
+    print("Photos:", counts['photos'], "- without a date/time:", counts['noTimestamp'])
+    print("Found", clusterCount, "cluster(s) of candidate duplicates, with", duplicateCount, "duplicate photo(s)")
+    print("Produced CSV file:", outputFileName)
+
+#
+####################################
+#
+
+if __name__ == "__main__" :
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Find photos which are probably copies of the same photo, using their Exif date/time, camera and location")
+    parser.add_argument("location", help="CSV file produced by CSV_from_JPEG_metadata.py, or folder to search for image files")
+    parser.add_argument("--output", default=defaultOutputFileName, help="CSV file for the clusters of candidate duplicates (default: %(default)s)")
+    parser.add_argument("--partition-by", choices=list(partitionPrefixLengths), default=None,
+                        help="for very large archives, partition the photos by year, month or day of their date/time, grouping one partition at a time")
+    args = parser.parse_args()
+
+    main(args.location, args.output, args.partition_by)
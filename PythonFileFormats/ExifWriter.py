@@ -0,0 +1,502 @@
+# Write a copy of a JPEG file with its Exif metadata changed, e.g. with the GPS location removed before publishing a
+# photo. Only the APP1 Exif segment is rebuilt - the IFDs are re-laid out with the chosen entries removed or
+# changed, and all the offsets recalculated. The other segments, and the compressed image data starting at the first
+# SOS segment, are copied unchanged, so the image is never re-encoded. The bulk of the file (the scan data) is copied
+# using os.copy_file_range or os.sendfile where available, so it doesn't pass through Python at all.
+#
+# Usage:
+#   python ExifWriter.py in.jpg out.jpg                  - remove the GPS IFD
+#   python ExifWriter.py --batch in-folder out-folder    - the same for all the JPEG files under a folder, using a
+#                                                          pool of worker processes
+# with further options to remove other tags, or set ASCII tags such as Copyright.
+
+import sys
+import os
+import struct
+import argparse
+import tempfile
+import concurrent.futures
+
+import JPEG
+import FileTypes
+
+# Bytes per component for each IFD entry data format
+formatSizes = {1:1, 2:1, 3:2, 4:4, 5:8, 6:1, 7:1, 8:2, 9:4, 10:8, 11:4, 12:8}
+
+# Tags holding the offsets of blocks of data outside the IFDs, mapped to the tags holding the lengths of the blocks:
+# StripOffsets, TileOffsets, FreeOffsets, and the thumbnail image in IFD1. The blocks are moved along with the IFDs.
+# (The tags holding the offsets of embedded IFDs are in JPEG.knownEmbeddedIFDs.)
+dataOffsetTags = {273 : 279, 324 : 325, 288 : 289, 513 : 514}
+
+# Tags holding offsets which aren't relocated, so TIFF content containing them isn't rewritten, rather than leaving
+# them pointing to the wrong place. (As are entries with data formats not in formatSizes, including IFD offsets.)
+unsupportedOffsetTags = {330 : "SubIFDs", 519 : "JPEGQTables", 520 : "JPEGDCTables", 521 : "JPEGACTables"}
+
+# The largest APP segment, as the segment length must fit in two bytes
+maxSegmentLength = 0xFFFF
+
+copyBlockSize = 1024 * 1024
+
+##
+###########################################################################
+##
+
+# Read the entries of an IFD as (tag, format, count, value bytes) tuples, with the value bytes taken from wherever
+# they are held (in the entry itself if 4 bytes or less, otherwise at the offset given in the entry). Also returns the
+# offset of the next IFD in the chain.
+def readRawIFD(TIFF, IFDOffset, order) :
+    endian = ">" if order == "MM" else "<"
+    elementCount, = struct.unpack_from(endian + "H", TIFF, IFDOffset)
+    entries = []
+    for n in range(0, elementCount) :
+        tag, dataFormat, count, valueOffset = struct.unpack_from(endian + "HHII", TIFF, IFDOffset+2+12*n)
+        if tag in unsupportedOffsetTags :
+            raise ValueError("IFD holds " + unsupportedOffsetTags[tag] + " offsets (tag " + str(tag) + "), which can't be relocated")
+        if dataFormat not in formatSizes :
+            raise ValueError("IFD entry for tag " + str(tag) + " has unknown data format " + str(dataFormat))
+        size = formatSizes[dataFormat] * count
+        if size <= 4 :
+            valueBytes = bytes(TIFF[IFDOffset+2+12*n+8:IFDOffset+2+12*n+8+size])
+        else :
+            valueBytes = bytes(TIFF[valueOffset:valueOffset+size])
+            if len(valueBytes) != size :
+                raise ValueError("IFD entry value for tag " + str(tag) + " extends beyond the end of the data")
+        entries.append( (tag, dataFormat, count, valueBytes) )
+    nextIFDOffset, = struct.unpack_from(endian + "I", TIFF, IFDOffset+2+12*elementCount)
+    return entries, nextIFDOffset
+
+# The values of an entry holding SHORT or LONG integers
+def integerValues(dataFormat, count, valueBytes, endian) :
+    if dataFormat == 3 :
+        return struct.unpack(endian + str(count) + "H", valueBytes)
+    elif dataFormat == 4 :
+        return struct.unpack(endian + str(count) + "I", valueBytes)
+    raise ValueError("offset or length entry is not SHORT or LONG values")
+
+# Read the blocks of data referred to by the data offset tags in each IFD, into a dictionary keyed on (IFD name, tag)
+# holding a list of the blocks. Offset tags without the corresponding length tag are left out, as their data can't be
+# located.
+def readDataBlocks(TIFF, IFDs, endian) :
+    dataBlocks = {}
+    for name, entries in IFDs.items() :
+        values = {tag : (dataFormat, count, valueBytes) for tag, dataFormat, count, valueBytes in entries}
+        for offsetTag, lengthTag in dataOffsetTags.items() :
+            if offsetTag not in values or lengthTag not in values :
+                continue
+            offsets = integerValues(*values[offsetTag], endian)
+            lengths = integerValues(*values[lengthTag], endian)
+            if len(offsets) != len(lengths) :
+                raise ValueError("numbers of data offsets and lengths don't match for tag " + str(offsetTag))
+            blocks = [bytes(TIFF[offset:offset+length]) for offset, length in zip(offsets, lengths)]
+            if [len(block) for block in blocks] != list(lengths) :
+                raise ValueError("data for tag " + str(offsetTag) + " extends beyond the end of the data")
+            dataBlocks[(name, offsetTag)] = blocks
+    return dataBlocks
+
+# Read all the IFDs in TIFF content into a dictionary keyed on IFD name (as for JPEG.processTIFF), each holding a list
+# of raw entries. Also returns the byte order, and the blocks of data (e.g. the thumbnail image) referred to from the
+# IFDs, see readDataBlocks.
+def readRawTIFF(TIFF) :
+    order = bytes(TIFF[0:2]).decode("ascii", "replace")
+    if order not in ["MM", "II"] :
+        raise ValueError("TIFF header format not as expected")
+    endian = ">" if order == "MM" else "<"
+    version, firstIFDOffset = struct.unpack_from(endian + "HI", TIFF, 2)
+    if version != 42 :
+        raise ValueError("TIFF header format not as expected")
+
+    IFDs = {}
+    nextIFDOffset = firstIFDOffset
+    IFDCount = 0
+    seenOffsets = set()
+    while nextIFDOffset != 0 and nextIFDOffset not in seenOffsets :
+        seenOffsets.add(nextIFDOffset)
+        IFDs["IFD" + str(IFDCount)], nextIFDOffset = readRawIFD(TIFF, nextIFDOffset, order)
+        IFDCount += 1
+
+    # Embedded IFDs, which can themselves contain embedded IFDs (Interoperability within Exif)
+    toSearch = list(IFDs.keys())
+    while toSearch :
+        IFDName = toSearch.pop(0)
+        for tag, dataFormat, count, valueBytes in IFDs[IFDName] :
+            if tag in JPEG.knownEmbeddedIFDs() and JPEG.knownEmbeddedIFDs()[tag] not in IFDs :
+                embeddedName = JPEG.knownEmbeddedIFDs()[tag]
+                embeddedOffset, = struct.unpack(endian + "I", valueBytes[0:4])
+                IFDs[embeddedName], n = readRawIFD(TIFF, embeddedOffset, order)
+                toSearch.append(embeddedName)
+
+    return order, IFDs, readDataBlocks(TIFF, IFDs, endian)
+
+# Lay out the IFDs as new TIFF content. Each IFD is followed by the values which don't fit in its entries, and the
+# blocks of data referred to from the IFDs follow the IFDs, with the offsets of embedded IFDs and of the data blocks
+# filled in once everything has been placed (data offsets are always written as LONG values). Entries pointing to IFDs
+# or data which are no longer present are dropped.
+#
+# NB MakerNote data is copied unchanged; maker notes which refer to offsets from the start of the TIFF data may not
+# be readable by all software after the rewrite.
+def writeRawTIFF(order, IFDs, dataBlocks) :
+    endian = ">" if order == "MM" else "<"
+
+    mainChain = sorted([name for name in IFDs if name.startswith("IFD")], key=lambda name : int(name[3:]))
+    layoutOrder = [mainChain[0]] if mainChain else []
+    layoutOrder += [name for name in ["Exif", "Interoperability", "GPS"] if name in IFDs]
+    layoutOrder += mainChain[1:]
+
+    # Drop pointers to missing IFDs and entries in the wrong place, and sort each IFD by tag as the TIFF spec requires
+    pointerTags = set(JPEG.knownEmbeddedIFDs())
+    IFDEntries = {}
+    for name in layoutOrder :
+        entries = []
+        for entry in IFDs[name] :
+            tag = entry[0]
+            if tag in pointerTags and JPEG.knownEmbeddedIFDs()[tag] not in IFDs :
+                continue
+            if tag in dataOffsetTags :
+                if (name, tag) not in dataBlocks :
+                    continue
+                # The offsets are filled in below, once the data has been placed
+                blockCount = len(dataBlocks[(name, tag)])
+                entry = (tag, 4, blockCount, bytes(4 * blockCount))
+            entries.append(entry)
+        IFDEntries[name] = sorted(entries, key=lambda entry : entry[0])
+
+    # First pass - work out where each IFD goes
+    def paddedLength(n) :
+        return n + (n & 1)
+    offsets = {}
+    offset = 8
+    for name in layoutOrder :
+        offsets[name] = offset
+        entries = IFDEntries[name]
+        offset += 2 + 12*len(entries) + 4
+        offset += sum(paddedLength(len(valueBytes)) for tag, dataFormat, count, valueBytes in entries if len(valueBytes) > 4)
+    blockOffsets = {}
+    blockParts = []
+    for name in layoutOrder :
+        for tag, dataFormat, count, valueBytes in IFDEntries[name] :
+            if tag in dataOffsetTags :
+                blockOffsets[(name, tag)] = []
+                for block in dataBlocks[(name, tag)] :
+                    blockOffsets[(name, tag)].append(offset)
+                    blockParts.append(block.ljust(paddedLength(len(block)), b'\x00'))
+                    offset += paddedLength(len(block))
+
+    # Second pass - produce the bytes
+    parts = [order.encode() + struct.pack(endian + "HI", 42, offsets[layoutOrder[0]] if layoutOrder else 0)]
+    for name in layoutOrder :
+        entries = IFDEntries[name]
+        valuesOffset = offsets[name] + 2 + 12*len(entries) + 4
+        IFDParts = [struct.pack(endian + "H", len(entries))]
+        valueParts = []
+        for tag, dataFormat, count, valueBytes in entries :
+            if tag in pointerTags :
+                valueBytes = struct.pack(endian + "I", offsets[JPEG.knownEmbeddedIFDs()[tag]])
+            elif tag in dataOffsetTags :
+                valueBytes = struct.pack(endian + str(count) + "I", *blockOffsets[(name, tag)])
+            if len(valueBytes) <= 4 :
+                IFDParts.append(struct.pack(endian + "HHI", tag, dataFormat, count) + valueBytes.ljust(4, b'\x00'))
+            else :
+                IFDParts.append(struct.pack(endian + "HHII", tag, dataFormat, count, valuesOffset))
+                valueParts.append(valueBytes.ljust(paddedLength(len(valueBytes)), b'\x00'))
+                valuesOffset += paddedLength(len(valueBytes))
+        # Link the main chain IFDs
+        nextIFDOffset = 0
+        if name in mainChain and mainChain.index(name) + 1 < len(mainChain) :
+            nextIFDOffset = offsets[mainChain[mainChain.index(name) + 1]]
+        IFDParts.append(struct.pack(endian + "I", nextIFDOffset))
+        parts.extend(IFDParts)
+        parts.extend(valueParts)
+    parts.extend(blockParts)
+
+    return b''.join(parts)
+
+##
+###########################################################################
+##
+
+# The changes to make to the Exif metadata:
+# - removeIFDs : names of IFDs to remove completely, e.g. {"GPS"}
+# - removeTags : (IFD name, tag) pairs to remove
+# - setTags : dictionary of (IFD name, tag) => (format, count, value bytes) to add or replace, see ASCIIValue
+class ExifEdits :
+
+    def __init__(self, removeIFDs=(), removeTags=(), setTags=None) :
+        self.removeIFDs = set(removeIFDs)
+        self.removeTags = set(removeTags)
+        self.setTags = dict(setTags) if setTags else {}
+
+    def apply(self, IFDs) :
+        for name in self.removeIFDs :
+            IFDs.pop(name, None)
+        for name in IFDs :
+            IFDs[name] = [entry for entry in IFDs[name] if (name, entry[0]) not in self.removeTags and (name, entry[0]) not in self.setTags]
+        for (name, tag), (dataFormat, count, valueBytes) in self.setTags.items() :
+            if name not in IFDs :
+                IFDs[name] = []
+            IFDs[name].append( (tag, dataFormat, count, valueBytes) )
+
+def ASCIIValue(s) :
+    b = s.encode() + b'\x00'
+    return (2, len(b), b)
+
+def stripGPSEdits() :
+    return ExifEdits(removeIFDs=["GPS"])
+
+# Rebuild the data of an APP1 Exif segment (as returned by JPEG.readDataSegment) with the edits applied
+def rewriteExifSegment(segment, edits) :
+    order, IFDs, dataBlocks = readRawTIFF(memoryview(segment)[6:])
+    edits.apply(IFDs)
+    return bytes(segment[0:6]) + writeRawTIFF(order, IFDs, dataBlocks)
+
+# XMP metadata can hold a copy of the GPS location too. XMP too large for one APP1 segment is continued in 'extended
+# XMP' segments, each holding the identifier, the GUID of the extended XMP (referred to from the main XMP), the total
+# length and the offset of this part, followed by the part itself. The extended XMP is split at arbitrary points, so
+# the parts have to be joined up before looking for GPS properties.
+XMPIdentifier = "http://ns.adobe.com/xap/1.0/"
+extendedXMPIdentifier = "http://ns.adobe.com/xmp/extension/"
+extendedXMPHeaderLength = len(extendedXMPIdentifier) + 1 + 32 + 4 + 4
+
+def isXMP(marker, segment) :
+    return marker == 0xE1 and JPEG.getAppSegmentIdentifier(segment) in [XMPIdentifier, extendedXMPIdentifier]
+
+# Whether the XMP held in the list of XMP segments, main and extended, mentions GPS anywhere
+def isXMPWithGPS(segments) :
+    parts = []
+    for segment in segments :
+        if JPEG.getAppSegmentIdentifier(segment) == XMPIdentifier :
+            if b'GPS' in segment :
+                return True
+        elif len(segment) >= extendedXMPHeaderLength :
+            GUID = bytes(segment[len(extendedXMPIdentifier)+1:len(extendedXMPIdentifier)+1+32])
+            partOffset, = struct.unpack_from(">I", segment, extendedXMPHeaderLength - 4)
+            parts.append( (GUID, partOffset, bytes(segment[extendedXMPHeaderLength:])) )
+    return b'GPS' in b''.join(part for GUID, partOffset, part in sorted(parts))
+
+##
+###########################################################################
+##
+
+# Copy count bytes from offset in the input file to the current position of the output file, using the fastest
+# method available. The output file must have been flushed.
+def copyFileRange(fin, fout, offset, count) :
+    infd = fin.fileno()
+    outfd = fout.fileno()
+    if hasattr(os, "copy_file_range") :
+        try :
+            while count > 0 :
+                n = os.copy_file_range(infd, outfd, count, offset)
+                if n == 0 :
+                    break
+                offset += n
+                count -= n
+            return
+        except OSError :
+            # Not supported for this pair of files (e.g. different file system types on older kernels)
+            pass
+    if hasattr(os, "sendfile") and sys.platform.startswith("linux") :
+        try :
+            while count > 0 :
+                n = os.sendfile(outfd, infd, offset, count)
+                if n == 0 :
+                    break
+                offset += n
+                count -= n
+            return
+        except OSError :
+            pass
+    fin.seek(offset)
+    while count > 0 :
+        block = fin.read(min(count, copyBlockSize))
+        if not block :
+            break
+        fout.write(block)
+        count -= len(block)
+
+# Write a copy of the JPEG file with the Exif edits applied. With the default edits, the GPS IFD is removed, together
+# with the XMP metadata if it mentions GPS. Returns a description of what was changed.
+def rewriteJPEG(inFileName, outFileName, edits=None, removeXMPWithGPS=None) :
+    if edits is None :
+        edits = stripGPSEdits()
+    if removeXMPWithGPS is None :
+        removeXMPWithGPS = "GPS" in edits.removeIFDs
+
+    # Write to a temporary file and rename, so that a partly written output file is never left behind. The temporary
+    # file has a unique name, and is removed if the rewrite fails.
+    fd, tempName = tempfile.mkstemp(prefix=os.path.basename(outFileName) + ".", suffix=".tmp", dir=os.path.dirname(outFileName) or ".")
+    try :
+        with open(inFileName, "rb") as fin, os.fdopen(fd, "wb") as fout :
+            changes = copyWithEdits(fin, fout, edits, removeXMPWithGPS)
+        # mkstemp creates the file readable by the user only; give the output the usual permissions for a new file
+        os.chmod(tempName, 0o666 & ~currentUmask())
+        os.replace(tempName, outFileName)
+    except BaseException :
+        try :
+            os.remove(tempName)
+        except OSError :
+            pass
+        raise
+    return changes
+
+def currentUmask() :
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+def copyWithEdits(fin, fout, edits, removeXMPWithGPS) :
+    changes = []
+    if fin.read(2) != b'\xff\xd8' :
+        raise ValueError("not a JPEG file (no SOI marker)")
+    fout.write(b'\xff\xd8')
+
+    # Read the segments up to the first SOS segment, rebuilding the Exif segment. Everything from the SOS marker
+    # onwards is copied as it is.
+    fileSize = os.fstat(fin.fileno()).st_size
+    copyFrom = fileSize
+    segments = []
+    while True :
+        markerOffset = fin.tell()
+        b = fin.read(2)
+        if len(b) < 2 :
+            break
+        if b[0] != 0xFF :
+            raise ValueError("segment marker not found at offset " + str(markerOffset))
+        marker = b[1]
+        if marker == 0xFF :
+            # Fill byte
+            fin.seek(-1, os.SEEK_CUR)
+            continue
+        if marker == 0xDA or marker in JPEG.standaloneMarkers :
+            copyFrom = markerOffset
+            break
+        segmentLength, segment = JPEG.readDataSegment(fin)
+        if not JPEG.isCompleteSegment(segmentLength, segment) :
+            raise ValueError(JPEG.describeIncompleteSegment(segmentLength) + " at offset " + str(markerOffset))
+
+        if marker == 0xE1 and segment[0:6] == b'Exif\x00\x00' :
+            segment = rewriteExifSegment(segment, edits)
+            if len(segment) + 2 > maxSegmentLength :
+                raise ValueError("rewritten Exif segment is too large")
+            changes.append("Exif rewritten")
+        segments.append( (marker, segment) )
+
+    # The XMP is removed as a whole, main and extended segments together, if any of it mentions GPS, as the main XMP
+    # refers to the extended XMP
+    if removeXMPWithGPS and isXMPWithGPS([segment for marker, segment in segments if isXMP(marker, segment)]) :
+        segments = [(marker, segment) for marker, segment in segments if not isXMP(marker, segment)]
+        changes.append("XMP removed")
+
+    for marker, segment in segments :
+        fout.write(bytes([0xFF, marker]) + struct.pack(">H", len(segment) + 2) + segment)
+    fout.flush()
+    copyFileRange(fin, fout, copyFrom, fileSize - copyFrom)
+
+    return changes
+
+##
+###########################################################################
+##
+
+def rewriteFileForBatch(inAndOutFileNames) :
+    inFileName, outFileName, edits = inAndOutFileNames
+    try :
+        os.makedirs(os.path.dirname(outFileName) or ".", exist_ok=True)
+        return inFileName, rewriteJPEG(inFileName, outFileName, edits), None
+    except (OSError, ValueError, struct.error) as e :
+        return inFileName, None, str(e)
+
+# Rewrite all the JPEG files under inDir into the same folder structure under outDir, using a pool of processes.
+# Other files are not copied, but are listed.
+def rewriteFolder(inDir, outDir, edits=None, workers=None) :
+    if edits is None :
+        edits = stripGPSEdits()
+
+    work = []
+    skipped = []
+    for dirpath, dirnamesList, filenamesList in os.walk(inDir) :
+        for name in sorted(filenamesList) :
+            inFileName = os.path.join(dirpath, name)
+            outFileName = os.path.join(outDir, os.path.relpath(inFileName, inDir))
+            try :
+                fileType = FileTypes.fileTypeOfFile(inFileName)
+            except OSError :
+                fileType = None
+            if fileType == "JPEG" :
+                work.append( (inFileName, outFileName, edits) )
+            else :
+                skipped.append(inFileName)
+
+    print("Rewriting", len(work), "JPEG file(s) from", inDir, "to", outDir)
+    failures = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor :
+        chunksize = max(1, len(work) // ((workers or os.cpu_count() or 1) * 4))
+        n = 0
+        for inFileName, changes, error in executor.map(rewriteFileForBatch, work, chunksize=chunksize) :
+            n += 1
+            if error is not None :
+                failures += 1
+                print("*** Unable to rewrite", inFileName, ":", error, file=sys.stderr)
+            if n % 100 == 0 :
+                print(" .. ", n, "/", len(work))
+
+    print("Rewrote", len(work) - failures, "file(s),", failures, "failure(s)")
+    if skipped :
+        print("Not copied, as not JPEG files:", len(skipped), "file(s)")
+        for inFileName in skipped[0:10] :
+            print("   ", inFileName)
+        if len(skipped) > 10 :
+            print("    ...")
+
+#
+####################################
+#
+
+# Edits from the command line: IFD:tag to remove, IFD:tag=text to set an ASCII value
+def editsFromArguments(args) :
+    removeIFDs = [] if args.keep_gps else ["GPS"]
+    removeTags = []
+    for spec in args.remove :
+        name, tag = spec.split(":")
+        removeTags.append( (name, int(tag)) )
+    setTags = {}
+    for spec in args.set :
+        nameAndTag, value = spec.split("=", 1)
+        name, tag = nameAndTag.split(":")
+        setTags[(name, int(tag))] = ASCIIValue(value)
+    return ExifEdits(removeIFDs, removeTags, setTags)
+
+if __name__ == "__main__" :
+
+    parser = argparse.ArgumentParser(description="Write copies of JPEG files with the GPS location (and/or other Exif tags) removed")
+    parser.add_argument("input", help="JPEG file, or with --batch a folder")
+    parser.add_argument("output", help="output JPEG file, or with --batch a folder")
+    parser.add_argument("--batch", action="store_true", help="rewrite all the JPEG files under the input folder")
+    parser.add_argument("--workers", type=int, default=None, help="with --batch, number of worker processes (default: number of CPUs)")
+    parser.add_argument("--keep-gps", action="store_true", help="don't remove the GPS IFD")
+    parser.add_argument("--remove", action="append", default=[], metavar="IFD:TAG", help="also remove a tag, e.g. IFD0:315 (Artist)")
+    parser.add_argument("--set", action="append", default=[], metavar="IFD:TAG=TEXT", help="set an ASCII tag, e.g. IFD0:33432=(c) Me")
+    args = parser.parse_args()
+
+    try :
+        edits = editsFromArguments(args)
+    except ValueError :
+        print("*** Tags must be given as IFD:tag number, e.g. IFD0:315", file=sys.stderr)
+        exit()
+
+    if os.path.abspath(args.input) == os.path.abspath(args.output) :
+        print("*** The output must be different from the input", file=sys.stderr)
+        exit()
+
+    if args.batch :
+        if not os.path.isdir(args.input) :
+            print("***", args.input, "is not a directory name", file=sys.stderr)
+            exit()
+        rewriteFolder(args.input, args.output, edits, args.workers)
+    else :
+        if not os.path.isfile(args.input) :
+            print("***", args.input, "is not a file", file=sys.stderr)
+            exit()
+        try :
+            changes = rewriteJPEG(args.input, args.output, edits)
+            print("Produced", args.output, ":", ", ".join(changes) if changes else "no metadata changed")
+        except (OSError, ValueError, struct.error) as e :
+            print("*** Unable to rewrite", args.input, ":", e, file=sys.stderr)
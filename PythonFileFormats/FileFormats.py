@@ -0,0 +1,56 @@
+# Single command line entry point for the tools in this folder, e.g.
+#   python FileFormats.py info photo.heic
+#   python FileFormats.py csv ~/Pictures --summary summary.json
+#   python FileFormats.py strip-gps --batch photos public-photos
+# Each subcommand runs the command line handling of the module which implements it, with the remaining arguments.
+# Only that module is imported, so startup is no slower than running the module directly.
+
+import sys
+import runpy
+
+# Subcommand => (module, description)
+commands = {
+    "info" : ("FileTypes", "display the main properties of an image file of any supported type"),
+    "jpeg" : ("JPEG", "display the main properties of a JPEG file"),
+    "tiff" : ("TIFF", "display the main properties of a TIFF/DNG file"),
+    "heif" : ("HEIF", "display the main properties of a HEIF file"),
+    "archive" : ("ArchiveScanner", "display the main properties of the image files in a zip or tar archive"),
+    "csv" : ("CSV_from_JPEG_metadata", "extract metadata from the image files under a folder into a CSV file"),
+    "index" : ("JPEGSegmentIndex", "produce or display the segment index file for a JPEG file"),
+    "validate" : ("JPEGValidate", "check the structure of JPEG files, reporting truncated or corrupt files"),
+    "fuzz" : ("FuzzParsers", "fuzz the JPEG and TIFF parsing code, and check its throughput hasn't regressed"),
+    "summary" : ("MetadataSummary", "merge summary files produced by the csv command"),
+    "duplicates" : ("DuplicateFinder", "find photos which are probably copies of the same photo"),
+    "diff" : ("MetadataDiff", "compare the CSV files (or stores) produced by two runs"),
+    "server" : ("MetadataServer", "run the metadata extraction server, or send files to it"),
+    "strip-gps" : ("ExifWriter", "write copies of JPEG files with the GPS location removed"),
+    "dump" : ("DumpRawBytes", "dump the bytes of a file, 20 bytes per row"),
+    "dump-list" : ("DumpRawBytesList", "dump the bytes of a file, one byte per line"),
+}
+
+def usage() :
+    print("Usage: python FileFormats.py <command> [arguments]")
+    print()
+    print("Commands:")
+    for command, (moduleName, description) in commands.items() :
+        print("  {0:12s} {1:s}".format(command, description))
+    print()
+    print("Use 'python FileFormats.py <command> --help' for the arguments of commands with options")
+
+def main(argv) :
+    if len(argv) < 2 or argv[1] in ["-h", "--help"] :
+        usage()
+        return
+
+    command = argv[1]
+    if command not in commands :
+        print("*** Unknown command:", command, file=sys.stderr)
+        usage()
+        return
+
+    moduleName, description = commands[command]
+    sys.argv = [moduleName + ".py"] + argv[2:]
+    runpy.run_module(moduleName, run_name="__main__", alter_sys=True)
+
+if __name__ == "__main__" :
+    main(sys.argv)
@@ -0,0 +1,126 @@
+# Identify the format of an image file from the 'magic' bytes at the start of the file, rather than from its name,
+# and pass it to the matching module for metadata extraction.
+
+import sys
+import os
+import io
+
+import JPEG
+import TIFF
+import HEIF
+import Interning
+
+# Enough bytes to recognise any of the formats below
+signatureLength = 16
+
+# JPEG files start with the SOI marker <FF><D8>, followed by the <FF> of the next segment's marker
+def isJPEGSignature(headerBytes) :
+    return headerBytes[0:3] == b'\xff\xd8\xff'
+
+def fileTypeFromSignature(headerBytes) :
+    if isJPEGSignature(headerBytes) :
+        return "JPEG"
+    elif TIFF.isTIFFSignature(headerBytes) :
+        return "TIFF"
+    elif HEIF.isHEIFSignature(headerBytes) :
+        return "HEIF"
+    else :
+        return None
+
+# Other common file signatures, used to report what a file we can't handle appears to be instead
+otherSignatures = [
+    (b'\x89PNG\r\n\x1a\n', "PNG"),
+    (b'GIF87a', "GIF"),
+    (b'GIF89a', "GIF"),
+    (b'BM', "BMP"),
+    (b'%PDF', "PDF"),
+    (b'PK\x03\x04', "ZIP"),
+]
+
+def describeSignature(headerBytes) :
+    fileType = fileTypeFromSignature(headerBytes)
+    if fileType :
+        return fileType
+    if len(headerBytes) == 0 :
+        return "Empty"
+    for signature, description in otherSignatures :
+        if headerBytes[0:len(signature)] == signature :
+            return description
+    # Web server error pages and the like saved with an image name
+    if bytes(headerBytes).lstrip()[0:1] == b'<' :
+        return "HTML/XML"
+    if headerBytes[0:2] == b'\xff\xd8' :
+        return "JPEG (damaged)"
+    return "Unknown"
+
+def fileTypeOfFile(filename) :
+    with open(filename, "rb") as f :
+        return fileTypeFromSignature(f.read(signatureLength))
+
+# String properties with few distinct values across a batch of files. Each value is interned in a categorical
+# dictionary shared by all the files processed, so that the properties of a large batch held in memory share one copy
+# of each value, and values can be grouped on their integer codes, e.g. propertyCategories.code(p['make'])
+categoricalProperties = ['make', 'model', 'software', 'encoding']
+propertyCategories = Interning.Categories()
+
+# Only string values are interned: a damaged tag can decode to something else (e.g. a list), which is left as it is.
+def internProperties(propertiesDict) :
+    for name in categoricalProperties :
+        if name in propertiesDict and isinstance(propertiesDict[name], str) :
+            propertiesDict[name] = propertyCategories.intern(propertiesDict[name])
+    return propertiesDict
+
+# Extract the main properties of an image file, using the module for its file type. If the file type isn't
+# already known, it is worked out from the start of the file. Returns None for a file type we can't handle.
+# If fileObject is passed in, the data is read from it rather than from the named file. If headerOnly is set, JPEG
+# data is only read as far as the start of the scan data (see JPEG.processFile).
+def processImageFile(filename, fileType=None, verbose=False, veryVerbose=False, writeIndex=False, fileObject=None, headerOnly=False) :
+    if fileType is None :
+        if fileObject is None :
+            fileType = fileTypeOfFile(filename)
+        else :
+            fileType = fileTypeFromSignature(fileObject.read(signatureLength))
+            fileObject.seek(0)
+
+    if fileType == "JPEG" :
+        return internProperties(JPEG.processFile(filename, verbose, veryVerbose, writeIndex=writeIndex, fileObject=fileObject, headerOnly=headerOnly))
+    elif fileType == "TIFF" :
+        return internProperties(TIFF.processFile(filename, verbose, veryVerbose, fileObject=fileObject))
+    elif fileType == "HEIF" :
+        return internProperties(HEIF.processFile(filename, verbose, veryVerbose, fileObject=fileObject))
+    else :
+        print("*** File type not recognised:", filename, file=sys.stderr)
+        return None
+
+# As processImageFile, but for the contents of a file which are already in memory. The name is just used to identify
+# the data.
+def processImageBytes(name, data, verbose=False, veryVerbose=False) :
+    return processImageFile(name, None, verbose, veryVerbose, fileObject=io.BytesIO(data))
+
+#
+####################################
+#
+
+def main(filename) :
+
+    if not os.path.isfile(filename) :
+        print("***",  filename, "is not a file", file=sys.stderr)
+        return
+
+    with open(filename, "rb") as f :
+        headerBytes = f.read(signatureLength)
+    print("File type:", describeSignature(headerBytes))
+
+    mainProperties = processImageFile(filename, fileTypeFromSignature(headerBytes), verbose=True)
+    if mainProperties is not None :
+        import JPEGDisplay
+        JPEGDisplay.displayMainProperties(mainProperties)
+
+if __name__ == "__main__" :
+
+    if len(sys.argv) == 1 :
+        print("No filename command line argument provided")
+        exit()
+
+    filename = sys.argv[1]
+    main(filename)
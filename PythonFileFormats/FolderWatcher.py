@@ -0,0 +1,256 @@
+# Follow changes to the files under a folder (including sub-folders), reporting files which have been added or
+# modified once they have 'settled', i.e. stopped changing, so that files which are still being copied in aren't
+# picked up half-written. Also reports files which have been deleted. (When a folder is deleted or moved away, just
+# the folder path is reported as deleted.)
+#
+# Uses Linux inotify notifications where available, otherwise falls back to polling the folder tree for changes in
+# file sizes and modification times.
+
+import sys
+import os
+import time
+import select
+import struct
+import threading
+
+# inotify event flags, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+watchMask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+# Each inotify event read is a 16 byte header (watch descriptor, mask, cookie, name length) followed by the name
+inotifyEventHeaderFormat = "iIII"
+inotifyEventHeaderSize = struct.calcsize(inotifyEventHeaderFormat)
+
+def loadInotify() :
+    if not sys.platform.startswith("linux") :
+        return None
+    try :
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        return libc
+    except (OSError, AttributeError) :
+        return None
+
+def fileState(path) :
+    try :
+        st = os.stat(path)
+    except OSError :
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+##
+###########################################################################
+##
+
+class InotifyWatcher :
+
+    def __init__(self, libc, topdir) :
+        self.libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0 :
+            raise OSError("inotify_init1 failed")
+        self.directories = {}   # Watch descriptor => directory path
+        for dirpath, dirnamesList, filenamesList in os.walk(topdir) :
+            self.addWatch(dirpath)
+
+    def addWatch(self, dirpath) :
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), watchMask)
+        if wd < 0 :
+            print("*** Unable to watch folder:", dirpath, file=sys.stderr)
+        else :
+            self.directories[wd] = dirpath
+
+    # Wait up to timeout seconds for changes, returning a list of (path, deleted) tuples for the files affected
+    def changes(self, timeout) :
+        readable, w, x = select.select([self.fd], [], [], timeout)
+        if not readable :
+            return []
+
+        changes = []
+        try :
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError :
+            return []
+
+        offset = 0
+        while offset + inotifyEventHeaderSize <= len(data) :
+            wd, mask, cookie, nameLength = struct.unpack_from(inotifyEventHeaderFormat, data, offset)
+            name = data[offset+inotifyEventHeaderSize:offset+inotifyEventHeaderSize+nameLength].rstrip(b'\x00')
+            offset += inotifyEventHeaderSize + nameLength
+
+            if mask & IN_Q_OVERFLOW :
+                print("*** Too many changes to follow, some may have been missed", file=sys.stderr)
+                continue
+            if mask & IN_IGNORED :
+                self.directories.pop(wd, None)
+                continue
+            if wd not in self.directories or not name :
+                continue
+
+            path = os.path.join(self.directories[wd], os.fsdecode(name))
+            if mask & IN_ISDIR :
+                if mask & (IN_DELETE | IN_MOVED_FROM) :
+                    # Reported as the deletion of the folder path, covering all the files which were under it
+                    changes.append( (path, True) )
+                elif mask & (IN_CREATE | IN_MOVED_TO) :
+                    # A new folder - watch it, and pick up anything already in it
+                    for dirpath, dirnamesList, filenamesList in os.walk(path) :
+                        self.addWatch(dirpath)
+                        changes.extend([(os.path.join(dirpath, n), False) for n in filenamesList])
+            elif mask & (IN_DELETE | IN_MOVED_FROM) :
+                changes.append( (path, True) )
+            else :
+                changes.append( (path, False) )
+
+        return changes
+
+    def close(self) :
+        if self.fd >= 0 :
+            os.close(self.fd)
+            self.fd = -1
+
+class PollingWatcher :
+
+    def __init__(self, topdir, pollSeconds=10) :
+        self.topdir = topdir
+        self.pollSeconds = pollSeconds
+        self.states = self.scan()
+        self.lastPoll = time.monotonic()
+
+    def scan(self) :
+        states = {}
+        for dirpath, dirnamesList, filenamesList in os.walk(self.topdir) :
+            for name in filenamesList :
+                path = os.path.join(dirpath, name)
+                state = fileState(path)
+                if state is not None :
+                    states[path] = state
+        return states
+
+    def changes(self, timeout) :
+        wait = self.lastPoll + self.pollSeconds - time.monotonic()
+        if wait > timeout :
+            time.sleep(timeout)
+            return []
+        time.sleep(max(wait, 0))
+        self.lastPoll = time.monotonic()
+
+        newStates = self.scan()
+        changes = [(path, False) for path, state in newStates.items() if self.states.get(path) != state]
+        changes.extend([(path, True) for path in self.states if path not in newStates])
+        self.states = newStates
+        return changes
+
+    def close(self) :
+        pass
+
+##
+###########################################################################
+##
+
+# Start following changes under the folder, using inotify if available, otherwise polling
+def startWatcher(topdir, pollSeconds=10, usePolling=False) :
+    libc = None if usePolling else loadInotify()
+    if libc is not None :
+        try :
+            watcher = InotifyWatcher(libc, topdir)
+            print("Watching for changes under", topdir, "using inotify")
+            return watcher
+        except OSError as e :
+            print("*** Unable to use inotify, polling instead:", e, file=sys.stderr)
+    watcher = PollingWatcher(topdir, pollSeconds)
+    print("Watching for changes under", topdir, "by polling every", pollSeconds, "seconds")
+    return watcher
+
+# Collects the changes seen by a watcher in a background thread, while something else is done - e.g. an initial scan
+# of the folder, which could take a long time - so that changes made in the meantime aren't missed (or lost from an
+# overflowing inotify queue). stop() returns the changes collected, to pass on to watchFolder.
+class ChangeBuffer :
+
+    def __init__(self, watcher) :
+        self.watcher = watcher
+        self.changes = []
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.collect, daemon=True)
+        self.thread.start()
+
+    def collect(self) :
+        while not self.stopping.is_set() :
+            self.changes.extend(self.watcher.changes(0.5))
+
+    def stop(self) :
+        self.stopping.set()
+        self.thread.join()
+        return self.changes
+
+# Record changed files as pending, from the time now, and report deleted files
+def applyChanges(changes, pending, filesDeleted, now) :
+    deleted = []
+    for path, isDeleted in changes :
+        if isDeleted :
+            pending.pop(path, None)
+            deleted.append(path)
+        else :
+            pending[path] = (now, fileState(path))
+    if deleted :
+        filesDeleted(deleted)
+
+# Watch the folder, calling filesChanged(list of paths) for files which have been added or modified and have then
+# not changed for settleSeconds, and filesDeleted(list of paths) for files which have been removed. Runs until
+# interrupted. A watcher already started with startWatcher can be passed in, along with any changes it has already
+# seen (from a ChangeBuffer), which are treated as having just happened; the watcher is closed on return.
+def watchFolder(topdir, filesChanged, filesDeleted, settleSeconds=5, pollSeconds=10, usePolling=False, watcher=None, bufferedChanges=()) :
+    if watcher is None :
+        watcher = startWatcher(topdir, pollSeconds, usePolling)
+
+    # Files which have changed, but haven't yet settled: path => (time of the last change seen, (size, mtime))
+    pending = {}
+
+    try :
+        applyChanges(bufferedChanges, pending, filesDeleted, time.monotonic())
+
+        while True :
+            # Wait for more changes, but no longer than needed to check if pending files have settled
+            timeout = settleSeconds
+            if pending :
+                oldest = min(t for t, state in pending.values())
+                timeout = max(0.1, min(settleSeconds, oldest + settleSeconds - time.monotonic()))
+
+            # The time of the changes is when the wait for them ends, not when it started, otherwise a change seen
+            # at the end of a long wait would look to have happened settleSeconds ago
+            changes = watcher.changes(timeout)
+            applyChanges(changes, pending, filesDeleted, time.monotonic())
+            # A file has settled if its size and modification time are the same as when we last saw it change, at
+            # least settleSeconds ago. If they aren't, it's still being written, so the settleSeconds start again from
+            # now.
+            now = time.monotonic()
+            settled = []
+            for path, (lastChange, state) in list(pending.items()) :
+                if now - lastChange < settleSeconds :
+                    continue
+                currentState = fileState(path)
+                if currentState is None :
+                    del pending[path]
+                elif currentState == state :
+                    del pending[path]
+                    settled.append(path)
+                else :
+                    pending[path] = (now, currentState)
+            if settled :
+                filesChanged(settled)
+    finally :
+        watcher.close()
@@ -0,0 +1,581 @@
+# Fuzz the JPEG marker and TIFF/Exif IFD parsing code with damaged files, and check that throughput hasn't regressed.
+#
+# A corpus of seed files is generated (JPEG files with Exif, GPS, ICC and restart markers, baseline and progressive,
+# in both byte orders, and TIFF files), so no files are needed. Each case is a seed file with one or more mutations:
+# truncation, corrupt segment lengths, bogus markers, IFD offsets which loop back on themselves, negative IFD pointers,
+# huge IFD component counts and random byte changes. Each case is parsed in a worker process in the same way as a file
+# on disk would be:
+# - FileTypes.processImageBytes, as used by CSV_from_JPEG_metadata.py
+# - JPEG.processFile with headerOnly, as used for archives (ArchiveScanner.py), reading through ReadPlanner.readHeader
+# - JPEGValidate.checkStructure, for JPEG data
+# and must finish within the time limit, without using more than the memory limit and without raising an exception.
+# JPEG data with a damaged segment length (found by following the segment lengths independently) must have its read
+# marked as aborted, rather than being parsed as if it were intact.
+# If the C accelerator (see BuildAccelerator.py) has been built, each case is parsed both with and without it, and the
+# properties extracted must be the same both ways. The worker process is replaced if a case kills it. Failing cases are saved to the failures folder so they can be re-run.
+#
+# Throughput is then measured by parsing the (undamaged) seed files repeatedly, and recorded with the details of the
+# run in a history file, one line of JSON per run. If throughput is more than the tolerance below the median of the
+# previous runs on the same machine (and Python version, with or without the C accelerator), the run fails.
+#
+# Usage:
+#   python FuzzParsers.py [--cases N] [--seed S] [--history FILE] ...
+# Exits with status 1 if any case fails or throughput has regressed.
+
+import sys
+import os
+import io
+import json
+import time
+import hashlib
+import struct
+import random
+import signal
+import platform
+import statistics
+import multiprocessing
+
+import JPEG
+import FileTypes
+import JPEGValidate
+import ReadPlanner
+
+defaultHistoryFileName = "fuzz-history.jsonl"
+defaultFailuresFolder = "fuzz-failures"
+
+# Number of previous runs the throughput is compared with
+historyRunsCompared = 5
+
+##
+###########################################################################
+##
+
+# Seed file generation
+
+# The bytes of an IFD at offset base, with values which don't fit in 4 bytes placed after it
+def IFDBytes(order, entries, base, nextIFDOffset=0) :
+    size = 2 + 12 * len(entries) + 4
+    values = b''
+    out = struct.pack(order + "H", len(entries))
+    for tag, dataFormat, count, payload in sorted(entries) :
+        if len(payload) <= 4 :
+            out += struct.pack(order + "HHI", tag, dataFormat, count) + payload.ljust(4, b'\x00')
+        else :
+            out += struct.pack(order + "HHII", tag, dataFormat, count, base + size + len(values))
+            values += payload
+            if len(values) % 2 :
+                values += b'\x00'
+    return out + struct.pack(order + "I", nextIFDOffset) + values
+
+def ASCIIPayload(s) :
+    return s.encode() + b'\x00'
+
+def rationalsPayload(order, *rationals) :
+    return b''.join(struct.pack(order + "II", numerator, denominator) for numerator, denominator in rationals)
+
+# TIFF content as found in an Exif segment, with IFD0 (and optionally IFD1 for a thumbnail), Exif and GPS IFDs
+def TIFFBytes(rng, order="<", GPS=True, thumbnail=False) :
+    make = rng.choice(["Canon", "NIKON CORPORATION", "Apple", "SONY"])
+    model = rng.choice(["EOS 5D", "D750", "iPhone 12", "ILCE-7M3"])
+    timestamp = "20{0:02d}:{1:02d}:{2:02d} 12:34:56".format(rng.randrange(0, 25), rng.randrange(1, 13), rng.randrange(1, 29))
+
+    def IFD0Entries(ExifOffset, GPSOffset) :
+        entries = [(271, 2, len(make) + 1, ASCIIPayload(make)), (272, 2, len(model) + 1, ASCIIPayload(model)),
+                   (306, 2, 20, ASCIIPayload(timestamp)), (282, 5, 1, rationalsPayload(order, (72, 1))),
+                   (256, 3, 1, struct.pack(order + "H", 4000)), (257, 3, 1, struct.pack(order + "H", 3000)),
+                   (34665, 4, 1, struct.pack(order + "I", ExifOffset))]
+        if GPS :
+            entries.append( (34853, 4, 1, struct.pack(order + "I", GPSOffset)) )
+        return entries
+
+    ExifEntries = [(36867, 2, 20, ASCIIPayload(timestamp)), (37521, 2, 3, ASCIIPayload("42")),
+                   (40962, 4, 1, struct.pack(order + "I", 4000)), (40963, 4, 1, struct.pack(order + "I", 3000)),
+                   (33434, 5, 1, rationalsPayload(order, (1, 125))), (37500, 7, 64, bytes(rng.getrandbits(8) for i in range(0, 64)))]
+    GPSEntries = [(1, 2, 2, ASCIIPayload("N")), (2, 5, 3, rationalsPayload(order, (51, 1), (30, 1), (1234, 100))),
+                  (3, 2, 2, ASCIIPayload("W")), (4, 5, 3, rationalsPayload(order, (0, 1), (7, 1), (3900, 100))),
+                  (6, 5, 1, rationalsPayload(order, (12000, 100)))]
+
+    header = (b'II' if order == "<" else b'MM') + struct.pack(order + "HI", 42, 8)
+    # Lay out IFD0, then the Exif and GPS IFDs, then IFD1 - the sizes don't depend on the offsets
+    IFD0Size = len(IFDBytes(order, IFD0Entries(0, 0), 8))
+    ExifOffset = 8 + IFD0Size
+    Exif = IFDBytes(order, ExifEntries, ExifOffset)
+    GPSOffset = ExifOffset + len(Exif)
+    GPSIFD = IFDBytes(order, GPSEntries, GPSOffset) if GPS else b''
+    IFD1Offset = GPSOffset + len(GPSIFD) if thumbnail else 0
+    IFD0 = IFDBytes(order, IFD0Entries(ExifOffset, GPSOffset), 8, IFD1Offset)
+    IFD1 = b''
+    if thumbnail :
+        IFD1 = IFDBytes(order, [(259, 3, 1, struct.pack(order + "H", 6))], IFD1Offset)
+    return header + IFD0 + Exif + GPSIFD + IFD1
+
+def segmentBytes(markerByte, payload) :
+    return bytes([0xFF, markerByte]) + struct.pack(">H", len(payload) + 2) + payload
+
+# Random entropy coded data, with <FF> bytes stuffed and RST markers every restartInterval 'MCUs' of 64 bytes
+def scanDataBytes(rng, length, restartInterval=0) :
+    data = bytearray()
+    MCUs = 0
+    restartMarker = 0
+    while len(data) < length :
+        MCU = bytes(rng.getrandbits(8) for i in range(0, 64))
+        data += MCU.replace(b'\xff', b'\xff\x00')
+        MCUs += 1
+        if restartInterval and MCUs % restartInterval == 0 :
+            data += bytes([0xFF, 0xD0 + restartMarker])
+            restartMarker = (restartMarker + 1) % 8
+    return bytes(data)
+
+def JPEGBytes(rng, progressive=False, restartInterval=0, order="<", ICC=False, scanLength=2000, **TIFFOptions) :
+    data = b'\xff\xd8'
+    data += segmentBytes(0xE0, b'JFIF\x00\x01\x01\x00\x00\x48\x00\x48\x00\x00')
+    data += segmentBytes(0xE1, b'Exif\x00\x00' + TIFFBytes(rng, order, **TIFFOptions))
+    if ICC :
+        data += segmentBytes(0xE2, b'ICC_PROFILE\x00\x01\x01' + bytes(rng.getrandbits(8) for i in range(0, 2000)))
+    data += segmentBytes(0xDB, b'\x00' + bytes(range(0, 64)))
+    data += segmentBytes(0xC2 if progressive else 0xC0, b'\x08\x0b\xb8\x0f\xa0\x03\x01\x22\x00\x02\x11\x01\x03\x11\x01')
+    data += segmentBytes(0xC4, b'\x00' + bytes(16))
+    if restartInterval :
+        data += segmentBytes(0xDD, struct.pack(">H", restartInterval))
+    data += segmentBytes(0xFE, b'Fuzzing seed')
+    for scan in range(0, 3 if progressive else 1) :
+        data += segmentBytes(0xDA, b'\x03\x01\x00\x02\x11\x03\x11\x00\x3f\x00')
+        data += scanDataBytes(rng, scanLength, restartInterval)
+    return data + b'\xff\xd9'
+
+# The seed files, as (name, data) tuples. scanLength sets the size of the scan data of the JPEG files.
+def seedCorpus(rng, scanLength=2000) :
+    return [
+        ("baseline.jpg", JPEGBytes(rng, scanLength=scanLength)),
+        ("baseline-mm.jpg", JPEGBytes(rng, order=">", scanLength=scanLength)),
+        ("restart.jpg", JPEGBytes(rng, restartInterval=4, ICC=True, scanLength=scanLength)),
+        ("progressive.jpg", JPEGBytes(rng, progressive=True, order=">", GPS=False, scanLength=scanLength)),
+        ("thumbnail.jpg", JPEGBytes(rng, restartInterval=1, thumbnail=True, scanLength=scanLength)),
+        ("camera.tif", TIFFBytes(rng, "<", thumbnail=True)),
+        ("camera-mm.tif", TIFFBytes(rng, ">")),
+    ]
+
+##
+###########################################################################
+##
+
+# Mutations: each takes a random number generator and the file data, returning the changed data
+
+# Offsets of the segment markers in JPEG data, following the segment lengths
+def segmentOffsets(data) :
+    offsets = []
+    n = 2
+    while n + 4 <= len(data) and data[n] == 0xFF and data[n+1] not in [0xDA, 0xD9] :
+        offsets.append(n)
+        n += 2 + int.from_bytes(data[n+2:n+4], byteorder='big')
+    return offsets
+
+# Offset and byte order of the TIFF content in the data (the Exif segment of JPEG data), or (None, None)
+def TIFFContent(data) :
+    if data[0:2] in [b'II', b'MM'] :
+        offset = 0
+    else :
+        offset = data.find(b'Exif\x00\x00')
+        if offset < 0 :
+            return None, None
+        offset += 6
+    if offset + 8 > len(data) :
+        return None, None
+    return offset, "<" if data[offset:offset+2] == b'II' else ">"
+
+# Offsets of the IFD entries in the IFD at IFDOffset in the TIFF content at TIFFOffset
+def IFDEntryOffsets(data, TIFFOffset, order, IFDOffset) :
+    countOffset = TIFFOffset + IFDOffset
+    if countOffset + 2 > len(data) :
+        return []
+    count = struct.unpack(order + "H", data[countOffset:countOffset+2])[0]
+    return [countOffset + 2 + 12 * i for i in range(0, count) if countOffset + 14 + 12 * i <= len(data)]
+
+def truncate(rng, data) :
+    return data[0:rng.randrange(0, len(data) + 1)]
+
+def corruptSegmentLength(rng, data) :
+    offsets = segmentOffsets(data)
+    if not offsets :
+        return flipBytes(rng, data)
+    n = rng.choice(offsets)
+    length = rng.choice([0, 1, 2, 3, 0xFFFF, rng.randrange(0, 0x10000)])
+    return data[0:n+2] + struct.pack(">H", length) + data[n+4:]
+
+def insertBogusMarker(rng, data) :
+    n = rng.randrange(0, len(data) + 1)
+    markerByte = rng.choice([0x00, 0x01, 0xD0, 0xD7, 0xD8, 0xD9, 0xDA, 0xDD, 0xE1, 0xFE, 0xFF, rng.randrange(0, 256)])
+    marker = bytes([0xFF, markerByte])
+    if rng.random() < 0.5 :
+        marker += struct.pack(">H", rng.randrange(0, 0x10000))
+    return data[0:n] + marker + data[n:]
+
+# Make an IFD offset point back to an IFD already read (or somewhere random), so that IFDs could be read for ever
+def loopIFDOffset(rng, data) :
+    TIFFOffset, order = TIFFContent(data)
+    if TIFFOffset is None :
+        return flipBytes(rng, data)
+    IFD0Offset = struct.unpack(order + "I", data[TIFFOffset+4:TIFFOffset+8])[0]
+    entryOffsets = IFDEntryOffsets(data, TIFFOffset, order, IFD0Offset)
+    target = rng.choice([0, 8, IFD0Offset, rng.randrange(0, 0x100000000)])
+    data = bytearray(data)
+    if rng.random() < 0.5 or not entryOffsets :
+        # The next IFD offset after IFD0's entries
+        n = TIFFOffset + IFD0Offset + 2 + 12 * len(entryOffsets)
+    else :
+        # The value of an entry, e.g. the Exif or GPS IFD pointer
+        n = rng.choice(entryOffsets) + 8
+    if n + 4 <= len(data) :
+        data[n:n+4] = struct.pack(order + "I", target)
+    return bytes(data)
+
+def hugeComponentCount(rng, data) :
+    TIFFOffset, order = TIFFContent(data)
+    if TIFFOffset is None :
+        return flipBytes(rng, data)
+    IFD0Offset = struct.unpack(order + "I", data[TIFFOffset+4:TIFFOffset+8])[0]
+    entryOffsets = IFDEntryOffsets(data, TIFFOffset, order, IFD0Offset)
+    if not entryOffsets :
+        return flipBytes(rng, data)
+    n = rng.choice(entryOffsets)
+    data = bytearray(data)
+    if rng.random() < 0.5 :
+        # Also change the format
+        data[n+2:n+4] = struct.pack(order + "H", rng.choice([1, 2, 3, 4, 5, 7, 9, 10, 11, 0xFFFF]))
+    data[n+4:n+8] = struct.pack(order + "I", rng.choice([0xFFFFFFFF, 0x7FFFFFFF, 0x10000000, rng.randrange(0, 0x100000000)]))
+    return bytes(data)
+
+# Make the Exif or GPS IFD pointer (or another entry) a negative signed value, as the C accelerator reads from the
+# data at the offset it is given
+def negativeIFDPointer(rng, data) :
+    TIFFOffset, order = TIFFContent(data)
+    if TIFFOffset is None :
+        return flipBytes(rng, data)
+    IFD0Offset = struct.unpack(order + "I", data[TIFFOffset+4:TIFFOffset+8])[0]
+    entryOffsets = IFDEntryOffsets(data, TIFFOffset, order, IFD0Offset)
+    if not entryOffsets :
+        return flipBytes(rng, data)
+    pointerOffsets = [n for n in entryOffsets if struct.unpack(order + "H", data[n:n+2])[0] in JPEG.knownEmbeddedIFDs()]
+    n = rng.choice(pointerOffsets or entryOffsets)
+    data = bytearray(data)
+    # Signed long format, one component
+    data[n+2:n+8] = struct.pack(order + "HI", 9, 1)
+    data[n+8:n+12] = struct.pack(order + "i", rng.choice([-1, -8, -len(data), -20000000, -0x80000000, -rng.randrange(1, 0x80000000)]))
+    return bytes(data)
+
+def flipBytes(rng, data) :
+    if not data :
+        return data
+    data = bytearray(data)
+    for i in range(0, rng.randrange(1, 10)) :
+        data[rng.randrange(0, len(data))] = rng.getrandbits(8)
+    return bytes(data)
+
+def repeatSegment(rng, data) :
+    offsets = segmentOffsets(data)
+    if not offsets :
+        return flipBytes(rng, data)
+    n = rng.choice(offsets)
+    end = n + 2 + int.from_bytes(data[n+2:n+4], byteorder='big')
+    return data[0:n] + data[n:end] * rng.randrange(2, 50) + data[n:]
+
+mutations = [truncate, corruptSegmentLength, insertBogusMarker, loopIFDOffset, negativeIFDPointer, hugeComponentCount, flipBytes, repeatSegment]
+
+# The data for a case, with the names of the mutations applied
+def fuzzCase(rng, seeds) :
+    name, data = rng.choice(seeds)
+    applied = []
+    for i in range(0, rng.choice([1, 1, 1, 2, 3])) :
+        mutation = rng.choice(mutations)
+        data = mutation(rng, data)
+        applied.append(mutation.__name__)
+    return name, applied, data
+
+##
+###########################################################################
+##
+
+# Whether the JPEG data has a segment up to the first scan header whose length is damaged: less than 2 (not even
+# covering the length bytes), or running past the end of the data. Found by following the segment lengths from the
+# start of the data, independently of the parsing code. (With headerOnly, the scan header isn't read.)
+def hasDamagedSegmentLength(data, headerOnly=False) :
+    n = 2
+    while n + 2 <= len(data) and data[n] == 0xFF :
+        marker = data[n+1]
+        if marker == 0xFF :
+            # Fill byte
+            n += 1
+            continue
+        if marker == 0xD9 or (marker == 0xDA and headerOnly) :
+            return False
+        if marker in JPEG.standaloneMarkers :
+            n += 2
+            continue
+        if n + 4 > len(data) :
+            return True
+        length = int.from_bytes(data[n+2:n+4], byteorder='big')
+        if length < 2 or n + 2 + length > len(data) :
+            return True
+        if marker == 0xDA :
+            return False
+        n += 2 + length
+    return False
+
+# Raised when damaged data is parsed as if it were intact
+class DamageNotDetected(Exception) :
+    pass
+
+# Parse JPEG data as JPEG.processFile, checking that a read of data with a damaged segment length is marked as aborted
+def processJPEGChecked(name, data, headerOnly=False) :
+    status = {}
+    p = JPEG.processFile(name, fileObject=io.BytesIO(data), headerOnly=headerOnly, status=status)
+    if hasDamagedSegmentLength(data, headerOnly) and not status['aborted'] :
+        raise DamageNotDetected()
+    return p
+
+# Parsing of a case, as a file on disk would be parsed, returning the properties extracted
+def parseCase(name, data) :
+    headerProperties = None
+    if FileTypes.isJPEGSignature(data) :
+        # As FileTypes.processImageBytes, but also checking the read of damaged data is aborted
+        p = FileTypes.internProperties(processJPEGChecked(name, data))
+        header = ReadPlanner.readHeader(io.BytesIO(data), ReadPlanner.HeaderReadPlanner())
+        headerProperties = processJPEGChecked(name, header, headerOnly=True)
+        JPEGValidate.checkStructure(data, JPEGValidate.Verdict(name))
+    else :
+        p = FileTypes.processImageBytes(name, data)
+    return p, headerProperties
+
+class CaseTimeout(Exception) :
+    pass
+
+def raiseCaseTimeout(signalNumber, frame) :
+    raise CaseTimeout()
+
+# Worker process: parse each case received, with or without the accelerator, sending back 'ok', 'timeout', 'memory',
+# 'undetected' (damaged data parsed as if it were intact) or 'exception:<type>', and a digest of the properties
+# extracted
+def worker(connection, timeLimit, memoryLimitMB) :
+    # The parsing code reports damaged data on stderr, which isn't wanted here
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+
+    try :
+        import resource
+        memoryLimit = memoryLimitMB * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (memoryLimit, memoryLimit))
+    except (ImportError, ValueError, OSError) :
+        pass
+    signal.signal(signal.SIGALRM, raiseCaseTimeout)
+
+    while True :
+        case = connection.recv()
+        if case is None :
+            break
+        name, data, accelerated = case
+        JPEG.useAccelerator(accelerated)
+        signal.setitimer(signal.ITIMER_REAL, timeLimit)
+        digest = None
+        try :
+            digest = hashlib.sha1(repr(parseCase(name, data)).encode()).hexdigest()
+            result = "ok"
+        except CaseTimeout :
+            result = "timeout"
+        except MemoryError :
+            result = "memory"
+        except DamageNotDetected :
+            result = "undetected"
+        except Exception as e :
+            result = "exception:" + type(e).__name__
+        finally :
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        connection.send( (result, digest) )
+
+class WorkerProcess :
+
+    def __init__(self, timeLimit, memoryLimitMB) :
+        self.timeLimit = timeLimit
+        self.memoryLimitMB = memoryLimitMB
+        self.process = None
+
+    def start(self) :
+        self.connection, workerConnection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=worker, args=(workerConnection, self.timeLimit, self.memoryLimitMB), daemon=True)
+        self.process.start()
+
+    def stop(self) :
+        if self.process is not None :
+            if self.process.is_alive() :
+                self.connection.send(None)
+                self.process.join(1)
+            if self.process.is_alive() :
+                self.process.kill()
+            self.process = None
+
+    # Parse a case in the worker, replacing the worker if it dies or doesn't respond. Returns the result, and the
+    # digest of the properties extracted (None unless the result is 'ok').
+    def run(self, name, data, accelerated=False) :
+        if self.process is None :
+            self.start()
+        self.connection.send( (name, data, accelerated) )
+        try :
+            # Allow for time the worker can't be interrupted, e.g. in C code
+            if self.connection.poll(self.timeLimit * 4 + 1) :
+                return self.connection.recv()
+            result = "hang"
+        except EOFError :
+            result = "crash"
+        self.process.kill()
+        self.process.join()
+        self.process = None
+        return result, None
+
+def saveFailure(failuresFolder, caseNo, name, applied, mode, result, data) :
+    os.makedirs(failuresFolder, exist_ok=True)
+    filename = os.path.join(failuresFolder, "case-{0:d}-{1:s}-{2:s}-{3:s}".format(caseNo, mode, result.replace(":", "-"), name))
+    with open(filename, "wb") as f :
+        f.write(data)
+    print("*** Case", caseNo, ":", result, "(" + mode + ") -", name, "with", ", ".join(applied), "- saved as", filename, file=sys.stderr)
+
+# The ways each case is parsed: with the pure Python code, and with the accelerator if it has been built
+def parsingModes() :
+    return {'python' : False, 'accelerated' : True} if JPEG.accelerated else {'python' : False}
+
+# Run the fuzz cases, returning the count of each result for each parsing mode
+def fuzz(cases, seed, timeLimit, memoryLimitMB, failuresFolder) :
+    rng = random.Random(seed)
+    seeds = seedCorpus(rng)
+    modes = parsingModes()
+    results = {mode : {} for mode in modes}
+    workerProcess = WorkerProcess(timeLimit, memoryLimitMB)
+    try :
+        for caseNo in range(0, cases) :
+            name, applied, data = fuzzCase(rng, seeds)
+            pythonDigest = None
+            for mode, accelerated in modes.items() :
+                result, digest = workerProcess.run(name, data, accelerated)
+                if not accelerated :
+                    pythonDigest = digest
+                elif result == "ok" and digest != pythonDigest :
+                    # Different properties from the pure Python code, or the pure Python code failed
+                    result = "mismatch"
+                results[mode][result] = results[mode].get(result, 0) + 1
+                if isFailure(result) :
+                    saveFailure(failuresFolder, caseNo, name, applied, mode, result, data)
+            if (caseNo + 1) % 1000 == 0 :
+                print(" .. ", caseNo + 1, "/", cases)
+    finally :
+        workerProcess.stop()
+    return results
+
+def isFailure(result) :
+    return result != "ok"
+
+##
+###########################################################################
+##
+
+# Parse the seed files repeatedly, returning MB per second and files per second. Taken as the best of several timed
+# rounds, so that other activity on the machine has less effect.
+def measureThroughput(seed, rounds=5, secondsPerRound=0.5) :
+    rng = random.Random(seed)
+    seeds = seedCorpus(rng, scanLength=200000)
+    totalBytes = sum(len(data) for name, data in seeds)
+
+    # Warm up, so that caches are filled as they would be part way through a large batch
+    for name, data in seeds :
+        FileTypes.processImageBytes(name, data)
+
+    bestSecondsPerPass = None
+    for round in range(0, rounds) :
+        passes = 0
+        start = time.perf_counter()
+        elapsed = 0
+        while elapsed < secondsPerRound :
+            for name, data in seeds :
+                FileTypes.processImageBytes(name, data)
+            passes += 1
+            elapsed = time.perf_counter() - start
+        if bestSecondsPerPass is None or elapsed / passes < bestSecondsPerPass :
+            bestSecondsPerPass = elapsed / passes
+    return totalBytes / bestSecondsPerPass / 1000000, len(seeds) / bestSecondsPerPass
+
+def readHistory(historyFileName) :
+    runs = []
+    if os.path.isfile(historyFileName) :
+        with open(historyFileName) as f :
+            for line in f :
+                if line.strip() :
+                    runs.append(json.loads(line))
+    return runs
+
+# The median throughput of the most recent passing runs in the same environment, or None if there aren't any
+def baselineThroughput(runs, environment) :
+    previous = [run['MBPerSecond'] for run in runs if run.get('environment') == environment and run.get('passed')]
+    if not previous :
+        return None
+    return statistics.median(previous[-historyRunsCompared:])
+
+def runEnvironment() :
+    return {'host' : platform.node(), 'python' : platform.python_version(), 'accelerated' : JPEG.accelerated}
+
+#
+####################################
+#
+
+def main(cases, seed, timeLimit, memoryLimitMB, historyFileName, tolerance, failuresFolder, writeSeedsFolder) :
+    if writeSeedsFolder :
+        os.makedirs(writeSeedsFolder, exist_ok=True)
+        for name, data in seedCorpus(random.Random(seed)) :
+            with open(os.path.join(writeSeedsFolder, name), "wb") as f :
+                f.write(data)
+        print("Wrote seed files to", writeSeedsFolder)
+
+    start = time.perf_counter()
+    results = fuzz(cases, seed, timeLimit, memoryLimitMB, failuresFolder)
+    fuzzSeconds = time.perf_counter() - start
+    failures = sum(n for modeResults in results.values() for result, n in modeResults.items() if isFailure(result))
+    print("Ran", cases, "fuzz case(s) in {0:.1f}s".format(fuzzSeconds))
+    for mode, modeResults in results.items() :
+        print("  {0:12s}".format(mode + ":"), ", ".join("{0:s} {1:d}".format(result, n) for result, n in sorted(modeResults.items())))
+
+    MBPerSecond, filesPerSecond = measureThroughput(seed)
+    environment = runEnvironment()
+    runs = readHistory(historyFileName)
+    baseline = baselineThroughput(runs, environment)
+    regressed = baseline is not None and MBPerSecond < baseline * (1 - tolerance)
+    if baseline is None :
+        print("Throughput: {0:.1f} MB/s, {1:.0f} files/s (no previous runs to compare with)".format(MBPerSecond, filesPerSecond))
+    else :
+        print("Throughput: {0:.1f} MB/s, {1:.0f} files/s, previous runs {2:.1f} MB/s".format(MBPerSecond, filesPerSecond, baseline))
+    if regressed :
+        print("*** Throughput has dropped by more than {0:.0f}%".format(tolerance * 100), file=sys.stderr)
+
+    passed = failures == 0 and not regressed
+    run = {'time' : time.strftime("%Y-%m-%dT%H:%M:%S"), 'environment' : environment, 'cases' : cases, 'seed' : seed,
+           'results' : results, 'MBPerSecond' : round(MBPerSecond, 2), 'filesPerSecond' : round(filesPerSecond, 1), 'passed' : passed}
+    with open(historyFileName, "a") as f :
+        f.write(json.dumps(run) + "\n")
+
+    if failures :
+        print("***", failures, "case parse(s) failed", file=sys.stderr)
+    return passed
+
+if __name__ == "__main__" :
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fuzz the JPEG and TIFF/Exif parsing code with damaged files, and check throughput hasn't regressed")
+    parser.add_argument("--cases", type=int, default=5000, help="number of fuzz cases to run (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1, help="random number seed, so that runs can be repeated (default: %(default)s)")
+    parser.add_argument("--time-limit", type=float, default=2.0, help="seconds allowed to parse each case (default: %(default)s)")
+    parser.add_argument("--memory-limit", type=int, default=1024, help="MB of memory allowed for the worker process (default: %(default)s)")
+    parser.add_argument("--history", default=defaultHistoryFileName, help="file recording the throughput of each run (default: %(default)s)")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="fraction by which throughput can drop below previous runs (default: %(default)s)")
+    parser.add_argument("--failures", default=defaultFailuresFolder, help="folder to save failing cases in (default: %(default)s)")
+    parser.add_argument("--write-seeds", metavar="FOLDER", default=None, help="also write the seed files to this folder")
+    args = parser.parse_args()
+
+    passed = main(args.cases, args.seed, args.time_limit, args.memory_limit, args.history, args.tolerance, args.failures, args.write_seeds)
+    exit(0 if passed else 1)
@@ -0,0 +1,207 @@
+# Offline 'reverse geocoding' of photo locations: the nearest town or other populated place, with its region and
+# country, found from a local gazetteer file - no online service is used. The gazetteer is a GeoNames dump file, e.g.
+# cities1000.txt (places with 1000+ people) or allCountries.txt from https://download.geonames.org/export/dump/ -
+# tab separated, one place per line:
+#   geonameid, name, asciiname, alternatenames, latitude, longitude, feature class, feature code, country code, cc2,
+#   admin1 code, admin2 code, admin3 code, admin4 code, population, elevation, dem, timezone, modification date
+# Only populated places (feature class P) are used. If the GeoNames admin1CodesASCII.txt and countryInfo.txt files are
+# in the same folder as the gazetteer file, they are used to give region and country names rather than codes.
+#
+# Places are held in arrays (rather than an object per place) and indexed by a grid of cells of a fixed size in
+# degrees, so the nearest place to a location is found by looking at the cells around the location's cell, ring by
+# ring, until no nearer place can be in the next ring. Photos are mostly taken in clusters of nearby locations, so
+# the result for each small cell of locations (0.01 degrees, about 1km) is also kept, in a bounded cache.
+#
+# Used by CSV_from_JPEG_metadata.py's --gazetteer option. Run directly to look up a location:
+#   python Gazetteer.py cities1000.txt 51.5034 -0.1275
+
+import sys
+import os
+import math
+from array import array
+
+import Interning
+
+featureClassPopulatedPlace = "P"
+earthRadiusKm = 6371.0
+
+# Distance between two locations in km, using the haversine formula
+def distanceKm(latitude1, longitude1, latitude2, longitude2) :
+    phi1 = math.radians(latitude1)
+    phi2 = math.radians(latitude2)
+    dPhi = phi2 - phi1
+    dLambda = math.radians(longitude2 - longitude1)
+    a = math.sin(dPhi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dLambda / 2) ** 2
+    return 2 * earthRadiusKm * math.asin(min(1.0, math.sqrt(a)))
+
+# Code => name, from a GeoNames tab-separated file with the code in column codeColumn and the name in nameColumn,
+# or an empty dictionary if the file isn't there
+def readNames(filename, codeColumn, nameColumn) :
+    names = {}
+    if not os.path.isfile(filename) :
+        return names
+    with open(filename, encoding="utf-8") as f :
+        for line in f :
+            if line.startswith("#") :
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) > max(codeColumn, nameColumn) :
+                names[fields[codeColumn]] = fields[nameColumn]
+    return names
+
+class Gazetteer :
+
+    def __init__(self, cellSize=0.5, maxDistanceKm=100.0, cacheCellSize=0.01, cacheSize=100000) :
+        self.cellSize = cellSize
+        self.maxDistanceKm = maxDistanceKm
+        self.cacheCellSize = cacheCellSize
+        self.longitudeCells = int(round(360 / cellSize))
+
+        # One entry per place
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.names = []
+        self.regions = []
+        self.countries = []
+
+        # Grid cell (latitude index, longitude index) => array of place numbers
+        self.cells = {}
+
+        # Rounded location => result, see nearestPlace
+        self.cache = Interning.InternCache(cacheSize)
+
+        # Region and country names are shared by many places
+        self.categories = Interning.Categories()
+
+    def cellForLocation(self, latitude, longitude) :
+        return int(math.floor(latitude / self.cellSize)), int(math.floor(longitude / self.cellSize)) % self.longitudeCells
+
+    def addPlace(self, latitude, longitude, name, region, country) :
+        placeNo = len(self.names)
+        self.latitudes.append(latitude)
+        self.longitudes.append(longitude)
+        self.names.append(name)
+        self.regions.append(self.categories.intern(region))
+        self.countries.append(self.categories.intern(country))
+        cell = self.cellForLocation(latitude, longitude)
+        if cell not in self.cells :
+            self.cells[cell] = array('l')
+        self.cells[cell].append(placeNo)
+
+    def load(self, filename) :
+        folder = os.path.dirname(filename)
+        regionNames = readNames(os.path.join(folder, "admin1CodesASCII.txt"), 0, 1)
+        countryNames = readNames(os.path.join(folder, "countryInfo.txt"), 0, 4)
+
+        with open(filename, encoding="utf-8") as f :
+            for lineNo, line in enumerate(f, 1) :
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < 11 or fields[6] != featureClassPopulatedPlace :
+                    continue
+                try :
+                    latitude = float(fields[4])
+                    longitude = float(fields[5])
+                except ValueError :
+                    print("*** Invalid location in gazetteer file:", filename, "line", lineNo, file=sys.stderr)
+                    continue
+                countryCode = fields[8]
+                regionCode = countryCode + "." + fields[10]
+                self.addPlace(latitude, longitude, fields[1], regionNames.get(regionCode, fields[10]), countryNames.get(countryCode, countryCode))
+        return self
+
+    # Search the grid for the nearest place to a location, returning (place number, distance in km), or None if
+    # there are no places within maxDistanceKm. Distances are compared in degrees of latitude, with longitudes
+    # scaled for the latitude, which is close enough for finding the nearest place.
+    def searchGrid(self, latitude, longitude) :
+        latitudeCell, longitudeCell = self.cellForLocation(latitude, longitude)
+        longitudeScale = max(math.cos(math.radians(latitude)), 0.01)
+        maxRings = min(int(self.maxDistanceKm / (111.0 * self.cellSize * longitudeScale)) + 1, self.longitudeCells // 2)
+
+        bestPlaceNo = None
+        bestDistance = None
+        for ring in range(0, maxRings + 1) :
+            # No place in this ring or beyond can be nearer than this
+            if bestDistance is not None and bestDistance <= (ring - 1) * self.cellSize * longitudeScale :
+                break
+            for i in range(latitudeCell - ring, latitudeCell + ring + 1) :
+                for j in range(longitudeCell - ring, longitudeCell + ring + 1) :
+                    if max(abs(i - latitudeCell), abs(j - longitudeCell)) != ring :
+                        continue
+                    placeNos = self.cells.get( (i, j % self.longitudeCells) )
+                    if placeNos is None :
+                        continue
+                    for placeNo in placeNos :
+                        dLongitude = abs(self.longitudes[placeNo] - longitude)
+                        if dLongitude > 180 :
+                            dLongitude = 360 - dLongitude
+                        distance = math.hypot(self.latitudes[placeNo] - latitude, dLongitude * longitudeScale)
+                        if bestDistance is None or distance < bestDistance :
+                            bestPlaceNo = placeNo
+                            bestDistance = distance
+
+        if bestPlaceNo is None :
+            return None
+        distance = distanceKm(latitude, longitude, self.latitudes[bestPlaceNo], self.longitudes[bestPlaceNo])
+        if distance > self.maxDistanceKm :
+            return None
+        return bestPlaceNo, distance
+
+    # The nearest place to a location, as (name, region, country, distance in km), or None if there are no places
+    # within maxDistanceKm. Locations in the same small cell share a result, so the distance is approximate.
+    def nearestPlace(self, latitude, longitude) :
+        key = (round(latitude / self.cacheCellSize), round(longitude / self.cacheCellSize))
+        result = self.cache.lookup(key)
+        if result is None :
+            found = self.searchGrid(key[0] * self.cacheCellSize, key[1] * self.cacheCellSize)
+            if found is None :
+                # Cached as an empty tuple, as None means not cached
+                result = ()
+            else :
+                placeNo, distance = found
+                result = (self.names[placeNo], self.regions[placeNo], self.countries[placeNo], round(distance, 1))
+            self.cache.add(key, result)
+        return result or None
+
+    # Add the place properties to the properties of an image file with a location
+    def enrichProperties(self, p) :
+        if 'latitude' not in p or 'longitude' not in p :
+            return p
+        place = self.nearestPlace(p['latitude'], p['longitude'])
+        if place is not None :
+            p['place'], p['region'], p['country'], p['placeDistance'] = place
+        return p
+
+    def statistics(self) :
+        return {'places' : len(self.names), 'cells' : len(self.cells), 'cache' : self.cache.statistics()}
+
+#
+####################################
+#
+
+def main(filename, latitude, longitude) :
+    import time
+
+    if not os.path.isfile(filename) :
+        print("***",  filename, "is not a file", file=sys.stderr)
+        return
+
+    start = time.perf_counter()
+    gazetteer = Gazetteer().load(filename)
+    print("Loaded", len(gazetteer.names), "places in {0:.2f}s".format(time.perf_counter() - start))
+
+    start = time.perf_counter()
+    place = gazetteer.nearestPlace(latitude, longitude)
+    elapsed = time.perf_counter() - start
+    if place is None :
+        print("No place within", gazetteer.maxDistanceKm, "km")
+    else :
+        print("Nearest place: {0:s}, {1:s}, {2:s} ({3:.1f} km)".format(*place))
+    print("Lookup took {0:.0f} microseconds".format(elapsed * 1000000))
+
+if __name__ == "__main__" :
+
+    if len(sys.argv) < 4 :
+        print("Usage: python Gazetteer.py gazetteer-file latitude longitude")
+        exit()
+
+    main(sys.argv[1], float(sys.argv[2]), float(sys.argv[3]))
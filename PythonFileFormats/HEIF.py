@@ -0,0 +1,230 @@
+# Extract basic metadata from HEIF format files (e.g. .heic photos from phones). HEIF files are ISO Base Media File
+# Format (ISO/IEC 14496-12) files, made up of nested 'boxes'. The Exif metadata is held as an 'item' of the file:
+# - the 'meta' box contains an 'iinf' box listing the items, where the Exif item has an item type of 'Exif'
+# - the 'meta' box also contains an 'iloc' box giving the location (offset and length 'extents') of each item's data
+# - the Exif item data starts with a 4-byte offset to the TIFF header, and the rest is the same TIFF content as
+#   found in the Exif segment of a JPEG file, so is handled by JPEG.processTIFF
+# https://nokiatech.github.io/heif/technical.html
+
+import sys
+import os
+import struct
+
+import JPEG
+
+# The 'brands' we expect in the ftyp box at the start of a HEIF file
+HEIFBrands = [b'heic', b'heix', b'heim', b'heis', b'hevc', b'hevx', b'mif1', b'msf1', b'avif']
+
+def isHEIFSignature(headerBytes) :
+    return headerBytes[4:8] == b'ftyp' and headerBytes[8:12] in HEIFBrands
+
+# Each box starts with:
+# - a 4-byte size (including the header), where 1 means a following 8-byte size is used and 0 means 'to the end'
+# - a 4-byte box type, e.g. 'meta'
+# Returns (box type, offset of the box contents, offset of the end of the box), or None if no complete box header
+def readBoxHeader(data, offset, endOffset) :
+    if offset + 8 > endOffset :
+        return None
+    boxSize, boxType = struct.unpack_from(">I4s", data, offset)
+    headerSize = 8
+    if boxSize == 1 :
+        if offset + 16 > endOffset :
+            return None
+        boxSize = struct.unpack_from(">Q", data, offset+8)[0]
+        headerSize = 16
+    elif boxSize == 0 :
+        boxSize = endOffset - offset
+    if boxSize < headerSize :
+        return None
+    return boxType, offset+headerSize, min(offset+boxSize, endOffset)
+
+# Produce (box type, contents offset, end offset) for each box between the offsets
+def boxes(data, offset, endOffset) :
+    while True :
+        header = readBoxHeader(data, offset, endOffset)
+        if header is None :
+            break
+        yield header
+        offset = header[2]
+
+def findBox(data, offset, endOffset, wantedType) :
+    for boxType, contentOffset, boxEndOffset in boxes(data, offset, endOffset) :
+        if boxType == wantedType :
+            return contentOffset, boxEndOffset
+    return None
+
+# Read a big-endian unsigned integer of 0, 2, 4 or 8 bytes, as used in the iloc box
+def readSizedInt(data, offset, size) :
+    return int.from_bytes(data[offset:offset+size], byteorder='big'), offset+size
+
+# Find the item ID of the Exif item from the 'iinf' (item information) box. This is a 'full box', with a 1-byte version
+# and 3 bytes of flags, then an item count and the 'infe' entries.
+def findExifItemID(meta, offset, endOffset) :
+    version = meta[offset]
+    countSize = 2 if version == 0 else 4
+    offset += 4 + countSize
+    for boxType, contentOffset, boxEndOffset in boxes(meta, offset, endOffset) :
+        if boxType != b'infe' :
+            continue
+        infeVersion = meta[contentOffset]
+        if infeVersion < 2 :
+            # Older forms of item info entry don't have an item type
+            continue
+        idSize = 2 if infeVersion == 2 else 4
+        itemID, p = readSizedInt(meta, contentOffset+4, idSize)
+        itemType = meta[p+2:p+6]
+        if itemType == b'Exif' :
+            return itemID
+    return None
+
+# Find the (construction method, list of (offset, length) extents) for an item from the 'iloc' (item location) box
+def findItemExtents(meta, offset, endOffset, wantedItemID) :
+    version = meta[offset]
+    sizes = meta[offset+4:offset+6]
+    offsetSize = sizes[0] >> 4
+    lengthSize = sizes[0] & 0x0F
+    baseOffsetSize = sizes[1] >> 4
+    indexSize = (sizes[1] & 0x0F) if version in [1, 2] else 0
+    p = offset+6
+    itemCount, p = readSizedInt(meta, p, 2 if version < 2 else 4)
+
+    for n in range(0, itemCount) :
+        if p >= endOffset :
+            break
+        itemID, p = readSizedInt(meta, p, 2 if version < 2 else 4)
+        constructionMethod = 0
+        if version in [1, 2] :
+            constructionMethod, p = readSizedInt(meta, p, 2)
+            constructionMethod &= 0x0F
+        dataReferenceIndex, p = readSizedInt(meta, p, 2)
+        baseOffset, p = readSizedInt(meta, p, baseOffsetSize)
+        extentCount, p = readSizedInt(meta, p, 2)
+        extents = []
+        for e in range(0, extentCount) :
+            if indexSize > 0 :
+                extentIndex, p = readSizedInt(meta, p, indexSize)
+            extentOffset, p = readSizedInt(meta, p, offsetSize)
+            extentLength, p = readSizedInt(meta, p, lengthSize)
+            extents.append( (baseOffset + extentOffset, extentLength) )
+        if itemID == wantedItemID :
+            return constructionMethod, extents
+    return None
+
+# Walk the top-level boxes of the file to find the 'meta' box, reading box headers only so that the (large) 'mdat'
+# box holding the image data is skipped over. Returns the bytes of the Exif item, or None if there isn't one.
+def readExifItem(f, fileSize) :
+    offset = 0
+    metaBytes = None
+    while offset < fileSize :
+        f.seek(offset)
+        headerBytes = f.read(16)
+        header = readBoxHeader(headerBytes, 0, fileSize-offset)
+        if header is None :
+            break
+        boxType, contentOffset, boxEndOffset = header
+        if boxType == b'meta' :
+            f.seek(offset)
+            metaBytes = f.read(boxEndOffset)
+            break
+        offset += boxEndOffset
+
+    if metaBytes is None :
+        return None
+
+    # 'meta' is a full box, skip the version/flags bytes
+    metaStart = contentOffset + 4
+    metaEnd = len(metaBytes)
+    iinf = findBox(metaBytes, metaStart, metaEnd, b'iinf')
+    iloc = findBox(metaBytes, metaStart, metaEnd, b'iloc')
+    if iinf is None or iloc is None :
+        return None
+
+    exifItemID = findExifItemID(metaBytes, iinf[0], iinf[1])
+    if exifItemID is None :
+        return None
+    location = findItemExtents(metaBytes, iloc[0], iloc[1], exifItemID)
+    if location is None :
+        return None
+
+    constructionMethod, extents = location
+    itemBytes = bytearray(0)
+    if constructionMethod == 0 :
+        # Offsets are within the file
+        for extentOffset, extentLength in extents :
+            f.seek(extentOffset)
+            itemBytes += f.read(extentLength)
+    elif constructionMethod == 1 :
+        # Offsets are within the 'idat' box of the meta box
+        idat = findBox(metaBytes, metaStart, metaEnd, b'idat')
+        if idat is None :
+            return None
+        for extentOffset, extentLength in extents :
+            itemBytes += metaBytes[idat[0]+extentOffset:idat[0]+extentOffset+extentLength]
+    else :
+        print("*** HEIF item construction method not handled:", constructionMethod, file=sys.stderr)
+        return None
+
+    return bytes(itemBytes)
+
+# If fileObject is passed in, the data is read from it rather than from the named file
+def processFile(filename, verbose=False, veryVerbose=False, fileObject=None) :
+
+    if verbose :
+        print("Reading from:", filename)
+
+    allTags = {}
+
+    with JPEG.OpenedFile(filename, fileObject) as f :
+        bytecount = f.seek(0, os.SEEK_END)
+        f.seek(0)
+        if not isHEIFSignature(f.read(12)) :
+            print("*** HEIF file type box not found in file:", filename, file=sys.stderr)
+        else :
+            exifItem = readExifItem(f, bytecount)
+            if exifItem is None :
+                if verbose :
+                    print("No Exif item found")
+            elif len(exifItem) >= 4 :
+                # First 4 bytes give the offset to the TIFF header, normally skipping an 'Exif\0\0' identifier
+                TIFFHeaderOffset = JPEG.bytesToInt(exifItem[0:4], 'big')
+                allTags = JPEG.processTIFF(exifItem[4+TIFFHeaderOffset:])
+
+    if verbose :
+        print("Extracted these IFDs from the Exif item:")
+        for n, d in allTags.items() :
+            print("- ", n, ":", len(d), "item(s)")
+
+    propertiesDict = {}
+    propertiesDict['filename'] = filename
+    propertiesDict['bytes'] = bytecount
+    JPEG.summariseTags(propertiesDict, allTags, verbose)
+
+    if veryVerbose :
+        import JPEGDisplay
+        JPEGDisplay.displayAllTags(allTags)
+
+    return propertiesDict
+
+#
+####################################
+#
+
+def main(filename) :
+
+    if not os.path.isfile(filename) :
+        print("***",  filename, "is not a file", file=sys.stderr)
+        return
+
+    veryVerbose = False  # For debugging
+    mainProperties = processFile(filename, True, veryVerbose)
+    import JPEGDisplay
+    JPEGDisplay.displayMainProperties(mainProperties)
+
+if __name__ == "__main__" :
+
+    if len(sys.argv) == 1 :
+        print("No filename command line argument provided")
+        exit()
+
+    filename = sys.argv[1]
+    main(filename)
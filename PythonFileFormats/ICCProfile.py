@@ -0,0 +1,105 @@
+# Extract the ICC colour profile information from an APP2 ICC_PROFILE segment of a JPEG file. Kept separate from
+# JPEG.py, which only imports it when an ICC profile segment is found.
+
+import sys
+
+import JPEG
+
+def processICCProfileSegment(info, segment) :
+
+    # http://www.color.org/specification/ICC1v43_2010-12.pdf 
+    # Appendix B.4 explains embedding mechanism for JPEGs, including:
+    # - the segment starts with "ICC_PROFILE" and then a NULL byte
+    # - followed by two bytes which indicate 'chunking', allowing the ICC Profile info to be split over more than one
+    #   JPEG segment if necessary.
+    #   - the first byte is the current chunk number
+    #   - the second byte is the total number of chunks
+    #   So both will be '1' if the ICC Profile info fits into a single JPEG APP segment
+    #   And the next 128 bytes are the Profile header info - see 7.2
+
+    ICC_ProfileString = "ICC_PROFILE"    
+    thisChunkNo = segment[len(ICC_ProfileString)+1]
+    totalChunks = segment[len(ICC_ProfileString)+2]
+
+    # ???? Check profile string is present 
+
+    if not (thisChunkNo == 1 and totalChunks == 1) :
+        print("*** ICC profile has more than one chunk:", thisChunkNo, totalChunks, file=sys.stderr)
+    
+    mainSegmentOffset = len(ICC_ProfileString)+3 
+    mainSegment = segment[mainSegmentOffset:]
+    header = mainSegment[mainSegmentOffset:mainSegmentOffset+128]
+
+    # Pull out fields from the header
+    profileSize = JPEG.bytesToInt(header[0:4], 'big')
+    preferredCMMtype = JPEG.bytesToInt(header[4:8], 'big')
+    profileVersion = header[8:12]
+    profileDeviceClass = header[12:16]
+    colourSpace = header[16:20]
+    profileConnectionSpace = header[20:24]
+    profileCreationDate = header[24:36]
+    acsp = header[36:40]
+    primaryPlatform= header[40:44]
+    profileFlags = header[44:48]
+    deviceManufacturer = header[48:52]
+    deviceModel = header[52:56]
+    deviceAttributes = header[56:64]
+    renderingIntent = header[64:68]
+    nCIEXYZIlluminant = header[68:80]
+    profileCreator = header[80:84]
+    profileID = header[84:100]
+    reservedBytes = header[100:128]
+
+    printOut = False
+    if printOut :
+        print("size", profileSize)
+        print("preferred type", preferredCMMtype)
+        print("version", profileVersion)
+        print("device class", profileDeviceClass)
+        print("colour space", colourSpace)
+        print("PCS", profileConnectionSpace)
+        print("profile date", profileCreationDate)
+        print("- y", JPEG.bytesToInt(profileCreationDate[0:2], 'big'))
+        print("- m", JPEG.bytesToInt(profileCreationDate[2:4], 'big'))
+        print("- d", JPEG.bytesToInt(profileCreationDate[4:6], 'big'))
+        print("- h", JPEG.bytesToInt(profileCreationDate[6:8], 'big'))
+        print("- m", JPEG.bytesToInt(profileCreationDate[8:10], 'big'))
+        print("- s", JPEG.bytesToInt(profileCreationDate[10:12], 'big'))
+        print("acsp", acsp)
+        print("platform", primaryPlatform)
+        print("flags", profileFlags)
+        print("manufacturer", deviceManufacturer)
+        print("model", deviceModel)
+        print("attributes", deviceAttributes)
+        print("intent", renderingIntent)
+        print("CIEXYZ illuminant", nCIEXYZIlluminant, nCIEXYZIlluminant[0:4], nCIEXYZIlluminant[4:8], nCIEXYZIlluminant[8:12])
+        print("creator", profileCreator)
+        print("profileID", profileID)
+        print("reserved", reservedBytes)
+
+    # Tag table consists of a 4-byte count 'n' and then n 12-byte entries:
+    # - 0-3 = tag signature
+    # - 4-7 = offset to tag data element
+    # - 8 - 11 = size in bytes of tag data element
+    tagTableOffset = 128
+    
+    tagTableLength = JPEG.bytesToInt(mainSegment[tagTableOffset:tagTableOffset+4], 'big')
+    # Only as many entries as there is data for, in case the count is damaged
+    tagTableLength = min(tagTableLength, max(0, (len(mainSegment) - tagTableOffset - 4) // 12))
+
+    for n in range(0, tagTableLength) :
+        tagEntryOffset = tagTableOffset+4 + 12*n
+        tagSignature = JPEG.bytesToASCIIString(mainSegment[tagEntryOffset+0:tagEntryOffset+4])
+        tagDataOffset = JPEG.bytesToInt(mainSegment[tagEntryOffset+4:tagEntryOffset+8], 'big')
+        tagDataSize = JPEG.bytesToInt(mainSegment[tagEntryOffset+8:tagEntryOffset+12], 'big')
+        tagData = mainSegment[tagDataOffset:tagDataOffset+tagDataSize]
+        if printOut :
+            print("Tag", n, tagSignature, tagDataOffset, tagDataSize)
+            print(".. ", tagData[0:150])
+    
+        # Each of these tag data items has its own structure for potential further examination ...
+
+    # Nothing found so far is general metadata about the image / device, all detailed image stuff. So
+    # don't add to the dictionary for now
+    dict = {}
+    return dict
@@ -0,0 +1,71 @@
+# Interning of values which repeat across many image files - camera make/model/software strings, common rational
+# values such as (72, 1) - so that the properties of a large batch of files held in memory share one copy of each
+# value rather than having a new object per file.
+#
+# - InternCache : a bounded cache with least-recently-used eviction, used when decoding tag values (see
+#   JPEG.bytesToASCIIString and JPEG.processIFDElement), so that repeated values aren't decoded again
+# - Categories : a dictionary of the distinct values of string properties, each with a small integer code, shared by
+#   all the files processed, for grouping and compact storage of batch output
+
+class InternCache :
+
+    def __init__(self, maxSize) :
+        self.maxSize = maxSize
+        # Relies on dictionaries keeping their insertion order: the least recently used entry is the first one
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+
+    # The cached value for key, or None if there isn't one
+    def lookup(self, key) :
+        value = self.values.pop(key, None)
+        if value is None :
+            self.misses += 1
+            return None
+        # Move to the most recently used end
+        self.values[key] = value
+        self.hits += 1
+        return value
+
+    # Cache the value for key, evicting the least recently used entry if the cache is full, and return the value
+    def add(self, key, value) :
+        if len(self.values) >= self.maxSize :
+            del self.values[next(iter(self.values))]
+        self.values[key] = value
+        return value
+
+    # For values which are their own keys, e.g. rational tuples: the cached equal value if there is one, otherwise
+    # value itself, which is then cached
+    def intern(self, value) :
+        cachedValue = self.lookup(value)
+        if cachedValue is None :
+            return self.add(value, value)
+        return cachedValue
+
+    def statistics(self) :
+        return {'size' : len(self.values), 'maxSize' : self.maxSize, 'hits' : self.hits, 'misses' : self.misses}
+
+class Categories :
+
+    def __init__(self, maxCategories=100000) :
+        self.maxCategories = maxCategories
+        self.codes = {}     # Value => code
+        self.values = []    # Code => value
+
+    # The code for a value, adding it as a new category if necessary. Returns None for a new value once there are
+    # maxCategories values, in which case the value isn't interned.
+    def code(self, value) :
+        code = self.codes.get(value)
+        if code is None and len(self.values) < self.maxCategories :
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def value(self, code) :
+        return self.values[code]
+
+    # The shared copy of a value
+    def intern(self, value) :
+        code = self.code(value)
+        return value if code is None else self.values[code]
@@ -1,7 +1,17 @@
+# Extract metadata from JPEG files. Only the core parsing is here; less commonly needed features are in separate
+# modules which are only imported when used (ICCProfile.py for ICC profile segments, JPEGDisplay.py for displaying the
+# results, JPEGSegmentIndex.py for segment index files), so that importing this module is quick.
+
 import sys
 import os
 
-import MapURLs  # My module for providing mapping URLs
+import Interning
+
+# Per-process caches of decoded tag values which repeat from file to file: short ASCII strings such as camera makes
+# and models (keyed on the raw bytes), and rational values
+ASCIIStringCache = Interning.InternCache(4096)
+maxCachedStringLength = 64
+rationalCache = Interning.InternCache(4096)
 
 # Convert a byte array to an unsigned integer
 def bytesToInt(bytes, alignmentIndicator, signed=False) :    
@@ -24,12 +34,23 @@ def bytesToASCIIString(bytes) :
     elif bytes[-1] == 0x00 :
         bytes = bytes[0:len(bytes)-1]
 
+    # Short strings are likely to be seen again, so look in the cache first
+    key = None
+    if len(bytes) <= maxCachedStringLength :
+        # As a bytes object, as the data can be a bytearray or memoryview (and the parameter name hides bytes())
+        key = b''.join([bytes])
+        s = ASCIIStringCache.lookup(key)
+        if s is not None :
+            return s
+
     try :
         s = bytes.decode()
     except Exception as e :
         # Not an ASCII string
         s = ""
 
+    if key is not None :
+        ASCIIStringCache.add(key, s)
     return s
 
 # Extract first n bytes up to a 0 byte, expect this to be an ASCII string identifying the type of App Segment, e.g. "Exif"
@@ -43,6 +64,25 @@ def getAppSegmentIdentifier(segment) :
 #        return ""
     return bytesToASCIIString(segment[0:n])
 
+# Context manager for reading from the named file, or from fileObject if one is passed in, e.g. an io.BytesIO holding
+# the file contents. (fileObject is left open.)
+class OpenedFile :
+
+    def __init__(self, filename, fileObject=None) :
+        self.filename = filename
+        self.fileObject = fileObject
+
+    def __enter__(self) :
+        if self.fileObject is None :
+            self.f = open(self.filename, "rb")
+            return self.f
+        return self.fileObject
+
+    def __exit__(self, excType, excValue, traceback) :
+        if self.fileObject is None :
+            self.f.close()
+        return False
+
 ##
 ###########################################################################
 ##
@@ -50,13 +90,30 @@ def getAppSegmentIdentifier(segment) :
 # Read the bytes related to a data segment which consists of 
 # - two bytes (big-endian) to indicate the length l in bytes of this segment (including these two bytes)
 # - the data bytes, l-2 of them
-# ???? Check for reads returning the expected number of bytes
+# A damaged length of less than 2 would make the read swallow the rest of the file, so nothing more is read, and a
+# segment cut short by the end of the file has fewer bytes - check with isCompleteSegment. (The length is None if the
+# file ends before the length bytes.)
 def readDataSegment(f) :
     lenBytes = f.read(2)
+    if len(lenBytes) < 2 :
+        return None, b''
     segmentLength = int.from_bytes(lenBytes, signed=False, byteorder='big')
+    if segmentLength < 2 :
+        return segmentLength, b''
     segmentBytes = f.read(segmentLength-2)
     return segmentLength, segmentBytes
 
+def isCompleteSegment(segmentLength, segmentBytes) :
+    return segmentLength is not None and segmentLength >= 2 and len(segmentBytes) == segmentLength - 2
+
+def describeIncompleteSegment(segmentLength) :
+    if segmentLength is None :
+        return "File ends within segment length bytes"
+    elif segmentLength < 2 :
+        return "Invalid segment length: " + str(segmentLength)
+    else :
+        return "File ends within segment of length: " + str(segmentLength)
+
 # 'Entropy coded' data segments are laid out differently
 # - no initial length bytes
 # - just data bytes
@@ -65,40 +122,175 @@ def readDataSegment(f) :
 #   the segment following this one.
 # - consequently we can only detect the end of the segment by reading beyond it to find the first
 #   <FF><non-00> 2-byte sequence, which we return to allow processing of the subsequent segment by the caller.
-# ???? Check for reads returning the expected number of bytes 
-def readEntropyCodedDataSegment(f) :
-    segmentLength = 0
-    dataBytes = f.read(1)
+# Rather than reading a byte at a time, the file is read in blocks which are searched for <FF> bytes, and the file
+# is then re-positioned to just after the next segment's marker bytes. Also returns the number of RST restart
+# markers found within the data, and if an array is passed in, appends the file offset of each RST marker to it.
+entropyCodedDataBlockSize = 64 * 1024
+
+def readEntropyCodedDataSegment(f, restartMarkerOffsets=None) :
     segmentData = []
     nextSegmentMarkerBytes = bytearray(0)
-    while dataBytes :
-        dataByte = dataBytes[0]
-        if dataByte != 0xFF :       # Normal data            
-            segmentLength += 1
-            segmentData.append(dataByte)
-        else :  # an <FF> - is it the start of the next segment, or does a following <00> indicate it is true data ?
-            nextDataBytes = f.read(1)
-            nextDataByte = nextDataBytes[0]
-            if nextDataByte == 0x00 :
-                # Stuffing, add the <FF> and <00> bytes to the segment length count and segment data 
-                # ???? Or remove the stuffing here ?
-                segmentLength += 2
-                segmentData.append(dataByte)
-                segmentData.append(nextDataByte)
-            elif nextDataByte >= 0xD0 and nextDataByte <= 0xD7 :
-                # An RST Restart marker within the encoded data segment, keeping going
-                segmentLength += 2
-                segmentData.append(dataByte)
-                segmentData.append(nextDataByte)
-            else :
-                # The <FF> is not part of the data, it is the start of the next segment
-                nextSegmentMarkerBytes = bytearray(2)
-                nextSegmentMarkerBytes[0] = 0xFF
-                nextSegmentMarkerBytes[1] = nextDataByte
+    restartMarkerCount = 0
+
+    blockOffset = f.tell()
+    block = f.read(entropyCodedDataBlockSize)
+    n = 0
+    while block :
+        n, count, nextDataByte = scanEntropyCodedData(block, n, restartMarkerOffsets, blockOffset)
+        restartMarkerCount += count
+        if nextDataByte is None :
+            # No <FF> in the rest of the block, or an <FF> as the last byte of the block, which can't be examined
+            # until the next byte has been read. Keep the data up to this point, and carry on with the next block.
+            keep = n
+            segmentData.append(block[0:keep])
+            nextBlock = f.read(entropyCodedDataBlockSize)
+            if not nextBlock :
+                # End of file
+                segmentData.append(block[keep:])
                 break
-        dataBytes = f.read(1)
+            blockOffset += keep
+            block = block[keep:] + nextBlock
+            n = 0
+            continue
+
+        # The <FF> is not part of the data, it is the start of the next segment
+        segmentData.append(block[0:n])
+        nextSegmentMarkerBytes = bytearray(2)
+        nextSegmentMarkerBytes[0] = 0xFF
+        nextSegmentMarkerBytes[1] = nextDataByte
+        f.seek(blockOffset+n+2)
+        break
+
+    segmentData = b''.join(segmentData)
+    return len(segmentData), segmentData, nextSegmentMarkerBytes, restartMarkerCount
+
+# Search a block of scan data from offset n for the <FF> of the marker which ends the scan, skipping stuffed <FF><00>
+# data bytes, fill bytes and RST markers. The file offset of each RST marker (blockOffset being the file offset of
+# the block) is appended to restartMarkerOffsets if it isn't None. Returns:
+# - the offset in the block of the <FF> of the marker, or if not found, of an <FF> which is the last byte of the
+#   block (so can't be examined yet), or else the length of the block
+# - the number of RST markers found
+# - the marker byte following the <FF>, or None if not found
+# (Replaced by the C version in _jpegaccel if it has been built, see BuildAccelerator.py.)
+def scanEntropyCodedData(block, n, restartMarkerOffsets, blockOffset) :
+    restartMarkerCount = 0
+    while True :
+        n = block.find(b'\xff', n)
+        if n < 0 :
+            return len(block), restartMarkerCount, None
+        if n == len(block)-1 :
+            return n, restartMarkerCount, None
+
+        nextDataByte = block[n+1]
+        if nextDataByte == 0x00 :
+            # Stuffing, the <FF> and <00> bytes are included in the segment length and segment data 
+            # ???? Or remove the stuffing here ?
+            n += 2
+        elif nextDataByte >= 0xD0 and nextDataByte <= 0xD7 :
+            # An RST Restart marker within the encoded data segment, keeping going
+            restartMarkerCount += 1
+            if restartMarkerOffsets is not None :
+                restartMarkerOffsets.append(blockOffset+n)
+            n += 2
+        elif nextDataByte == 0xFF :
+            # A 'fill' byte, which can precede a marker. Included in the segment data.
+            n += 1
+        else :
+            return n, restartMarkerCount, nextDataByte
+
+# Use the restart index of a scan (see processFile) to find where decoding of the scan data can start in order to
+# decode a particular MCU (Minimum Coded Unit), without reading the scan data from the start. Decoding can restart
+# immediately after each RST marker, which follows every 'restart interval' MCUs.
+# Returns the file offset to start decoding at, and the number of the first MCU decoded from there.
+def restartPositionForMCU(scanInfo, MCUNumber) :
+    restartInterval = scanInfo['restartInterval'] if 'restartInterval' in scanInfo else 0
+    restartMarkerOffsets = scanInfo['restartMarkerOffsets'] if 'restartMarkerOffsets' in scanInfo else []
+    if restartInterval == 0 or MCUNumber < restartInterval or len(restartMarkerOffsets) == 0 :
+        return scanInfo['dataOffset'], 0
+
+    # RST marker k (counting from 0) follows MCU number (k+1)*restartInterval - 1
+    k = min(MCUNumber // restartInterval - 1, len(restartMarkerOffsets) - 1)
+    return restartMarkerOffsets[k] + 2, (k+1) * restartInterval
+
+# Segment type names for individual marker bytes, see https://www.w3.org/Graphics/JPEG/itu-t81.pdf Table B.1
+# Markers in the APPn, RSTn, SOFn and JPGn ranges are named by segmentTypeForMarker.
+namedMarkers = {
+    0x01 : 'TEM',
+    0xC4 : 'DHT',
+    0xC8 : 'JPG',
+    0xCC : 'DAC',
+    0xD8 : 'SOI',
+    0xD9 : 'EOI',
+    0xDA : 'SOS',
+    0xDB : 'DQT',
+    0xDC : 'DNL',
+    0xDD : 'DRI',
+    0xDE : 'DHP',
+    0xDF : 'EXP',
+    0xFE : 'COM'
+}
+
+# Markers which stand alone, without any following length bytes or data
+standaloneMarkers = [0x01, 0xD8, 0xD9, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7]
+
+# The coding process indicated by each of the SOFn (Start Of Frame) markers
+frameEncodings = {
+    0xC0 : 'Baseline',
+    0xC1 : 'Extended sequential',
+    0xC2 : 'Progressive',
+    0xC3 : 'Lossless',
+    0xC5 : 'Differential sequential',
+    0xC6 : 'Differential progressive',
+    0xC7 : 'Differential lossless',
+    0xC9 : 'Extended sequential, arithmetic',
+    0xCA : 'Progressive, arithmetic',
+    0xCB : 'Lossless, arithmetic',
+    0xCD : 'Differential sequential, arithmetic',
+    0xCE : 'Differential progressive, arithmetic',
+    0xCF : 'Differential lossless, arithmetic'
+}
+
+# Returns None for marker bytes which aren't valid (<00> and <FF>)
+def segmentTypeForMarker(markerByte) :
+    if markerByte in namedMarkers :
+        return namedMarkers[markerByte]
+    elif markerByte >= 0xE0 and markerByte <= 0xEF :
+        return 'APP' + str(markerByte-0xE0)
+    elif markerByte >= 0xD0 and markerByte <= 0xD7 :
+        return 'RST' + str(markerByte-0xD0)
+    elif markerByte >= 0xC0 and markerByte <= 0xCF :
+        return 'SOF' + str(markerByte-0xC0)
+    elif markerByte >= 0xF0 and markerByte <= 0xFD :
+        return 'JPG' + str(markerByte-0xF0)
+    elif markerByte >= 0x02 and markerByte <= 0xBF :
+        return 'RES'
+    else :
+        return None
+
+# The SOS (Start Of Scan) segment header, before the entropy coded data, consists of:
+# - 1 byte count of components in the scan
+# - for each component, a 1 byte component identifier and 1 byte with the DC/AC Huffman table numbers
+# - 1 byte start of spectral selection, 1 byte end of spectral selection
+# - 1 byte with the successive approximation high/low bit positions
+# For a progressive image, each scan handles part of the spectrum and/or some of the bits of the coefficients.
+def processSOSHeader(segment) :
+    if len(segment) < 1 or len(segment) < 1 + 2*segment[0] + 3 :
+        print("*** SOS segment header size not as expected:", len(segment), file=sys.stderr)
+        return {}
+
+    componentCount = segment[0]
+    components = []
+    for n in range(0, componentCount) :
+        components.append( (segment[1+2*n], segment[2+2*n] >> 4, segment[2+2*n] & 0x0F) )
+    p = 1 + 2*componentCount
 
-    return segmentLength, segmentData, nextSegmentMarkerBytes
+    dict = {}
+    dict['components'] = components
+    dict['spectralStart'] = segment[p]
+    dict['spectralEnd'] = segment[p+1]
+    dict['approximationHigh'] = segment[p+2] >> 4
+    dict['approximationLow'] = segment[p+2] & 0x0F
+    return dict
 
 #
 #############################################
@@ -110,17 +302,25 @@ def processExifSegment(info, segment) :
     # Expect first six bytes to be 'Exif\x00\x00'
     ExifIdentifierLength = 6
     Exif = "Exif"
-    if not (segment[0] == Exif.encode()[0] and segment[1] == Exif.encode()[1] and segment[2] == Exif.encode()[2] and segment[3] == Exif.encode()[3] and segment[4] == 0 and segment[5] == 0) :
+    if len(segment) < ExifIdentifierLength or not (segment[0] == Exif.encode()[0] and segment[1] == Exif.encode()[1] and segment[2] == Exif.encode()[2] and segment[3] == Exif.encode()[3] and segment[4] == 0 and segment[5] == 0) :
         print("*** Exif segment header format not as expected:", segment[0:10], file=sys.stderr)
         return
 
     # The rest is TIFF format content
-    TIFF = segment[ExifIdentifierLength:]
+    return processTIFF(segment[ExifIdentifierLength:])
+
+# Extract the IFDs from TIFF format content, as found in an Exif segment, or making up the whole of a TIFF file (including
+# camera 'raw' formats such as DNG), or in an Exif item of a HEIF file. Returns a dictionary keyed on IFD name.
+def processTIFF(TIFF) :
+
     TIFFHeader = TIFF[0:8]
 
     # - 2 bytes to define the multi-byte number byte alignment indicator 'MM' (Motorola) = big-endian, 'II' (Intel) = little-endian
     byteAlignmentIndicator = bytesToASCIIString(TIFFHeader[0:2])
     #print(byteAlignmentIndicator)
+    if byteAlignmentIndicator not in ["MM", "II"] :
+        print("*** TIFF header format not as expected:", TIFFHeader, file=sys.stderr)
+        return {}
     # - 2 bytes to show TIFF version - expect this to always be set to integer value 0x2A = 42
     TIFFVersion = bytesToInt(TIFFHeader[2:4], byteAlignmentIndicator)
     #print(TIFFVersion)
@@ -128,13 +328,24 @@ def processExifSegment(info, segment) :
     firstIFDOffset = bytesToInt(TIFFHeader[4:8], byteAlignmentIndicator) 
     #print(firstIFDOffset)
 
+    if TIFFVersion != 42 :
+        print("*** TIFF header format not as expected:", TIFFHeader, file=sys.stderr)
+        return {}
+
     nextIFDOffset = firstIFDOffset
     IFDCount = 0
 
     # Dictionary to record each IFD, keyed an IFD name, storing the detailed IFD dictionary as the value
     dict = {}
 
+    # In a damaged file, the chain can loop back to an IFD already read, or point beyond the data
+    IFDOffsetsRead = set()
+
     while nextIFDOffset != 0 :
+        if nextIFDOffset in IFDOffsetsRead or nextIFDOffset >= len(TIFF) :
+            print("*** Invalid next IFD offset:", nextIFDOffset, "after IFD", IFDCount-1, file=sys.stderr)
+            break
+        IFDOffsetsRead.add(nextIFDOffset)
         IFDname = "IFD" + str(IFDCount)
         #print("Handling main chain IFD:", IFDname)
         IFDentries, nextIFDOffset = processIFD(TIFF, nextIFDOffset, byteAlignmentIndicator)
@@ -154,6 +365,11 @@ def processExifSegment(info, segment) :
                 if embeddedIFDtag in d and embeddedIFDname not in dict:
                     IFDname = embeddedIFDname
                     embeddedIFDOffset = d[embeddedIFDtag]['value']
+                    # In a damaged file, the offset can be negative (a signed format), beyond the data, or not a
+                    # single number
+                    if type(embeddedIFDOffset) is not int or not 0 <= embeddedIFDOffset < len(TIFF) :
+                        print("*** Invalid", embeddedIFDname, "IFD offset:", embeddedIFDOffset, file=sys.stderr)
+                        continue
                     embeddedIFDentries, nextIFDOffset = processIFD(TIFF, embeddedIFDOffset, byteAlignmentIndicator)
                     # Put info about embedded IFD onto a list, we can't put it directly in the main dictionary
                     # while looping over the dictionary,
@@ -201,22 +417,24 @@ def processIFD(TIFF, IFDOffset, byteAlignmentIndicator) :
         # List of dictionaries for output, one per IFD element
         IFDEntries = {}
 
-        IFDBytes = TIFF[IFDOffset:]
         # 2 byte value indicating the number of elements
-        elementCount = bytesToInt(IFDBytes[0:2], byteAlignmentIndicator)
+        elementCount = bytesToInt(TIFF[IFDOffset:IFDOffset+2], byteAlignmentIndicator)
         # Bytes containing the 12-byte entries
         elementSize = 12
-        elementBytes = IFDBytes[2:elementSize*elementCount+2]
+
+        # Only as many elements as there is data for, in case the count is damaged
+        if IFDOffset+2+elementSize*elementCount > len(TIFF) :
+            print("*** IFD element count beyond end of data:", elementCount, "at offset", IFDOffset, file=sys.stderr)
+            elementCount = max(0, (len(TIFF) - IFDOffset - 2) // elementSize)
 
         # Then n IFD elements
-        for n in range (0, elementCount) :
-            thisElementBytes = elementBytes[elementSize*n : elementSize*(n+1)]
-            element = processIFDElement(n, thisElementBytes, TIFF, byteAlignmentIndicator)
+        for n, (tag, dataFormat, componentCount, dataBytes, dataBytesAsOffset) in enumerate(unpackIFDEntries(TIFF, IFDOffset, elementCount, byteAlignmentIndicator)) :
+            element = processIFDEntry(n, tag, dataFormat, componentCount, dataBytes, dataBytesAsOffset, TIFF, byteAlignmentIndicator)
             addToIFDDictionary (IFDEntries, element)
     
         # The final four bytes are either an offset to the next IFD in the chain, or 0000 if no more IFDs in this chain
-        nextOffsetBytesPosition = 2+elementSize*elementCount
-        nextIFDOffsetBytes = IFDBytes[nextOffsetBytesPosition: nextOffsetBytesPosition+4]
+        nextOffsetBytesPosition = IFDOffset+2+elementSize*elementCount
+        nextIFDOffsetBytes = TIFF[nextOffsetBytesPosition: nextOffsetBytesPosition+4]
         nextIFDOffset = bytesToInt(nextIFDOffsetBytes, byteAlignmentIndicator)
 
         # Return the list of extracted IFD details, and the offset of the next IFD in this chain
@@ -235,9 +453,39 @@ def processIFDElement(elementNo, element, TIFF, byteAlignmentIndicator) :
     componentCount = bytesToInt(element[4:8], byteAlignmentIndicator)
     dataBytes = element[8:12]
     dataBytesAsOffset = bytesToInt(dataBytes, byteAlignmentIndicator)
+    return processIFDEntry(elementNo, tag, dataFormat, componentCount, dataBytes, dataBytesAsOffset, TIFF, byteAlignmentIndicator)
+
+# Unpack the 12-byte elements of the IFD at IFDOffset, as (tag, format, count, value/offset bytes, value/offset as an
+# integer) tuples. Elements cut short by the end of the TIFF data have the bytes that are there.
+# (Replaced by the C version in _jpegaccel if it has been built, see BuildAccelerator.py.)
+def unpackIFDEntries(TIFF, IFDOffset, elementCount, byteAlignmentIndicator) :
+    # A negative offset would slice from the end of the data
+    if IFDOffset < 0 :
+        raise ValueError("IFD offset must not be negative")
+    entries = []
+    for n in range (0, elementCount) :
+        elementOffset = IFDOffset+2+12*n
+        element = TIFF[elementOffset:elementOffset+12]
+        dataBytes = element[8:12]
+        entries.append( (bytesToInt(element[0:2], byteAlignmentIndicator), bytesToInt(element[2:4], byteAlignmentIndicator),
+                            bytesToInt(element[4:8], byteAlignmentIndicator), dataBytes, bytesToInt(dataBytes, byteAlignmentIndicator)) )
+    return entries
+
+# Bytes per component of the IFD data formats handled
+componentSizes = { 1 : 1, 2 : 1, 3 : 2, 4 : 4, 5 : 8, 7 : 1, 9 : 4, 10 : 8 }
+
+def processIFDEntry(elementNo, tag, dataFormat, componentCount, dataBytes, dataBytesAsOffset, TIFF, byteAlignmentIndicator) :
 
     implemented = True
     dataValue = "-"
+
+    # Values which don't fit in the 4 data bytes are held elsewhere in the TIFF data. A damaged component count can be
+    # huge, so only read as many components as the data holds.
+    valueCount = componentCount
+    componentSize = componentSizes.get(dataFormat, 1)
+    if componentCount * componentSize > 4 and dataBytesAsOffset + componentCount * componentSize > len(TIFF) :
+        valueCount = max(0, (len(TIFF) - dataBytesAsOffset) // componentSize)
+        print("*** IFD component count beyond end of data: IFD item no:", elementNo, "tag:", tag, ", num:", componentCount, ", offset:", dataBytesAsOffset, file=sys.stderr)
     # 1 = unsigned byte, 1 byte per component, not implemented
     if dataFormat == 1 :
         if componentCount == 1 :
@@ -248,7 +496,7 @@ def processIFDElement(elementNo, element, TIFF, byteAlignmentIndicator) :
                 dataValue.append(bytesToInt(dataBytes[i:i+1], byteAlignmentIndicator))
         elif componentCount > 4 :
             dataValue = []
-            for i in range (0, componentCount) :
+            for i in range (0, valueCount) :
                 offset = dataBytesAsOffset + i
                 dataValue.append(bytesToInt(TIFF[offset:offset+1], byteAlignmentIndicator))
         #print(".. IFD item no:", elementNo, "tag:", tag, ", dataFormat:", dataFormat, "(ubyte), num:", componentCount, ", val:", dataValue)
@@ -267,7 +515,7 @@ def processIFDElement(elementNo, element, TIFF, byteAlignmentIndicator) :
             dataValue = [ bytesToInt(dataBytes[0:2], byteAlignmentIndicator), bytesToInt(dataBytes[2:4], byteAlignmentIndicator) ]
         elif componentCount > 2 :
             dataValue = []
-            for i in range (0, componentCount) :
+            for i in range (0, valueCount) :
                 offset = dataBytesAsOffset + i*2
                 dataValue.append(bytesToInt(TIFF[offset:offset+2], byteAlignmentIndicator))
         #print(".. IFD item no:", elementNo, "tag:", tag, ", dataFormat:", dataFormat, "(ushort), num:", componentCount, ", val:", dataValue)
@@ -279,7 +527,7 @@ def processIFDElement(elementNo, element, TIFF, byteAlignmentIndicator) :
             dataValue = bytesToInt(dataBytes[0:4], byteAlignmentIndicator, signed)
         elif componentCount > 1 :
             dataValue = []
-            for i in range (0, componentCount) :
+            for i in range (0, valueCount) :
                 offset = dataBytesAsOffset + i*4
                 dataValue.append(bytesToInt(TIFF[offset:offset+2], byteAlignmentIndicator, signed))
         #print(".. IFD item no:", elementNo, "tag:", tag, ", dataFormat:", dataFormat, desc, ", num:", componentCount, ", val:", dataValue)
@@ -287,13 +535,14 @@ def processIFDElement(elementNo, element, TIFF, byteAlignmentIndicator) :
         signed = dataFormat == 10
         desc = "(urational)" if dataFormat == 5 else "(rational)"
         values = []
-        for i in range (0, componentCount) :
+        for i in range (0, valueCount) :
             offset = dataBytesAsOffset + i*8
             numerator = bytesToInt(TIFF[offset:offset+4], byteAlignmentIndicator, signed)
             denominator = bytesToInt(TIFF[offset+4:offset+8], byteAlignmentIndicator, signed)
-            values.append( (numerator, denominator) )
+            values.append(rationalCache.intern( (numerator, denominator) ))
         if componentCount == 1 :
-            dataValue = values[0]
+            # (0, 0) as for any other value beyond the end of the data
+            dataValue = values[0] if values else (0, 0)
         else :
             dataValue = values
         #print(".. IFD item no:", elementNo, "tag:", tag, ", dataFormat:", dataFormat, desc, ", num:", componentCount, ", val:", dataValue)
@@ -307,7 +556,7 @@ def processIFDElement(elementNo, element, TIFF, byteAlignmentIndicator) :
                 dataValue.append(dataBytes[i:i+1])
         elif componentCount > 4 :
             dataValue = []
-            for i in range (0, componentCount) :
+            for i in range (0, valueCount) :
                 offset = dataBytesAsOffset + i
                 dataValue.append(TIFF[offset:offset+1])
         #print(".. IFD item no:", elementNo, "tag:", tag, ", dataFormat:", dataFormat, "(undefined), num:", componentCount, ", val:", dataValue[0:12])        
@@ -335,7 +584,7 @@ def processIFDElement(elementNo, element, TIFF, byteAlignmentIndicator) :
 def processJFIFSegment(info, segment) :
     
     JFIF = "JFIF"
-    if not (segment[0] == JFIF.encode()[0] and segment[1] == JFIF.encode()[1] and segment[2] == JFIF.encode()[2] and segment[3] == JFIF.encode()[3] and segment[4] == 0) :
+    if len(segment) < 5 or not (segment[0] == JFIF.encode()[0] and segment[1] == JFIF.encode()[1] and segment[2] == JFIF.encode()[2] and segment[3] == JFIF.encode()[3] and segment[4] == 0) :
         print("*** JFIF segment header format not as expected:", segment[0:10], file=sys.stderr)
         return
 
@@ -365,120 +614,25 @@ def processJFIFSegment(info, segment) :
 
     return dict
 
-#
-#############################################
-#
-
-def processICCProfileSegment(info, segment) :
-
-    # http://www.color.org/specification/ICC1v43_2010-12.pdf 
-    # Appendix B.4 explains embedding mechanism for JPEGs, including:
-    # - the segment starts with "ICC_PROFILE" and then a NULL byte
-    # - followed by two bytes which indicate 'chunking', allowing the ICC Profile info to be split over more than one
-    #   JPEG segment if necessary.
-    #   - the first byte is the current chunk number
-    #   - the second byte is the total number of chunks
-    #   So both will be '1' if the ICC Profile info fits into a single JPEG APP segment
-    #   And the next 128 bytes are the Profile header info - see 7.2
-
-    ICC_ProfileString = "ICC_PROFILE"    
-    thisChunkNo = segment[len(ICC_ProfileString)+1]
-    totalChunks = segment[len(ICC_ProfileString)+2]
-
-    # ???? Check profile string is present 
-
-    if not (thisChunkNo == 1 and totalChunks == 1) :
-        print("*** ICC profile has more than one chunk:", thisChunkNo, totalChunks, file=sys.stderr)
-    
-    mainSegmentOffset = len(ICC_ProfileString)+3 
-    mainSegment = segment[mainSegmentOffset:]
-    header = mainSegment[mainSegmentOffset:mainSegmentOffset+128]
-
-    # Pull out fields from the header
-    profileSize = bytesToInt(header[0:4], 'big')
-    preferredCMMtype = bytesToInt(header[4:8], 'big')
-    profileVersion = header[8:12]
-    profileDeviceClass = header[12:16]
-    colourSpace = header[16:20]
-    profileConnectionSpace = header[20:24]
-    profileCreationDate = header[24:36]
-    acsp = header[36:40]
-    primaryPlatform= header[40:44]
-    profileFlags = header[44:48]
-    deviceManufacturer = header[48:52]
-    deviceModel = header[52:56]
-    deviceAttributes = header[56:64]
-    renderingIntent = header[64:68]
-    nCIEXYZIlluminant = header[68:80]
-    profileCreator = header[80:84]
-    profileID = header[84:100]
-    reservedBytes = header[100:128]
-
-    printOut = False
-    if printOut :
-        print("size", profileSize)
-        print("preferred type", preferredCMMtype)
-        print("version", profileVersion)
-        print("device class", profileDeviceClass)
-        print("colour space", colourSpace)
-        print("PCS", profileConnectionSpace)
-        print("profile date", profileCreationDate)
-        print("- y", bytesToInt(profileCreationDate[0:2], 'big'))
-        print("- m", bytesToInt(profileCreationDate[2:4], 'big'))
-        print("- d", bytesToInt(profileCreationDate[4:6], 'big'))
-        print("- h", bytesToInt(profileCreationDate[6:8], 'big'))
-        print("- m", bytesToInt(profileCreationDate[8:10], 'big'))
-        print("- s", bytesToInt(profileCreationDate[10:12], 'big'))
-        print("acsp", acsp)
-        print("platform", primaryPlatform)
-        print("flags", profileFlags)
-        print("manufacturer", deviceManufacturer)
-        print("model", deviceModel)
-        print("attributes", deviceAttributes)
-        print("intent", renderingIntent)
-        print("CIEXYZ illuminant", nCIEXYZIlluminant, nCIEXYZIlluminant[0:4], nCIEXYZIlluminant[4:8], nCIEXYZIlluminant[8:12])
-        print("creator", profileCreator)
-        print("profileID", profileID)
-        print("reserved", reservedBytes)
-
-    # Tag table consists of a 4-byte count 'n' and then n 12-byte entries:
-    # - 0-3 = tag signature
-    # - 4-7 = offset to tag data element
-    # - 8 - 11 = size in bytes of tag data element
-    tagTableOffset = 128
-    
-    tagTableLength = bytesToInt(mainSegment[tagTableOffset:tagTableOffset+4], 'big')
-
-    for n in range(0, tagTableLength) :
-        tagEntryOffset = tagTableOffset+4 + 12*n
-        tagSignature = bytesToASCIIString(mainSegment[tagEntryOffset+0:tagEntryOffset+4])
-        tagDataOffset = bytesToInt(mainSegment[tagEntryOffset+4:tagEntryOffset+8], 'big')
-        tagDataSize = bytesToInt(mainSegment[tagEntryOffset+8:tagEntryOffset+12], 'big')
-        tagData = mainSegment[tagDataOffset:tagDataOffset+tagDataSize]
-        if printOut :
-            print("Tag", n, tagSignature, tagDataOffset, tagDataSize)
-            print(".. ", tagData[0:150])
-    
-        # Each of these tag data items has its own structure for potential further examination ...
-
-    # Nothing found so far is general metadata about the image / device, all detailed image stuff. So
-    # don't add to the dictionary for now
-    dict = {}
-    return dict
-
 ##
 ###########################################################################
 ##
 
+# Degrees, minutes and seconds as three rationals
+def isLatLongValue(latLongTuples) :
+    return (type(latLongTuples) is list and len(latLongTuples) == 3 and
+                all(type(t) is tuple and len(t) == 2 and type(t[0]) is int and type(t[1]) is int for t in latLongTuples))
+
+# Returns None if the value isn't as expected
 def latLongAsStringNumber(NSEW, latLongTuples, fromGPS) :
     s = ""
     n = 0
     # Check format
     if not NSEW in ["N", "S", "E", "W"] :
         print("*** Unexpected direction indicator:", NSEW, file=sys.stderr)
-    elif len(latLongTuples) != 3 :
+    elif not isLatLongValue(latLongTuples) :
         print("*** Unexpected latitude/longitude value:", latLongTuples, file=sys.stderr)
-    elif (latLongTuples[0][1] != 1) or (latLongTuples[1][1] != 1) :
+    elif (latLongTuples[0][1] != 1) or (latLongTuples[1][1] != 1) or (latLongTuples[2][1] == 0) :
         print("*** Unexpected latitude/longitude value:", latLongTuples, file=sys.stderr)
     else :
         degrees = latLongTuples[0][0] 
@@ -527,9 +681,14 @@ def summariseTags(propertiesDict, allTags, verbose) :
         if 4 in GPSTags :
             longitude = GPSTags[4]['value']
 
+        latitudeResult = None
+        longitudeResult = None
         if NS and latitude and EW and longitude :
-            sLatitude, nLatitude = latLongAsStringNumber(NS, latitude, fromGPS)
-            sLongitude, nLongitude = latLongAsStringNumber(EW, longitude, fromGPS)
+            latitudeResult = latLongAsStringNumber(NS, latitude, fromGPS)
+            longitudeResult = latLongAsStringNumber(EW, longitude, fromGPS)
+        if latitudeResult is not None and longitudeResult is not None :
+            sLatitude, nLatitude = latitudeResult
+            sLongitude, nLongitude = longitudeResult
             propertiesDict['latitude'] = nLatitude
             propertiesDict['longitude'] = nLongitude
             propertiesDict['latitudetext'] = sLatitude
@@ -538,8 +697,9 @@ def summariseTags(propertiesDict, allTags, verbose) :
 
         if fromGPS and 6 in GPSTags :
             altitudeTuple = GPSTags[6]['value']
-            altitude = round(altitudeTuple[0]/altitudeTuple[1], -2)
-            propertiesDict['altitude'] = altitude
+            if type(altitudeTuple) is tuple and len(altitudeTuple) == 2 and altitudeTuple[1] != 0 :
+                altitude = round(altitudeTuple[0]/altitudeTuple[1], -2)
+                propertiesDict['altitude'] = altitude
 
         # for k,d in GPSTags.items() :
         #    print(k, d)
@@ -549,7 +709,8 @@ def summariseTags(propertiesDict, allTags, verbose) :
         #for k,d in IFD0Tags.items() :
         #    print(k, d)
 
-        if 306 in IFD0Tags :
+        # A damaged tag can have a value which isn't a string
+        if 306 in IFD0Tags and isinstance(IFD0Tags[306]['value'], str) :
             timestamp = IFD0Tags[306]['value']
             if timestamp[0:4] != "0000" :
                 propertiesDict['timestamp'] = timestamp
@@ -590,7 +751,7 @@ def summariseTags(propertiesDict, allTags, verbose) :
 
         # Alternative timestamp field
         if not 'timestamp' in propertiesDict :
-            if 36867 in ExifTags :
+            if 36867 in ExifTags and isinstance(ExifTags[36867]['value'], str) :
                 timestamp = ExifTags[36867]['value']
                 if timestamp[0:4] != "0000" :
                     propertiesDict['timestamp'] = timestamp
@@ -598,10 +759,24 @@ def summariseTags(propertiesDict, allTags, verbose) :
         if 'timestamp' in propertiesDict :
             # Replace colons in date part with hyphen: 2018:09:16 11:21:18  =>  2018-09-16 11:21:18
             # Can't change an immutable string so have to create another one
-            if timestamp[4] == ':' and timestamp[7] == ':' :
+            # (Sliced, as a damaged timestamp can be shorter)
+            timestamp = propertiesDict['timestamp']
+            if timestamp[4:5] == ':' and timestamp[7:8] == ':' :
                 modifiedTimeStamp = "{0:s}-{1:s}-{2:s}".format(timestamp[:4], timestamp[5:7], timestamp[8:])
                 propertiesDict['timestamp'] = modifiedTimeStamp
 
+        # When the photo was originally taken, which (unlike the IFD0 timestamp) editing software leaves alone, with
+        # the fraction of a second
+        if 36867 in ExifTags and isinstance(ExifTags[36867]['value'], str) :
+            originalTimestamp = ExifTags[36867]['value']
+            if originalTimestamp[0:4] != "0000" :
+                if originalTimestamp[4:5] == ':' and originalTimestamp[7:8] == ':' :
+                    originalTimestamp = "{0:s}-{1:s}-{2:s}".format(originalTimestamp[:4], originalTimestamp[5:7], originalTimestamp[8:])
+                propertiesDict['originalTimestamp'] = originalTimestamp
+
+        if 37521 in ExifTags and isinstance(ExifTags[37521]['value'], str) :
+            propertiesDict['subSecond'] = ExifTags[37521]['value'].strip()
+
         # Exif segment includes
         # 33434 Exposure
         # 33437 F no
@@ -612,59 +787,22 @@ def summariseTags(propertiesDict, allTags, verbose) :
         # 37385 flash
         # 37386 focal length mm
 
-
-def displayMainProperties(mainProperties) :
-
-    print()
-
-    if 'latitude' in mainProperties :
-        latitude = mainProperties['latitude']
-        longitude = mainProperties['longitude']
-        print("Latitude:", mainProperties['latitudetext'], " = ", latitude)
-        print("Longitude:", mainProperties['longitudetext'], " = ", longitude)
-
-        # Maps seem to use a common zoom level domain. 
-        # https://wiki.openstreetmap.org/wiki/Zoom_levels
-        zoomLevel = 16
-
-        print("OS Maps URL:", MapURLs.urlForOrdnanceSurveyMaps(latitude, longitude, zoomLevel))
-        print("OpenStreetMap URL:", MapURLs.urlForOpenStreetMaps(latitude, longitude, zoomLevel))
-        print("Google Maps URL (with pin):", MapURLs.urlForGoogleMaps(latitude, longitude, zoomLevel))
-        print("Google Maps URL (satellite):", MapURLs.urlForGoogleMaps2(latitude, longitude, zoomLevel, "satellite"))
-        print("Google Maps URL (street view):", MapURLs.urlForGoogleMapsStreetView(latitude, longitude))
-        print("Bing Maps URL (aerial view):", MapURLs.urlForBingMaps(latitude, longitude, zoomLevel, "a"))
-
-    if 'altitude' in mainProperties :
-        print("Rough Altitude:", "{0:.0f} m".format(mainProperties['altitude']))
-
-    if 'timestamp' in mainProperties :
-        print("Timestamp:", mainProperties['timestamp'], "GMT")
-
-    if 'columns' in mainProperties :
-        print("Size:", mainProperties['columns'], "x", mainProperties['rows'], "pixels")
-
-    if 'make' in mainProperties :
-        print("Make:", mainProperties['make'])
-
-    if 'model' in mainProperties :
-        print("Model:", mainProperties['model'])
-
-    if 'software' in mainProperties :
-        print("Software:", mainProperties['software'])
 ##
 ###########################################################################
 ##
 
-def displayAllTags(allTags) :
-    print("#############################################")
-    for n,dict in allTags.items() :
-        print(n)
-        for k,v in dict.items() :
-            #print(k, v)
-            print(k, v)
-    print("#############################################")
-
-def processFile(filename, verbose=False, veryVerbose=False) :
+# If writeIndex is set, the list of segments found is saved to a sidecar index file (see JPEGSegmentIndex.py)
+# If restartIndex is set (or writeIndex), the segment info for each scan includes a 'restart index': the file offset
+# of every RST marker in the scan data, held as an array('Q'), together with the DRI restart interval.
+# If fileObject is passed in (e.g. an io.BytesIO holding the file contents), the data is read from it rather than
+# from the named file, and the filename is just used to identify the data.
+# If headerOnly is set, reading stops at the first SOS marker: the metadata segments all come before the scan data,
+# so only the start of the file is needed (e.g. just the leading bytes of a file in an archive). The number of scans
+# isn't known in this case, and the 'bytes' property is only the length of the part of the file read. When reading
+# from the named file, the reads are planned to read the whole header at once where possible, see ReadPlanner.py.
+# If status is passed in (a dictionary), it is filled in with how the read went: 'aborted' if the read stopped at
+# damaged data, and 'complete' if the end of the image (or with headerOnly, the first scan) was reached.
+def processFile(filename, verbose=False, veryVerbose=False, writeIndex=False, restartIndex=False, fileObject=None, headerOnly=False, status=None) :
 
     if verbose :
         print("Reading from:", filename)
@@ -673,12 +811,23 @@ def processFile(filename, verbose=False, veryVerbose=False) :
     aborted = False
     SOIFound = False
     EOIFound = False
+    SOSFound = False
+
+    # Encoding characteristics
+    encoding = None
+    restartInterval = None
+    scanCount = 0
 
     # Lists with an entry for each segment found. 
     segmentsInfo = []
     segmentsData = []
 
-    with open(filename, "rb") as f:
+    with OpenedFile(filename, fileObject) as f:
+
+        if headerOnly and fileObject is None :
+            import io
+            import ReadPlanner
+            f = io.BytesIO(ReadPlanner.readHeader(f, key=os.path.dirname(filename)))
 
         # Each time round the read loop try to process a complete segment, with the segment starting with a two byte marker <FF><xx>.
         
@@ -700,6 +849,14 @@ def processFile(filename, verbose=False, veryVerbose=False) :
                 aborted = True
                 break
 
+            # <FF> 'fill' bytes can precede a marker
+            while bytes[1] == 0xFF :
+                nextByte = f.read(1)
+                if not nextByte :
+                    break
+                bytecount += 1
+                bytes = b'\xff' + nextByte
+
             markerByteDetail = bytes[1]
             # print("Read marker bytes ", bytes, " at ", bytecount)
                     
@@ -716,57 +873,70 @@ def processFile(filename, verbose=False, veryVerbose=False) :
             
             appSegmentIdentifier = ""
 
-            # NB No switch statement in Python!
-            if markerByteDetail == 0xD8 :
-                segmentType = 'SOI'
-                segmentLength = 0
-                SOIFound = True
-            elif markerByteDetail == 0xD9 :            
-                segmentType = 'EOI'
-                segmentLength = 0
-                EOIFound = True
-            elif markerByteDetail >= 0xE0 and markerByteDetail <= 0xEF :
-                segmentType = 'APP' + str(markerByteDetail-0xE0)
-                segmentLength, segmentData = readDataSegment(f)
-                appSegmentIdentifier = getAppSegmentIdentifier(segmentData)
-                if not appSegmentIdentifier :
-                    appSegmentIdentifier = "unnamed"
-                    #print("Unnamed APP segment:", segmentLength, segmentData)   # ????
-            elif markerByteDetail == 0xDB :
-                segmentType = 'DQT'
-                segmentLength, segmentData = readDataSegment(f)
-            elif markerByteDetail == 0xC4 :
-                segmentType = 'DHT'
-                segmentLength, segmentData = readDataSegment(f)
-            elif markerByteDetail == 0xC0 :
-                segmentType = 'SOF0'            
-                segmentLength, segmentData = readDataSegment(f)
-            elif markerByteDetail == 0xC2 :
-                segmentType = 'SOF2'
-                segmentLength, segmentData = readDataSegment(f)
-            elif markerByteDetail == 0xDA :
-                segmentType = 'SOS'
-                segmentLength, segmentData, nextBytes = readEntropyCodedDataSegment(f)
-                bytes = nextBytes
-            elif markerByteDetail == 0xDD :
-                segmentType = 'DRI'
-                segmentLength, segmentData = readDataSegment(f)
-            elif markerByteDetail >= 0xD0 and markerByteDetail <= 0xD7 :
+            segmentType = segmentTypeForMarker(markerByteDetail)
+            if segmentType is None :
+                print("*** Found invalid segment marker:", markerByteDetail, " at: ", bytecount-2, file=sys.stderr)
+                aborted = True
+                break
+            elif segmentType.startswith('RST') :
                 # RST markers seem to be just inserted within runs of Coded data, and so are
                 # handled by the readEntropyCodedDataSegment method, don't expect to detect
                 # them here.
-                segmentType = 'RST?'
-                segmentLength = 0
                 print("*** Found unexpected RST marker:", markerByteDetail, " at: ", bytecount-2, file=sys.stderr)
                 aborted = True
                 break
-            else :
-                # DRI ? RSTn ? COM ?
-                segmentType = '????'
+            elif markerByteDetail in standaloneMarkers :
                 segmentLength = 0
-                print("*** Found unhandled segment marker:", markerByteDetail, " at: ", bytecount-2, file=sys.stderr)
-                aborted = True
+                if segmentType == 'SOI' :
+                    SOIFound = True
+                elif segmentType == 'EOI' :
+                    EOIFound = True
+            elif segmentType == 'SOS' and headerOnly :
+                SOSFound = True
+                segmentInfo['type'] = segmentType
+                segmentsInfo.append(segmentInfo)
+                segmentsData.append(segmentData)
                 break
+            elif segmentType == 'SOS' :
+                # A scan: a header segment followed by entropy coded data. Progressive images have a series of scans.
+                headerLength, headerData = readDataSegment(f)
+                if not isCompleteSegment(headerLength, headerData) :
+                    print("*** [", bytecount, "]", describeIncompleteSegment(headerLength), file=sys.stderr)
+                    aborted = True
+                    break
+                restartMarkerOffsets = None
+                if restartIndex or writeIndex :
+                    from array import array
+                    restartMarkerOffsets = array('Q')
+                dataLength, segmentData, nextBytes, restartMarkerCount = readEntropyCodedDataSegment(f, restartMarkerOffsets)
+                bytes = nextBytes
+                segmentLength = headerLength + dataLength
+                scanInfo = processSOSHeader(headerData)
+                scanInfo['dataOffset'] = bytecount + headerLength
+                scanInfo['dataLength'] = dataLength
+                scanInfo['restartMarkers'] = restartMarkerCount
+                if restartMarkerOffsets is not None :
+                    scanInfo['restartInterval'] = restartInterval if restartInterval is not None else 0
+                    scanInfo['restartMarkerOffsets'] = restartMarkerOffsets
+                segmentInfo['scan'] = scanInfo
+                scanCount += 1
+            else :
+                # All other segments start with length bytes
+                segmentLength, segmentData = readDataSegment(f)
+                if not isCompleteSegment(segmentLength, segmentData) :
+                    print("*** [", bytecount, "]", describeIncompleteSegment(segmentLength), file=sys.stderr)
+                    aborted = True
+                    break
+                if segmentType.startswith('APP') :
+                    appSegmentIdentifier = getAppSegmentIdentifier(segmentData)
+                    if not appSegmentIdentifier :
+                        appSegmentIdentifier = "unnamed"
+                        #print("Unnamed APP segment:", segmentLength, segmentData)   # ????
+                elif segmentType == 'DRI' and len(segmentData) >= 2 :
+                    # Number of MCUs between RST markers in the scan data, 0 means there are no RST markers
+                    restartInterval = bytesToInt(segmentData[0:2], 'big')
+                elif markerByteDetail in frameEncodings :
+                    encoding = frameEncodings[markerByteDetail]
 
             segmentInfo['length'] = segmentLength
             segmentInfo['type'] = segmentType
@@ -786,11 +956,7 @@ def processFile(filename, verbose=False, veryVerbose=False) :
         # End of main read loop. If we exited because we found the EOI marker, read any remaining
         # bytes in the file.
         if EOIFound :
-            b = f.read(1)
-            trailingBytes = []
-            while b :
-                trailingBytes.append(b)
-                b = f.read(1)
+            trailingBytes = f.read()
             bytecount += len(trailingBytes)            
 
     # Summarise what we've found
@@ -799,9 +965,12 @@ def processFile(filename, verbose=False, veryVerbose=False) :
             print(s)
 
         if EOIFound and trailingBytes :
-            print("Found", len(trailingBytes), "unknown bytes after EOI marker:", *trailingBytes[0:10], "...")
+            print("Found", len(trailingBytes), "unknown bytes after EOI marker:", trailingBytes[0:10], "...")
 
-    if not (SOIFound and EOIFound) :
+    if headerOnly :
+        if not (SOIFound and SOSFound) :
+            print("*** Start of Image/Scan marker(s) not found in file:", filename, file=sys.stderr)
+    elif not (SOIFound and EOIFound) :
         print("*** Start/End of Image character(s) not found in file:", filename, file=sys.stderr)
 
     if aborted :
@@ -809,6 +978,14 @@ def processFile(filename, verbose=False, veryVerbose=False) :
     elif verbose :
         print("Read all bytes:", bytecount, "bytes")
 
+    if status is not None :
+        status['aborted'] = aborted
+        status['complete'] = SOSFound if headerOnly else EOIFound
+
+    if writeIndex and not aborted and not headerOnly and fileObject is None :
+        import JPEGSegmentIndex
+        JPEGSegmentIndex.writeSegmentIndex(filename, segmentsInfo)
+
     allTags = {}
 
     # Dump out app data segment info
@@ -816,7 +993,7 @@ def processFile(filename, verbose=False, veryVerbose=False) :
         if 'app' in info :
             appName = info['app']
             if appName == "Exif" :
-                Exifdict = processExifSegment(info, data)
+                Exifdict = processExifSegment(info, data) or {}
                 if verbose :
                     print("Extracted these IFDs from the Exif segment:")
                 for n, d in Exifdict.items() :
@@ -829,7 +1006,8 @@ def processFile(filename, verbose=False, veryVerbose=False) :
                     print("Extracted JFIF segment data:", len(JFIFdict), "item(s)")
                 allTags['JFIF'] = JFIFdict
             elif appName == "ICC_PROFILE" :
-                ICCdict = processICCProfileSegment(info, data)
+                import ICCProfile
+                ICCdict = ICCProfile.processICCProfileSegment(info, data)
                 if verbose :
                     print("Extracted ICC Profile segment data:", len(ICCdict), "item(s)")
                 allTags['ICC'] = ICCdict
@@ -849,12 +1027,43 @@ def processFile(filename, verbose=False, veryVerbose=False) :
     propertiesDict = {}
     propertiesDict['filename'] = filename
     propertiesDict['bytes'] = bytecount
+    if encoding :
+        propertiesDict['encoding'] = encoding
+    if not headerOnly :
+        propertiesDict['scans'] = scanCount
+    if restartInterval is not None :
+        propertiesDict['restartInterval'] = restartInterval
     summariseTags(propertiesDict, allTags, verbose)
 
     if veryVerbose :
-        displayAllTags(allTags)
+        import JPEGDisplay
+        JPEGDisplay.displayAllTags(allTags)
 
     return propertiesDict
+##
+###########################################################################
+##
+
+# Use the C versions of the innermost loops if the _jpegaccel module has been built (see BuildAccelerator.py). The
+# Python versions are kept so that the results can be compared (see CompareAccelerator.py).
+pythonImplementations = {'scanEntropyCodedData' : scanEntropyCodedData, 'unpackIFDEntries' : unpackIFDEntries}
+
+def useAccelerator(enable=True) :
+    global scanEntropyCodedData, unpackIFDEntries
+    if enable :
+        import _jpegaccel
+        scanEntropyCodedData = _jpegaccel.scanEntropyCodedData
+        unpackIFDEntries = _jpegaccel.unpackIFDEntries
+    else :
+        scanEntropyCodedData = pythonImplementations['scanEntropyCodedData']
+        unpackIFDEntries = pythonImplementations['unpackIFDEntries']
+
+try :
+    useAccelerator()
+    accelerated = True
+except ImportError :
+    accelerated = False
+
 #
 ####################################
 #
@@ -867,7 +1076,8 @@ def main(filename) :
 
     veryVerbose = False  # For debugging
     mainProperties = processFile(filename, True, veryVerbose)
-    displayMainProperties(mainProperties)
+    import JPEGDisplay
+    JPEGDisplay.displayMainProperties(mainProperties)
 
 if __name__ == "__main__" :
 
@@ -0,0 +1,65 @@
+# Display the properties and tags extracted from an image file by JPEG.py, TIFF.py or HEIF.py, for the command line
+# tools. Kept separate from the parsing code so that it (and MapURLs) is only imported when needed.
+
+import MapURLs  # My module for providing mapping URLs
+
+def displayMainProperties(mainProperties) :
+
+    print()
+
+    if 'latitude' in mainProperties :
+        latitude = mainProperties['latitude']
+        longitude = mainProperties['longitude']
+        print("Latitude:", mainProperties['latitudetext'], " = ", latitude)
+        print("Longitude:", mainProperties['longitudetext'], " = ", longitude)
+
+        # Maps seem to use a common zoom level domain. 
+        # https://wiki.openstreetmap.org/wiki/Zoom_levels
+        zoomLevel = 16
+
+        print("OS Maps URL:", MapURLs.urlForOrdnanceSurveyMaps(latitude, longitude, zoomLevel))
+        print("OpenStreetMap URL:", MapURLs.urlForOpenStreetMaps(latitude, longitude, zoomLevel))
+        print("Google Maps URL (with pin):", MapURLs.urlForGoogleMaps(latitude, longitude, zoomLevel))
+        print("Google Maps URL (satellite):", MapURLs.urlForGoogleMaps2(latitude, longitude, zoomLevel, "satellite"))
+        print("Google Maps URL (street view):", MapURLs.urlForGoogleMapsStreetView(latitude, longitude))
+        print("Bing Maps URL (aerial view):", MapURLs.urlForBingMaps(latitude, longitude, zoomLevel, "a"))
+
+    if 'altitude' in mainProperties :
+        print("Rough Altitude:", "{0:.0f} m".format(mainProperties['altitude']))
+
+    if 'timestamp' in mainProperties :
+        print("Timestamp:", mainProperties['timestamp'], "GMT")
+
+    if 'originalTimestamp' in mainProperties :
+        print("Original timestamp:", mainProperties['originalTimestamp'] + ("." + mainProperties['subSecond'] if 'subSecond' in mainProperties else ""))
+
+    if 'columns' in mainProperties :
+        print("Size:", mainProperties['columns'], "x", mainProperties['rows'], "pixels")
+
+    if 'make' in mainProperties :
+        print("Make:", mainProperties['make'])
+
+    if 'model' in mainProperties :
+        print("Model:", mainProperties['model'])
+
+    if 'software' in mainProperties :
+        print("Software:", mainProperties['software'])
+
+    if 'encoding' in mainProperties :
+        print("Encoding:", mainProperties['encoding'], "-", mainProperties['scans'], "scan(s)")
+
+    if 'restartInterval' in mainProperties :
+        print("Restart interval:", mainProperties['restartInterval'], "MCUs")
+
+##
+###########################################################################
+##
+
+def displayAllTags(allTags) :
+    print("#############################################")
+    for n,dict in allTags.items() :
+        print(n)
+        for k,v in dict.items() :
+            #print(k, v)
+            print(k, v)
+    print("#############################################")
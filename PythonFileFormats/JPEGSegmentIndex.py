@@ -0,0 +1,214 @@
+# Persist the list of segments found in a JPEG file (marker, offsets, lengths, type, app identifier) as a small
+# binary 'sidecar' file alongside the JPEG, so that later runs can seek directly to a particular segment (e.g. the
+# APP1 Exif segment, an ICC profile, the SOS scan data) without re-reading the whole file.
+
+import sys
+import os
+import struct
+import tempfile
+from array import array
+
+# Sidecar file layout (all big-endian):
+# - 4 byte identifier 'JSIX'
+# - 1 byte format version
+# - 8 byte size of the JPEG file when the index was produced
+# - 8 byte modification time (nanoseconds) of the JPEG file when the index was produced
+# - 4 byte count of segment records
+# - the segment records, each consisting of:
+#   - 1 byte marker
+#   - 8 byte offset of the marker in the file (the segment itself starts 2 bytes later)
+#   - 4 byte segment length
+#   - 1 byte length + bytes of the segment type name, e.g. 'APP1'
+#   - 1 byte length + bytes of the app segment identifier, e.g. 'Exif' (length 0 if not an APP segment)
+#   - for SOS segments only, the restart index of the scan (see JPEG.processFile):
+#     - 8 byte offset of the entropy coded data following the SOS header
+#     - 2 byte restart interval
+#     - 4 byte count of RST markers
+#     - 8 byte file offset of each RST marker
+indexIdentifier = b'JSIX'
+indexVersion = 2
+indexHeaderFormat = ">4sBQqI"
+indexRecordFormat = ">BQI"
+restartIndexFormat = ">QHI"
+indexFileSuffix = ".segidx"
+
+def indexFileName(filename) :
+    return filename + indexFileSuffix
+
+def packShortString(s) :
+    b = s.encode()[0:255]
+    return bytes([len(b)]) + b
+
+def unpackShortString(data, offset) :
+    n = data[offset]
+    return data[offset+1:offset+1+n].decode(), offset+1+n
+
+def writeSegmentIndex(filename, segmentsInfo) :
+    st = os.stat(filename)
+    parts = [struct.pack(indexHeaderFormat, indexIdentifier, indexVersion, st.st_size, st.st_mtime_ns, len(segmentsInfo))]
+    for s in segmentsInfo :
+        parts.append(struct.pack(indexRecordFormat, s['marker'], s['markerOffset'], s['length']))
+        parts.append(packShortString(s['type']))
+        parts.append(packShortString(s['app'] if 'app' in s else ""))
+        if s['type'] == 'SOS' :
+            scanInfo = s['scan'] if 'scan' in s else {}
+            restartMarkerOffsets = array('Q', scanInfo['restartMarkerOffsets'] if 'restartMarkerOffsets' in scanInfo else [])
+            restartInterval = scanInfo['restartInterval'] if 'restartInterval' in scanInfo else 0
+            dataOffset = scanInfo['dataOffset'] if 'dataOffset' in scanInfo else s['segmentOffset']
+            parts.append(struct.pack(restartIndexFormat, dataOffset, restartInterval, len(restartMarkerOffsets)))
+            if sys.byteorder == "little" :
+                restartMarkerOffsets.byteswap()
+            parts.append(restartMarkerOffsets.tobytes())
+
+    # Write to a temporary file and rename, so a reader never sees a partially written index. The temporary file has
+    # a unique name, so that two processes indexing the same file at the same time don't write to the same file.
+    indexName = indexFileName(filename)
+    fd, tempName = tempfile.mkstemp(prefix=os.path.basename(indexName) + ".", suffix=".tmp", dir=os.path.dirname(indexName) or ".")
+    try :
+        with os.fdopen(fd, "wb") as f :
+            f.write(b''.join(parts))
+        os.replace(tempName, indexName)
+    except BaseException :
+        try :
+            os.remove(tempName)
+        except OSError :
+            pass
+        raise
+    return indexName
+
+# Returns the list of segment info dictionaries (in the same form as produced by JPEG.processFile), or None if there
+# is no index for the file, or the index is out of date or unreadable.
+def readSegmentIndex(filename) :
+    indexName = indexFileName(filename)
+    try :
+        with open(indexName, "rb") as f :
+            data = f.read()
+        st = os.stat(filename)
+    except OSError :
+        return None
+
+    headerSize = struct.calcsize(indexHeaderFormat)
+    recordSize = struct.calcsize(indexRecordFormat)
+    try :
+        identifier, version, fileSize, mtime, count = struct.unpack_from(indexHeaderFormat, data, 0)
+        if identifier != indexIdentifier :
+            print("*** Segment index file format not recognised:", indexName, file=sys.stderr)
+            return None
+        if version != indexVersion :
+            # Produced by an earlier version, will be replaced
+            return None
+        if fileSize != st.st_size or mtime != st.st_mtime_ns :
+            # The JPEG has changed since the index was produced
+            return None
+
+        segmentsInfo = []
+        offset = headerSize
+        for n in range(0, count) :
+            marker, markerOffset, length = struct.unpack_from(indexRecordFormat, data, offset)
+            offset += recordSize
+            segmentType, offset = unpackShortString(data, offset)
+            app, offset = unpackShortString(data, offset)
+            segmentInfo = {}
+            segmentInfo['marker'] = marker
+            segmentInfo['markerOffset'] = markerOffset
+            segmentInfo['segmentOffset'] = markerOffset+2
+            segmentInfo['length'] = length
+            segmentInfo['type'] = segmentType
+            if app :
+                segmentInfo['app'] = app
+            if segmentType == 'SOS' :
+                dataOffset, restartInterval, restartMarkerCount = struct.unpack_from(restartIndexFormat, data, offset)
+                offset += struct.calcsize(restartIndexFormat)
+                restartMarkerOffsets = array('Q')
+                restartMarkerOffsets.frombytes(data[offset:offset+8*restartMarkerCount])
+                if len(restartMarkerOffsets) != restartMarkerCount :
+                    raise IndexError("restart index truncated")
+                if sys.byteorder == "little" :
+                    restartMarkerOffsets.byteswap()
+                offset += 8*restartMarkerCount
+                scanInfo = {}
+                scanInfo['dataOffset'] = dataOffset
+                scanInfo['restartInterval'] = restartInterval
+                scanInfo['restartMarkerOffsets'] = restartMarkerOffsets
+                segmentInfo['scan'] = scanInfo
+            segmentsInfo.append(segmentInfo)
+    except (struct.error, IndexError, UnicodeDecodeError) as e :
+        print("*** Segment index file is corrupt:", indexName, " : ", e, file=sys.stderr)
+        return None
+
+    return segmentsInfo
+
+# Find the first segment matching the segment type (e.g. 'SOS') and/or app identifier (e.g. 'Exif')
+def findSegment(segmentsInfo, segmentType=None, app=None) :
+    for s in segmentsInfo :
+        if segmentType and s['type'] != segmentType :
+            continue
+        if app and ('app' not in s or s['app'] != app) :
+            continue
+        return s
+    return None
+
+# Read the data bytes of a segment with one seek and one read. For length-prefixed segments the two length bytes
+# are skipped, so the result is the same as the segment data JPEG.processFile works with.
+def readSegmentData(f, segmentInfo) :
+    segmentOffset = segmentInfo['segmentOffset']
+    length = segmentInfo['length']
+    if segmentInfo['type'] != 'SOS' and length >= 2 :
+        segmentOffset += 2
+        length -= 2
+    f.seek(segmentOffset)
+    return f.read(length)
+
+# Use the index for a file (producing it first if necessary) to read just the Exif segment and extract its tags.
+def readExifTags(filename) :
+    import JPEG
+
+    segmentsInfo = readSegmentIndex(filename)
+    if segmentsInfo is None :
+        JPEG.processFile(filename, writeIndex=True)
+        segmentsInfo = readSegmentIndex(filename)
+        if segmentsInfo is None :
+            return {}
+
+    exifSegment = findSegment(segmentsInfo, app="Exif")
+    if not exifSegment :
+        return {}
+
+    with open(filename, "rb") as f :
+        data = readSegmentData(f, exifSegment)
+    return JPEG.processExifSegment(exifSegment, data) or {}
+
+#
+####################################
+#
+
+def main(filename) :
+
+    if not os.path.isfile(filename) :
+        print("***",  filename, "is not a file", file=sys.stderr)
+        return
+
+    segmentsInfo = readSegmentIndex(filename)
+    if segmentsInfo is None :
+        import JPEG
+        JPEG.processFile(filename, writeIndex=True)
+        segmentsInfo = readSegmentIndex(filename)
+        if segmentsInfo is None :
+            print("*** No segment index file produced for:", filename, file=sys.stderr)
+        else :
+            print("Produced segment index file:", indexFileName(filename))
+    else :
+        print("Using existing segment index file:", indexFileName(filename))
+
+    if segmentsInfo is not None :
+        for s in segmentsInfo :
+            print(s)
+
+if __name__ == "__main__" :
+
+    if len(sys.argv) == 1 :
+        print("No filename command line argument provided")
+        exit()
+
+    filename = sys.argv[1]
+    main(filename)
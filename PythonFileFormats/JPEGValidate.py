@@ -0,0 +1,252 @@
+# Check the structure of JPEG files, to find truncated or corrupt photos, producing a verdict for each file:
+# - the SOI marker at the start, and the EOI marker at the end, with any data after EOI reported
+# - each segment's length is consistent with the file size and is followed by another marker
+# - within the entropy coded scan data, every <FF> byte is followed by a <00> stuffing byte, an RST marker, or the
+#   marker of the next segment, and RST markers run in sequence RST0, RST1, ... RST7, RST0, ...
+# - a frame header (SOFn) comes before the first scan
+#
+# Files are memory-mapped and the scan data is searched using JPEG.scanEntropyCodedData (in C if the accelerator has
+# been built), so the data is only looked at by Python code where there is a marker. A folder tree is checked using a pool of worker processes.
+#
+# Usage:
+#   python JPEGValidate.py photo.jpg
+#   python JPEGValidate.py [--workers N] [--all] [--output FILE] folder
+
+import sys
+import os
+import mmap
+import json
+import contextlib
+import argparse
+import itertools
+import collections
+import concurrent.futures
+
+import JPEG
+
+# Verdicts, in increasing order of severity
+OK = "OK"
+WARNING = "WARNING"
+CORRUPT = "CORRUPT"
+
+# Don't list every problem in a badly damaged file
+maxProblemsListed = 20
+
+class Verdict :
+
+    def __init__(self, filename) :
+        self.filename = filename
+        self.bytes = 0
+        self.status = OK
+        self.problems = []
+        self.scans = 0
+        self.restartMarkers = 0
+        self.trailingBytes = 0
+
+    def problem(self, offset, description, status=CORRUPT) :
+        if status == CORRUPT or self.status == OK :
+            self.status = status
+        if len(self.problems) < maxProblemsListed :
+            self.problems.append({'offset' : offset, 'severity' : status, 'problem' : description})
+
+    def asDict(self) :
+        d = {}
+        d['filename'] = self.filename
+        d['status'] = self.status
+        d['bytes'] = self.bytes
+        d['scans'] = self.scans
+        d['restartMarkers'] = self.restartMarkers
+        d['trailingBytes'] = self.trailingBytes
+        d['problems'] = self.problems
+        return d
+
+##
+###########################################################################
+##
+
+# Check the entropy coded data of a scan starting at offset, returning the offset of the marker which follows it, or
+# None if the data runs to the end of the file.
+def checkScanData(data, offset, verdict, restartInterval) :
+    restartMarkerOffsets = []
+    n, restartMarkerCount, markerByte = JPEG.scanEntropyCodedData(data, offset, restartMarkerOffsets, 0)
+
+    expectedRST = 0
+    for RSTOffset in restartMarkerOffsets :
+        RSTNumber = data[RSTOffset+1] - 0xD0
+        if RSTNumber != expectedRST :
+            verdict.problem(RSTOffset, "RST{0} marker found where RST{1} expected".format(RSTNumber, expectedRST))
+        if not restartInterval and verdict.restartMarkers == 0 :
+            verdict.problem(RSTOffset, "RST marker found with no restart interval defined", WARNING)
+        verdict.restartMarkers += 1
+        expectedRST = (RSTNumber + 1) % 8
+
+    return n if markerByte is not None else None
+
+def checkStructure(data, verdict) :
+    fileSize = len(data)
+    if data[0:2] != b'\xff\xd8' :
+        verdict.problem(0, "SOI marker not found at start of file")
+        return
+
+    offset = 2
+    frameFound = False
+    restartInterval = 0
+    while True :
+        if offset >= fileSize :
+            verdict.problem(offset, "file ends without an EOI marker (truncated)")
+            return
+        if data[offset] != 0xFF :
+            verdict.problem(offset, "marker expected, found byte {0:02x}".format(data[offset]))
+            return
+        # Skip fill bytes
+        while offset + 1 < fileSize and data[offset+1] == 0xFF :
+            offset += 1
+        if offset + 1 >= fileSize :
+            verdict.problem(offset, "file ends without an EOI marker (truncated)")
+            return
+
+        marker = data[offset+1]
+        markerOffset = offset
+        offset += 2
+        if marker == 0xD9 :
+            verdict.trailingBytes = fileSize - offset
+            if verdict.trailingBytes :
+                verdict.problem(offset, "{0} byte(s) of data after the EOI marker".format(verdict.trailingBytes), WARNING)
+            return
+        elif marker == 0xD8 :
+            verdict.problem(markerOffset, "unexpected second SOI marker")
+            continue
+        elif 0xD0 <= marker <= 0xD7 or marker == 0x01 :
+            verdict.problem(markerOffset, "{0} marker outside scan data".format(JPEG.segmentTypeForMarker(marker)), WARNING)
+            continue
+        elif marker == 0x00 :
+            verdict.problem(markerOffset, "invalid marker <FF><00>")
+            return
+
+        # Segments with length bytes
+        if offset + 2 > fileSize :
+            verdict.problem(markerOffset, "file ends within segment length")
+            return
+        segmentLength = (data[offset] << 8) | data[offset+1]
+        segmentType = JPEG.segmentTypeForMarker(marker)
+        if segmentLength < 2 :
+            verdict.problem(markerOffset, "{0} segment length {1} is too small".format(segmentType, segmentLength))
+            return
+        if offset + segmentLength > fileSize :
+            verdict.problem(markerOffset, "{0} segment length {1} extends beyond the end of the file (truncated)".format(segmentType, segmentLength))
+            return
+
+        if marker in JPEG.frameEncodings :
+            frameFound = True
+        elif marker == 0xDD and segmentLength >= 4 :
+            restartInterval = (data[offset+2] << 8) | data[offset+3]
+        elif marker == 0xDA :
+            verdict.scans += 1
+            if not frameFound :
+                verdict.problem(markerOffset, "scan found before any frame (SOFn) header")
+            nextMarkerOffset = checkScanData(data, offset + segmentLength, verdict, restartInterval)
+            if nextMarkerOffset is None :
+                verdict.problem(offset + segmentLength, "scan data runs to the end of the file without an EOI marker (truncated)")
+                return
+            offset = nextMarkerOffset
+            continue
+
+        offset += segmentLength
+        if offset < fileSize and data[offset] != 0xFF :
+            verdict.problem(markerOffset, "{0} segment length {1} is not followed by a marker".format(segmentType, segmentLength))
+            return
+
+# Check a JPEG file, returning a Verdict
+def validateFile(filename) :
+    verdict = Verdict(filename)
+    try :
+        with open(filename, "rb") as f :
+            verdict.bytes = os.fstat(f.fileno()).st_size
+            if verdict.bytes == 0 :
+                verdict.problem(0, "empty file")
+                return verdict
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data :
+                if hasattr(data, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL") :
+                    data.madvise(mmap.MADV_SEQUENTIAL)
+                checkStructure(data, verdict)
+    except (OSError, ValueError) as e :
+        verdict.problem(0, "unable to read file: " + str(e))
+    return verdict
+
+##
+###########################################################################
+##
+
+JPEGFileExtensions = (".jpg", ".jpeg", ".jpe", ".jfif")
+
+# For a folder tree, check files with a JPEG file name, and any other files which start with a JPEG SOI marker.
+# Returns the verdict as a dictionary, or None if the file isn't a JPEG file.
+def validateIfJPEG(filename) :
+    if not filename.lower().endswith(JPEGFileExtensions) :
+        try :
+            with open(filename, "rb") as f :
+                if f.read(2) != b'\xff\xd8' :
+                    return None
+        except OSError :
+            return None
+    return validateFile(filename).asDict()
+
+def filesUnder(topdir) :
+    for dirpath, dirnamesList, filenamesList in os.walk(topdir) :
+        for name in filenamesList :
+            yield os.path.join(dirpath, name)
+
+def validateBatch(filenames) :
+    return [validateIfJPEG(filename) for filename in filenames]
+
+# Check the files under a folder using a pool of processes, writing a line of JSON for each file checked (or only
+# for files with problems unless allFiles is set) to outputFile. Returns a count of files per verdict status.
+# The files are handed to the workers in batches of batchSize, with only a few batches per worker outstanding at a
+# time, so that memory use doesn't grow with the number of files in the folder tree (as it would with
+# executor.map, which takes all the files up front).
+def validateFolder(topdir, outputFile, workers=None, allFiles=False, batchSize=64, batchesPerWorker=4) :
+    counts = {OK : 0, WARNING : 0, CORRUPT : 0}
+
+    def writeVerdicts(verdicts) :
+        for verdict in verdicts :
+            if verdict is None :
+                continue
+            counts[verdict['status']] += 1
+            if allFiles or verdict['status'] != OK :
+                outputFile.write(json.dumps(verdict) + "\n")
+
+    maxPending = (workers or os.cpu_count() or 1) * batchesPerWorker
+    filenames = filesUnder(topdir)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor :
+        # Futures for the batches submitted, oldest first, so the verdicts are written in the order the files were found
+        pending = collections.deque()
+        for batch in iter(lambda : list(itertools.islice(filenames, batchSize)), []) :
+            pending.append(executor.submit(validateBatch, batch))
+            if len(pending) >= maxPending :
+                writeVerdicts(pending.popleft().result())
+        while pending :
+            writeVerdicts(pending.popleft().result())
+    return counts
+
+#
+####################################
+#
+
+if __name__ == "__main__" :
+
+    parser = argparse.ArgumentParser(description="Check the structure of JPEG files, reporting truncated or corrupt files")
+    parser.add_argument("location", help="JPEG file, or folder to check all the JPEG files under")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--all", action="store_true", help="report every file checked, not just files with problems")
+    parser.add_argument("--output", default=None, help="write the verdicts (one line of JSON per file) to this file rather than to the screen")
+    args = parser.parse_args()
+
+    if os.path.isfile(args.location) :
+        verdict = validateFile(args.location)
+        print(json.dumps(verdict.asDict(), indent=2))
+    elif os.path.isdir(args.location) :
+        with (open(args.output, "w") if args.output else contextlib.nullcontext(sys.stdout)) as outputFile :
+            counts = validateFolder(args.location, outputFile, args.workers, args.all)
+        print("Checked", sum(counts.values()), "JPEG file(s):", ", ".join(str(n) + " " + status for status, n in counts.items()), file=sys.stderr)
+    else :
+        print("***", args.location, "is not a file or directory name", file=sys.stderr)
@@ -0,0 +1,243 @@
+# Compare the output of two metadata extraction runs, e.g. before and after a change to the parsing code, or before
+# and after moving an archive, reporting the files added, removed and changed, with a count of the changes to each
+# column. Each run's output can be a CSV file produced by CSV_from_JPEG_metadata.py, or its JPEGs.db store (see the
+# --watch option).
+#
+# Memory use doesn't depend on the number of files: the two outputs are read in filename order and matched up a row
+# at a time, in the same way as the merge step of a merge sort. Stores, and CSV files produced from them with
+# --export, are already in filename order. Other CSV files (in the order the folders were searched) are first sorted
+# into temporary files, a chunk of rows at a time, and the sorted chunks merged as they are read.
+#
+# Usage:
+#   python MetadataDiff.py old/JPEGs.csv new/JPEGs.csv [--output differences.csv]
+# Exits with status 1 if there are any differences, so can be used as a regression check.
+
+import sys
+import os
+import csv
+import heapq
+import tempfile
+import contextlib
+import collections
+
+# Number of rows sorted in memory at a time when a CSV file isn't in filename order
+sortChunkRows = 200000
+
+# Number of differences of each kind listed
+maxListed = 10
+
+##
+###########################################################################
+##
+
+def isStoreFile(filename) :
+    with open(filename, "rb") as f :
+        return f.read(16) == b'SQLite format 3\x00'
+
+# The header and rows of a JPEGs.db store, in filename order. Records stored by older versions can have fewer
+# columns, so are padded.
+@contextlib.contextmanager
+def storeRows(filename) :
+    import json
+    import sqlite3
+    import CSV_from_JPEG_metadata
+
+    header = CSV_from_JPEG_metadata.getCSVHeader()
+    conn = sqlite3.connect(filename)
+    try :
+        def rows() :
+            for (record,) in conn.execute("SELECT record FROM images ORDER BY filename") :
+                # As written by the csv module
+                row = ['' if value is None else str(value) for value in json.loads(record)]
+                yield row + [''] * (len(header) - len(row))
+        yield header, rows()
+    finally :
+        conn.close()
+
+def isInFilenameOrder(filename) :
+    with open(filename, newline="") as f :
+        reader = csv.reader(f)
+        next(reader, None)
+        previous = None
+        for row in reader :
+            if row and previous is not None and row[0] < previous :
+                return False
+            if row :
+                previous = row[0]
+    return True
+
+# Write the rows of a CSV file to temporary files in chunks of sortChunkRows rows, each sorted by filename.
+# Returns the chunk file names.
+def sortChunks(filename, tempDir) :
+    chunkFileNames = []
+
+    def writeChunk(chunk) :
+        chunk.sort(key=lambda row : row[0])
+        chunkFileName = os.path.join(tempDir, "chunk-{0:d}.csv".format(len(chunkFileNames)))
+        with open(chunkFileName, "w", newline="") as chunkFile :
+            csv.writer(chunkFile).writerows(chunk)
+        chunkFileNames.append(chunkFileName)
+
+    with open(filename, newline="") as f :
+        reader = csv.reader(f)
+        next(reader, None)
+        chunk = []
+        for row in reader :
+            if not row :
+                continue
+            chunk.append(row)
+            if len(chunk) == sortChunkRows :
+                writeChunk(chunk)
+                chunk = []
+        if chunk :
+            writeChunk(chunk)
+    return chunkFileNames
+
+# The header and rows of a CSV file, in filename order, sorting the file if it isn't already in filename order
+@contextlib.contextmanager
+def CSVRows(filename) :
+    with contextlib.ExitStack() as stack :
+        f = stack.enter_context(open(filename, newline=""))
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if isInFilenameOrder(filename) :
+            yield header, (row for row in reader if row)
+        else :
+            print("Sorting", filename, "by filename")
+            tempDir = stack.enter_context(tempfile.TemporaryDirectory(prefix="diff-"))
+            chunkReaders = [csv.reader(stack.enter_context(open(chunkFileName, newline=""))) for chunkFileName in sortChunks(filename, tempDir)]
+            yield header, heapq.merge(*chunkReaders, key=lambda row : row[0])
+
+def outputRows(filename) :
+    if isStoreFile(filename) :
+        return storeRows(filename)
+    return CSVRows(filename)
+
+# Match up the rows of the two outputs by filename, yielding (filename, old row, new row), with None for the old row
+# of an added file or the new row of a removed file. Both sets of rows must be in filename order.
+def mergeJoin(oldRows, newRows) :
+    oldRow = next(oldRows, None)
+    newRow = next(newRows, None)
+    while oldRow is not None or newRow is not None :
+        if newRow is None or (oldRow is not None and oldRow[0] < newRow[0]) :
+            yield oldRow[0], oldRow, None
+            oldRow = next(oldRows, None)
+        elif oldRow is None or newRow[0] < oldRow[0] :
+            yield newRow[0], None, newRow
+            newRow = next(newRows, None)
+        else :
+            yield oldRow[0], oldRow, newRow
+            oldRow = next(oldRows, None)
+            newRow = next(newRows, None)
+
+##
+###########################################################################
+##
+
+class DiffReport :
+
+    def __init__(self, oldHeader, newHeader, ignoredColumns=()) :
+        # Columns in both outputs, as (name, old index, new index), apart from the filename
+        self.columns = [(name, oldHeader.index(name), newHeader.index(name)) for name in oldHeader[1:]
+                            if name in newHeader and name not in ignoredColumns]
+        self.oldOnlyColumns = [name for name in oldHeader if name not in newHeader]
+        self.newOnlyColumns = [name for name in newHeader if name not in oldHeader]
+        self.counts = collections.Counter()
+        self.columnChanges = collections.Counter()
+        self.listed = {'added' : [], 'removed' : [], 'changed' : []}
+
+    def listFile(self, change, filename) :
+        if len(self.listed[change]) < maxListed :
+            self.listed[change].append(filename)
+
+    # Compare the old and new rows for a file, returning a list of (change, column, old value, new value) differences
+    def compare(self, filename, oldRow, newRow) :
+        if oldRow is None :
+            self.counts['added'] += 1
+            self.listFile('added', filename)
+            return [("added", "", "", "")]
+        if newRow is None :
+            self.counts['removed'] += 1
+            self.listFile('removed', filename)
+            return [("removed", "", "", "")]
+
+        differences = []
+        for name, oldIndex, newIndex in self.columns :
+            oldValue = oldRow[oldIndex] if oldIndex < len(oldRow) else ''
+            newValue = newRow[newIndex] if newIndex < len(newRow) else ''
+            if oldValue != newValue :
+                self.columnChanges[name] += 1
+                differences.append( ("changed", name, oldValue, newValue) )
+        if differences :
+            self.counts['changed'] += 1
+            self.listFile('changed', filename)
+        else :
+            self.counts['unchanged'] += 1
+        return differences
+
+    def hasDifferences(self) :
+        return bool(self.counts['added'] or self.counts['removed'] or self.counts['changed'])
+
+    def display(self) :
+        if self.oldOnlyColumns :
+            print("Columns only in the old output:", ", ".join(self.oldOnlyColumns))
+        if self.newOnlyColumns :
+            print("Columns only in the new output:", ", ".join(self.newOnlyColumns))
+        print("Files: unchanged {0:d}, changed {1:d}, added {2:d}, removed {3:d}".format(
+                self.counts['unchanged'], self.counts['changed'], self.counts['added'], self.counts['removed']))
+        if self.columnChanges :
+            print("Changes per column:")
+            for name, n in self.columnChanges.most_common() :
+                print("  {0:30s} {1:d}".format(name, n))
+        for change in ['changed', 'added', 'removed'] :
+            if self.listed[change] :
+                print("Files {0:s}{1:s}:".format(change, " (first " + str(maxListed) + ")" if self.counts[change] > maxListed else ""))
+                for filename in self.listed[change] :
+                    print("   ", filename)
+
+# Compare the two outputs, writing a line per difference to the CSV file outputFileName if given
+def diff(oldFileName, newFileName, outputFileName=None, ignoredColumns=()) :
+    with contextlib.ExitStack() as stack :
+        oldHeader, oldRows = stack.enter_context(outputRows(oldFileName))
+        newHeader, newRows = stack.enter_context(outputRows(newFileName))
+        report = DiffReport(oldHeader, newHeader, ignoredColumns)
+
+        myCSVWriter = None
+        if outputFileName is not None :
+            csvfile = stack.enter_context(open(outputFileName, "w", newline=""))
+            myCSVWriter = csv.writer(csvfile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            myCSVWriter.writerow(["Change", "Filename", "Column", "Old value", "New value"])
+
+        for filename, oldRow, newRow in mergeJoin(oldRows, newRows) :
+            differences = report.compare(filename, oldRow, newRow)
+            if myCSVWriter is not None :
+                for change, column, oldValue, newValue in differences :
+                    myCSVWriter.writerow([change, filename, column, oldValue, newValue])
+
+    return report
+
+#
+####################################
+#
+
+if __name__ == "__main__" :
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare the output of two metadata extraction runs")
+    parser.add_argument("old", help="CSV file (or JPEGs.db store) produced by the earlier run")
+    parser.add_argument("new", help="CSV file (or JPEGs.db store) produced by the later run")
+    parser.add_argument("--output", default=None, help="CSV file for a line per difference found")
+    parser.add_argument("--ignore", metavar="COLUMN", action="append", default=[], help="column heading not to compare (can be repeated)")
+    args = parser.parse_args()
+
+    for filename in [args.old, args.new] :
+        if not os.path.isfile(filename) :
+            print("***", filename, "is not a file", file=sys.stderr)
+            exit(2)
+
+    report = diff(args.old, args.new, args.output, args.ignore)
+    report.display()
+    if args.output :
+        print("Produced CSV file:", args.output)
+    exit(1 if report.hasDifferences() else 0)
@@ -0,0 +1,368 @@
+# A long-running server which keeps a pool of 'warm' worker processes (with the parsing modules already imported)
+# to extract metadata from image files on request, avoiding the cost of starting a new Python process for each file.
+#
+# Requests and responses are single lines of JSON, sent over a Unix domain socket, or a localhost TCP port where Unix
+# domain sockets aren't available. A request is one of:
+#   {"paths": ["/photos/a.jpg", "/photos/b.heic", ...]}                   - files the server can read
+#   {"files": [{"name": "a.jpg", "data": "<base64 file contents>"}, ...]}  - file contents sent with the request
+# and the response is:
+#   {"results": [{...properties...}, ...]}    - one properties dictionary per file, in the same order
+# or {"error": "..."} if the request couldn't be handled. A properties dictionary for a file which couldn't be
+# processed, or whose properties couldn't be sent as JSON, has just the filename and an 'error' entry.
+#
+# The server will read any file it can read, including the locations where photos were taken, so only the user
+# running the server can use it:
+# - the Unix domain socket is only accessible to that user, and by default is in the user's runtime folder
+#   ($XDG_RUNTIME_DIR, or a private folder in the temporary folder)
+# - the TCP port is only on the loopback interface, and each request must include a token ("token": "...") which the
+#   server generates when it starts and writes to a file only the user can read, in the same runtime folder
+#
+# Usage:
+#   python MetadataServer.py serve [--socket PATH | --port N [--token-file PATH]] [--workers N]
+#   python MetadataServer.py client [--socket PATH | --port N [--token-file PATH]] [--send-data] file ...
+
+import sys
+import os
+import json
+import base64
+import socket
+import socketserver
+import stat
+import hmac
+import secrets
+import getpass
+import tempfile
+import threading
+import signal
+import argparse
+import concurrent.futures
+
+socketFileName = "PythonFileFormats.sock"
+tokenFileName = "PythonFileFormats.token"
+
+# Limits on the work the server accepts, so that a burst of requests queues in the clients rather than in the
+# server's memory:
+# - the length of a request line, which includes the contents of any files sent with the request
+# - the number of files in a single request
+# - the number of requests being worked on at once; further requests wait for up to requestWaitSeconds, and are
+#   then rejected as 'busy' so that the client can back off and retry
+maxRequestBytes = 64 * 1024 * 1024
+maxFilesPerRequest = 10000
+maxRequestsInProgress = 8
+requestWaitSeconds = 30
+
+##
+###########################################################################
+##
+
+# A folder only the current user can use, for the socket and token files: $XDG_RUNTIME_DIR if set, otherwise a
+# folder for the user in the temporary folder, which is checked to belong to the user (so that another user can't
+# create it first) and made private
+def runtimeDirectory() :
+    runtimeDir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtimeDir and os.path.isdir(runtimeDir) :
+        return runtimeDir
+
+    runtimeDir = os.path.join(tempfile.gettempdir(), "PythonFileFormats-" + getpass.getuser())
+    try :
+        os.mkdir(runtimeDir, 0o700)
+    except FileExistsError :
+        pass
+    st = os.lstat(runtimeDir)
+    if not stat.S_ISDIR(st.st_mode) or (hasattr(os, "getuid") and st.st_uid != os.getuid()) :
+        raise PermissionError(runtimeDir + " is not a folder belonging to the current user")
+    if stat.S_IMODE(st.st_mode) & 0o077 :
+        os.chmod(runtimeDir, 0o700)
+    return runtimeDir
+
+def defaultSocketPath() :
+    return os.path.join(runtimeDirectory(), socketFileName)
+
+def defaultTokenPath() :
+    return os.path.join(runtimeDirectory(), tokenFileName)
+
+# Generate a new token and write it to a file only the current user can read
+def writeToken(tokenPath) :
+    token = secrets.token_hex(32)
+    fd, tempName = tempfile.mkstemp(dir=os.path.dirname(tokenPath) or ".")
+    try :
+        with os.fdopen(fd, "w") as f :
+            f.write(token + "\n")
+        os.replace(tempName, tokenPath)
+    except BaseException :
+        os.remove(tempName)
+        raise
+    return token
+
+def readToken(tokenPath) :
+    with open(tokenPath) as f :
+        return f.read().strip()
+
+##
+###########################################################################
+##
+
+# Run in the worker processes when they start, so that the parsing modules are imported before the first request.
+# Workers don't inherit the server's SIGTERM handling.
+def initialiseWorker() :
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    import FileTypes
+
+def processPath(path) :
+    import FileTypes
+    try :
+        p = FileTypes.processImageFile(path)
+        if p is None :
+            p = {'filename' : path, 'error' : "file type not recognised"}
+    except Exception as e :
+        p = {'filename' : path, 'error' : str(e)}
+    return p
+
+def processData(nameAndData) :
+    import FileTypes
+    name, data = nameAndData
+    try :
+        p = FileTypes.processImageBytes(name, data)
+        if p is None :
+            p = {'filename' : name, 'error' : "file type not recognised"}
+    except Exception as e :
+        p = {'filename' : name, 'error' : str(e)}
+    return p
+
+##
+###########################################################################
+##
+
+class MetadataRequestHandler(socketserver.StreamRequestHandler) :
+
+    def sendResponse(self, response) :
+        self.wfile.write(encodeResponse(response) + b'\n')
+        self.wfile.flush()
+
+    def handle(self) :
+        # Several requests can be sent over one connection, one per line
+        while True :
+            line = self.rfile.readline(maxRequestBytes + 1)
+            if not line :
+                break
+            if len(line) > maxRequestBytes :
+                # The rest of the line can't be told apart from a new request, so the connection is closed
+                self.sendResponse({'error' : "request too large, limit is " + str(maxRequestBytes) + " bytes"})
+                break
+            if not line.strip() :
+                continue
+            self.sendResponse(self.server.handleRequest(line))
+
+# Properties can include values which can't be represented in JSON (e.g. bytes from a damaged tag), so each file's
+# properties are encoded separately, with an error entry for a file whose properties can't be encoded.
+def encodeResponse(response) :
+    if 'results' not in response :
+        return json.dumps(response).encode()
+    encodedResults = []
+    for p in response['results'] :
+        try :
+            encodedResults.append(json.dumps(p))
+        except (TypeError, ValueError) as e :
+            encodedResults.append(json.dumps({'filename' : p.get('filename'), 'error' : "properties not valid JSON: " + str(e)}))
+    return ('{"results": [' + ", ".join(encodedResults) + ']}').encode()
+
+class MetadataServerMixIn :
+
+    daemon_threads = True
+
+    # Token which must be included in each request, or None if no token is needed
+    token = None
+
+    def startWorkers(self, workers) :
+        self.workers = workers or os.cpu_count() or 1
+        self.requestSlots = threading.BoundedSemaphore(maxRequestsInProgress)
+        self.executorLock = threading.Lock()
+        self.executor = self.newExecutor()
+
+    def newExecutor(self) :
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, initializer=initialiseWorker)
+        # Make sure the workers are started (and warm) before the first request arrives
+        list(executor.map(processPath, [""] * self.workers))
+        return executor
+
+    # A worker process which dies (e.g. killed for running out of memory on a damaged file) leaves the pool unusable,
+    # so it is replaced by a new pool. Requests using the broken pool at the same time only replace it once.
+    def replaceExecutor(self, brokenExecutor) :
+        with self.executorLock :
+            if self.executor is brokenExecutor :
+                print("*** Worker process failed, restarting the worker processes", file=sys.stderr)
+                brokenExecutor.shutdown(wait=False)
+                self.executor = self.newExecutor()
+
+    def handleRequest(self, line) :
+        try :
+            request = json.loads(line)
+            if self.token is not None and not hmac.compare_digest(str(request.get('token', '')), self.token) :
+                return {'error' : "missing or invalid token"}
+            if 'paths' in request :
+                function = processPath
+                items = list(request['paths'])
+            elif 'files' in request :
+                function = processData
+                items = [(f['name'], base64.b64decode(f['data'])) for f in request['files']]
+            else :
+                return {'error' : "request must contain 'paths' or 'files'"}
+        except (ValueError, KeyError, TypeError, AttributeError) as e :
+            return {'error' : "invalid request: " + str(e)}
+
+        if len(items) > maxFilesPerRequest :
+            return {'error' : "too many files in request, limit is " + str(maxFilesPerRequest)}
+
+        if not self.requestSlots.acquire(timeout=requestWaitSeconds) :
+            return {'error' : "busy"}
+        try :
+            # Batch the files across the workers, several files to a task to reduce the inter-process overheads
+            chunksize = max(1, len(items) // (self.workers * 4))
+            executor = self.executor
+            try :
+                results = list(executor.map(function, items, chunksize=chunksize))
+            except concurrent.futures.process.BrokenProcessPool as e :
+                self.replaceExecutor(executor)
+                return {'error' : "worker process failed: " + str(e)}
+        finally :
+            self.requestSlots.release()
+
+        return {'results' : results}
+
+    def shutdownWorkers(self) :
+        if hasattr(self, "executor") :
+            self.executor.shutdown()
+
+if hasattr(socketserver, "ThreadingUnixStreamServer") :
+    class UnixMetadataServer(MetadataServerMixIn, socketserver.ThreadingUnixStreamServer) :
+        pass
+
+class TCPMetadataServer(MetadataServerMixIn, socketserver.ThreadingTCPServer) :
+    allow_reuse_address = True
+
+# Remove a socket file left by a server which is no longer running. Returns False if there is something else at the
+# path: a file which isn't a socket, or the socket of a running server.
+def removeStaleSocket(socketPath) :
+    try :
+        st = os.lstat(socketPath)
+    except FileNotFoundError :
+        return True
+    if not stat.S_ISSOCK(st.st_mode) :
+        print("***", socketPath, "exists and is not a socket", file=sys.stderr)
+        return False
+    if hasattr(os, "getuid") and st.st_uid != os.getuid() :
+        print("***", socketPath, "belongs to another user", file=sys.stderr)
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s :
+        try :
+            s.connect(socketPath)
+            print("*** A server is already running on", socketPath, file=sys.stderr)
+            return False
+        except ConnectionRefusedError :
+            pass
+    os.remove(socketPath)
+    return True
+
+def serve(socketPath=None, port=None, workers=None, tokenPath=None) :
+    if port is not None :
+        server = TCPMetadataServer(("127.0.0.1", port), MetadataRequestHandler)
+        tokenPath = tokenPath or defaultTokenPath()
+        server.token = writeToken(tokenPath)
+        where = "localhost port " + str(port) + " (token in " + tokenPath + ")"
+    else :
+        socketPath = socketPath or defaultSocketPath()
+        if not removeStaleSocket(socketPath) :
+            return
+        # Only the user running the server can connect to the socket
+        previousUmask = os.umask(0o077)
+        try :
+            server = UnixMetadataServer(socketPath, MetadataRequestHandler)
+        finally :
+            os.umask(previousUmask)
+        socketInode = os.lstat(socketPath).st_ino
+        where = socketPath
+
+    # Shut down cleanly when terminated, as well as on Ctrl-C. (shutdown() waits for serve_forever() to finish, so
+    # can't be called from the signal handler in the same thread.)
+    signal.signal(signal.SIGTERM, lambda signalNumber, frame : threading.Thread(target=server.shutdown).start())
+
+    with server :
+        server.startWorkers(workers)
+        print("Serving metadata requests on", where, "with", server.workers, "worker(s)")
+        try :
+            server.serve_forever()
+        except KeyboardInterrupt :
+            pass
+        finally :
+            server.shutdownWorkers()
+            # Unless it has been replaced by another server's socket
+            if port is None and os.path.exists(socketPath) and os.lstat(socketPath).st_ino == socketInode :
+                os.remove(socketPath)
+            if port is not None and os.path.exists(tokenPath) and readToken(tokenPath) == server.token :
+                os.remove(tokenPath)
+
+##
+###########################################################################
+##
+
+# Client side - send a single request and return the decoded response. Requests sent to a TCP port include the token
+# from the token file.
+def sendRequest(request, socketPath=None, port=None, tokenPath=None) :
+    if port is not None :
+        request = dict(request, token=readToken(tokenPath or defaultTokenPath()))
+        s = socket.create_connection(("127.0.0.1", port))
+    else :
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.connect(socketPath or defaultSocketPath())
+
+    with s :
+        s.sendall(json.dumps(request).encode() + b'\n')
+        with s.makefile("rb") as f :
+            response = f.readline()
+    return json.loads(response)
+
+def requestForFiles(filenames, sendData=False) :
+    if sendData :
+        files = []
+        for filename in filenames :
+            with open(filename, "rb") as f :
+                files.append({'name' : filename, 'data' : base64.b64encode(f.read()).decode()})
+        return {'files' : files}
+    else :
+        return {'paths' : [os.path.abspath(filename) for filename in filenames]}
+
+def client(filenames, socketPath=None, port=None, sendData=False, tokenPath=None) :
+    response = sendRequest(requestForFiles(filenames, sendData), socketPath, port, tokenPath)
+    if 'error' in response :
+        print("*** Metadata server error:", response['error'], file=sys.stderr)
+        return
+    for p in response['results'] :
+        print(json.dumps(p))
+
+#
+####################################
+#
+
+if __name__ == "__main__" :
+
+    parser = argparse.ArgumentParser(description="Metadata extraction server, and client")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serveParser = subparsers.add_parser("serve", help="run the server")
+    serveParser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: number of CPUs)")
+
+    clientParser = subparsers.add_parser("client", help="send files to a running server, printing a line of JSON properties per file")
+    clientParser.add_argument("--send-data", action="store_true", help="send the file contents, rather than the file paths")
+    clientParser.add_argument("filenames", nargs="+")
+
+    for p in [serveParser, clientParser] :
+        p.add_argument("--socket", default=None, help="Unix domain socket path (default: " + socketFileName + " in the user's runtime folder)")
+        p.add_argument("--port", type=int, default=None, help="use this localhost TCP port instead of a Unix domain socket")
+        p.add_argument("--token-file", default=None, help="with --port, file holding the token requests must include (default: " + tokenFileName + " in the user's runtime folder)")
+
+    args = parser.parse_args()
+
+    if args.command == "serve" :
+        serve(args.socket, args.port, args.workers, args.token_file)
+    else :
+        client(args.filenames, args.socket, args.port, args.send_data, args.token_file)
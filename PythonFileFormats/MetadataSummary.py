@@ -0,0 +1,212 @@
+# Aggregate the main properties of image files (as produced by JPEG.summariseTags) as the files are processed, so
+# that counts per camera make/model, photos per day and month, resolution histograms and GPS coverage can be reported
+# without keeping a record per file. Memory use is bounded: each set of counts has a cap on the number of distinct
+# values kept, with any further values counted together under otherKey.
+#
+# Summaries can be saved as JSON and merged, e.g. to combine the summaries of the shards of a run.
+
+import sys
+import os
+import json
+
+otherKey = "(other)"
+unknownKey = "(unknown)"
+
+# The properties recorded for a file which couldn't be processed (see CSV_from_JPEG_metadata.imageFileProperties and
+# ArchiveScanner.failedMemberProperties)
+failedPropertyNames = {'filename', 'bytes'}
+
+def isFailedProperties(p) :
+    return p.keys() == failedPropertyNames
+
+# The key to count a property value under. Values from damaged files aren't always strings (e.g. a Make tag holding
+# numbers), and counts are saved as JSON with string keys, so other values are counted under their string form.
+def keyForValue(p, name) :
+    if name not in p or p[name] is None :
+        return unknownKey
+    value = p[name]
+    return value if isinstance(value, str) else str(value)
+
+# Counts of distinct values, keeping at most maxKeys of them. Values first seen after the cap is reached are counted
+# under otherKey, so totals are always exact even if the breakdown is not.
+class CappedCounter :
+
+    def __init__(self, maxKeys) :
+        self.maxKeys = maxKeys
+        self.counts = {}
+        self.otherCount = 0
+
+    def add(self, key, n=1) :
+        if key in self.counts :
+            self.counts[key] += n
+        elif len(self.counts) < self.maxKeys :
+            self.counts[key] = n
+        else :
+            self.otherCount += n
+
+    def merge(self, other) :
+        for key, n in other.counts.items() :
+            self.add(key, n)
+        self.otherCount += other.otherCount
+
+    def asDict(self, sortByCount=False) :
+        if sortByCount :
+            items = sorted(self.counts.items(), key=lambda item : (-item[1], item[0]))
+        else :
+            items = sorted(self.counts.items())
+        d = dict(items)
+        if self.otherCount :
+            d[otherKey] = self.otherCount
+        return d
+
+    @classmethod
+    def fromDict(cls, d, maxKeys) :
+        counter = cls(maxKeys)
+        for key, n in d.items() :
+            if key == otherKey :
+                counter.otherCount += n
+            else :
+                counter.add(key, n)
+        return counter
+
+# Names and caps of the sets of counts kept. There are only a few thousand days in a decade or two of photos, so
+# the caps are just protection against unexpected values.
+counterCaps = {
+    'makes' : 1000,
+    'makeModels' : 10000,
+    'software' : 10000,
+    'months' : 10000,
+    'days' : 100000,
+    'megapixels' : 1000,
+    'resolutions' : 10000,
+    'encodings' : 100,
+}
+
+# Sets of counts which are listed in order of their values (e.g. by date); the others are listed in order of
+# decreasing count
+countersSortedByKey = ['months', 'days', 'megapixels']
+
+class MetadataSummary :
+
+    def __init__(self) :
+        self.files = 0
+        self.bytes = 0
+        self.failed = 0
+        self.withTimestamp = 0
+        self.withLocation = 0
+        self.withGPSLocation = 0
+        self.counters = {name : CappedCounter(cap) for name, cap in counterCaps.items()}
+
+    # Add the properties of one file. A properties dictionary with just the filename and size counts as a file which
+    # couldn't be processed.
+    def add(self, p) :
+        self.files += 1
+        if isinstance(p.get('bytes'), int) :
+            self.bytes += p['bytes']
+        if isFailedProperties(p) :
+            self.failed += 1
+            return
+
+        make = keyForValue(p, 'make')
+        model = keyForValue(p, 'model')
+        self.counters['makes'].add(make)
+        self.counters['makeModels'].add(make + " / " + model)
+        self.counters['software'].add(keyForValue(p, 'software'))
+        if 'encoding' in p :
+            self.counters['encodings'].add(keyForValue(p, 'encoding'))
+
+        # Timestamps are 'YYYY:MM:DD HH:MM:SS' in Exif, 'YYYY-MM-DD HH:MM:SS' after summariseTags
+        if isinstance(p.get('timestamp'), str) :
+            self.withTimestamp += 1
+            day = p['timestamp'][0:10].replace(":", "-")
+            self.counters['days'].add(day)
+            self.counters['months'].add(day[0:7])
+        else :
+            self.counters['days'].add(unknownKey)
+            self.counters['months'].add(unknownKey)
+
+        if 'columns' in p and 'rows' in p :
+            try :
+                columns, rows = int(p['columns']), int(p['rows'])
+                self.counters['resolutions'].add("{0}x{1}".format(columns, rows))
+                # Histogram in whole megapixels, zero-padded so that the buckets sort in order
+                self.counters['megapixels'].add("{0:03d}".format(columns * rows // 1000000))
+            except (TypeError, ValueError) :
+                self.counters['resolutions'].add(unknownKey)
+        else :
+            self.counters['resolutions'].add(unknownKey)
+
+        if 'latitude' in p :
+            self.withLocation += 1
+            if p.get('fromGPS') :
+                self.withGPSLocation += 1
+
+    def merge(self, other) :
+        self.files += other.files
+        self.bytes += other.bytes
+        self.failed += other.failed
+        self.withTimestamp += other.withTimestamp
+        self.withLocation += other.withLocation
+        self.withGPSLocation += other.withGPSLocation
+        for name, counter in self.counters.items() :
+            counter.merge(other.counters[name])
+
+    def asDict(self) :
+        d = {}
+        d['files'] = self.files
+        d['bytes'] = self.bytes
+        d['failed'] = self.failed
+        d['withTimestamp'] = self.withTimestamp
+        d['withLocation'] = self.withLocation
+        d['withGPSLocation'] = self.withGPSLocation
+        processed = self.files - self.failed
+        d['locationCoverage'] = round(self.withLocation / processed, 4) if processed else None
+        d['GPSCoverage'] = round(self.withGPSLocation / processed, 4) if processed else None
+        for name, counter in self.counters.items() :
+            d[name] = counter.asDict(sortByCount=name not in countersSortedByKey)
+        return d
+
+    @classmethod
+    def fromDict(cls, d) :
+        summary = cls()
+        summary.files = d['files']
+        summary.bytes = d['bytes']
+        summary.failed = d['failed']
+        summary.withTimestamp = d['withTimestamp']
+        summary.withLocation = d['withLocation']
+        summary.withGPSLocation = d['withGPSLocation']
+        for name, cap in counterCaps.items() :
+            summary.counters[name] = CappedCounter.fromDict(d[name] if name in d else {}, cap)
+        return summary
+
+def writeSummary(summary, filename) :
+    tempName = filename + ".tmp"
+    with open(tempName, "w") as f :
+        json.dump(summary.asDict(), f, indent=2)
+    os.replace(tempName, filename)
+
+def readSummary(filename) :
+    with open(filename) as f :
+        return MetadataSummary.fromDict(json.load(f))
+
+#
+####################################
+#
+
+# Merge summary files, e.g. from separate runs, printing the combined summary
+def main(filenames) :
+    summary = MetadataSummary()
+    for filename in filenames :
+        try :
+            summary.merge(readSummary(filename))
+        except (OSError, ValueError, KeyError) as e :
+            print("*** Unable to read summary file:", filename, " : ", e, file=sys.stderr)
+    print(json.dumps(summary.asDict(), indent=2))
+
+if __name__ == "__main__" :
+
+    if len(sys.argv) == 1 :
+        print("No summary filename command line arguments provided")
+        exit()
+
+    main(sys.argv[1:])
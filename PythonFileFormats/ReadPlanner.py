@@ -0,0 +1,175 @@
+# Plan the reads for a header-only parse of a JPEG file (see JPEG.processFile's headerOnly option), which only needs
+# the segments before the first SOS marker. Where each read is a round trip - to object storage, or a network file
+# system - the aim is to read the header with a single read, without reading much more of the file than needed:
+# - the first read is of a size learnt from the files already read: enough to cover the header of (by default) 95% of
+#   them. Header lengths are kept separately for each 'key' the caller chooses, e.g. the folder a file is in, as
+#   files from the same camera have similar headers, and for all the files read in the run. Only the most recently
+#   used keys are kept, so that a long-running process reading many folders doesn't keep growing.
+# - if the header doesn't fit, the segment lengths already read show exactly how much more is needed to reach the end
+#   of the next segment, so a further read extends the data to that point, plus minimumExtension bytes to cover any
+#   small segments which follow, rather than guessing.
+#
+# Run directly to show the reads needed for the JPEG files under a folder:
+#   python ReadPlanner.py ~/Pictures
+
+import sys
+import os
+import collections
+
+import JPEG
+import Interning
+
+##
+###########################################################################
+##
+
+# Work through the segment length bytes at the start of a JPEG file to find the SOS marker. Returns:
+# - the offset of the SOS marker, or None if not found
+# - 0 if no more data is needed (SOS or EOI marker found, or the data is damaged so there's no point reading
+#   further), otherwise the length the data needs to be extended to in order to get past the next segment
+def scanHeaderSegments(data) :
+    n = 2
+    while True :
+        if n + 4 > len(data) :
+            # Need the next marker and its length bytes
+            return None, n + 4
+        if data[n] != 0xFF :
+            return None, 0
+        markerByte = data[n+1]
+        if markerByte == 0xFF :
+            # Fill byte
+            n += 1
+        elif markerByte == 0xDA :
+            return n, 0
+        elif markerByte == 0xD9 :
+            return None, 0
+        elif markerByte in JPEG.standaloneMarkers :
+            n += 2
+        else :
+            n += 2 + int.from_bytes(data[n+2:n+4], byteorder='big')
+
+# The header lengths recorded for one key
+class HeaderLengths :
+
+    def __init__(self, maxObservations) :
+        # The most recent maxObservations header lengths
+        self.lengths = collections.deque(maxlen=maxObservations)
+        # Number of header lengths recorded
+        self.observations = 0
+        # Number of header lengths recorded when the read size was last calculated, and the read size, as the read
+        # size is only recalculated after every few new header lengths
+        self.calculatedAt = 0
+        self.readSize = 0
+
+class HeaderReadPlanner :
+
+    def __init__(self, defaultReadSize=64*1024, coverage=0.95, minObservations=20, maxObservations=1000, alignment=4096, minimumExtension=4096, maxKeys=1000) :
+        self.defaultReadSize = defaultReadSize
+        self.coverage = coverage
+        self.minObservations = minObservations
+        self.maxObservations = maxObservations
+        self.alignment = alignment
+        self.minimumExtension = minimumExtension
+        # Key => HeaderLengths, for the maxKeys most recently used keys
+        self.keyHeaderLengths = Interning.InternCache(maxKeys)
+        # For all the files read
+        self.allHeaderLengths = HeaderLengths(maxObservations)
+        # Number of files read with 1 read, 2 reads, ...
+        self.readCounts = collections.Counter()
+
+    def headerLengths(self, key, create=False) :
+        if key is None :
+            return self.allHeaderLengths
+        headerLengths = self.keyHeaderLengths.lookup(key)
+        if headerLengths is None and create :
+            headerLengths = self.keyHeaderLengths.add(key, HeaderLengths(self.maxObservations))
+        return headerLengths
+
+    # The size of the first read for a file
+    def readSize(self, key=None) :
+        for headerLengths in [self.headerLengths(key), self.allHeaderLengths] :
+            if headerLengths is None or headerLengths.observations < self.minObservations :
+                continue
+            if headerLengths.observations - headerLengths.calculatedAt >= self.minObservations // 4 :
+                ordered = sorted(headerLengths.lengths)
+                covered = ordered[min(len(ordered) - 1, int(len(ordered) * self.coverage))]
+                headerLengths.readSize = (covered + self.alignment - 1) // self.alignment * self.alignment
+                headerLengths.calculatedAt = headerLengths.observations
+            return headerLengths.readSize
+        return self.defaultReadSize
+
+    # How much more to read, to extend data to the length needed
+    def extensionSize(self, data, neededLength) :
+        return neededLength - len(data) + self.minimumExtension
+
+    def record(self, headerLength, reads, key=None) :
+        self.readCounts[reads] += 1
+        for headerLengths in ([self.allHeaderLengths] if key is None else [self.headerLengths(key, create=True), self.allHeaderLengths]) :
+            headerLengths.lengths.append(headerLength)
+            headerLengths.observations += 1
+
+    def statistics(self) :
+        return {'files' : sum(self.readCounts.values()),
+                'reads' : sum(reads * n for reads, n in self.readCounts.items()),
+                'singleReadFiles' : self.readCounts[1],
+                'readSize' : self.readSize() }
+
+# Planner shared by all the header-only reads in this process
+defaultPlanner = HeaderReadPlanner()
+
+# Read the header of a JPEG file, up to and including the SOS marker, from the current position (normally the start)
+# of the file object f. Any data already read from the start of the file can be passed in. The data returned can be
+# more than the header, or less if the file is truncated or damaged.
+def readHeader(f, planner=None, key=None, data=b'') :
+    if planner is None :
+        planner = defaultPlanner
+
+    reads = 1
+    if not data :
+        data = f.read(planner.readSize(key))
+
+    SOSOffset, neededLength = scanHeaderSegments(data)
+    while neededLength > 0 :
+        moreData = f.read(planner.extensionSize(data, neededLength))
+        reads += 1
+        if not moreData :
+            break
+        data += moreData
+        SOSOffset, neededLength = scanHeaderSegments(data)
+
+    if SOSOffset is not None :
+        # Up to the end of the SOS marker and length bytes
+        planner.record(SOSOffset + 4, reads, key)
+    return data
+
+#
+####################################
+#
+
+def main(topdir) :
+    if not os.path.isdir(topdir) :
+        print("***",  topdir, "is not a directory", file=sys.stderr)
+        return
+
+    planner = HeaderReadPlanner()
+    for dirpath, dirnamesList, filenamesList in os.walk(topdir) :
+        for name in filenamesList :
+            with open(os.path.join(dirpath, name), "rb") as f :
+                if f.read(3) != b'\xff\xd8\xff' :
+                    continue
+                f.seek(0)
+                readHeader(f, planner, dirpath)
+
+    statistics = planner.statistics()
+    print("JPEG files:", statistics['files'], "- reads:", statistics['reads'], "- files read with a single read:", statistics['singleReadFiles'])
+    print("Size of first read now:", statistics['readSize'], "bytes")
+    for reads, n in sorted(planner.readCounts.items()) :
+        print("  ", reads, "read(s):", n, "file(s)")
+
+if __name__ == "__main__" :
+
+    if len(sys.argv) == 1 :
+        print("No folder command line argument provided")
+        exit()
+
+    main(sys.argv[1])
@@ -0,0 +1,79 @@
+# Extract basic metadata from TIFF format files, including camera 'raw' formats based on TIFF such as DNG. The
+# IFD handling is the same as for the TIFF content embedded in the Exif segment of a JPEG file, so is shared with JPEG.py
+
+import sys
+import os
+import mmap
+
+import JPEG
+
+# TIFF files start with a byte order indicator ('II' little-endian or 'MM' big-endian) followed by the value 42
+def isTIFFSignature(headerBytes) :
+    return headerBytes[0:4] in [b'II\x2a\x00', b'MM\x00\x2a']
+
+def processTIFFData(filename, TIFF) :
+    if not isTIFFSignature(TIFF[0:4]) :
+        print("*** TIFF header not found in file:", filename, file=sys.stderr)
+        return {}
+    return JPEG.processTIFF(TIFF)
+
+# If fileObject is passed in, the data is read from it rather than from the named file
+def processFile(filename, verbose=False, veryVerbose=False, fileObject=None) :
+
+    if verbose :
+        print("Reading from:", filename)
+
+    allTags = {}
+
+    if fileObject is not None :
+        TIFF = fileObject.read()
+        bytecount = len(TIFF)
+        allTags = processTIFFData(filename, TIFF)
+    else :
+        bytecount = os.path.getsize(filename)
+        if bytecount > 0 :
+            with open(filename, "rb") as f :
+                # IFDs and their values can be anywhere in the file, so map the whole file rather than reading it, and only
+                # the pages we actually look at are read in.
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as TIFF :
+                    allTags = processTIFFData(filename, TIFF)
+
+    if verbose :
+        print("Extracted these IFDs from the TIFF file:")
+        for n, d in allTags.items() :
+            print("- ", n, ":", len(d), "item(s)")
+
+    propertiesDict = {}
+    propertiesDict['filename'] = filename
+    propertiesDict['bytes'] = bytecount
+    JPEG.summariseTags(propertiesDict, allTags, verbose)
+
+    if veryVerbose :
+        import JPEGDisplay
+        JPEGDisplay.displayAllTags(allTags)
+
+    return propertiesDict
+
+#
+####################################
+#
+
+def main(filename) :
+
+    if not os.path.isfile(filename) :
+        print("***",  filename, "is not a file", file=sys.stderr)
+        return
+
+    veryVerbose = False  # For debugging
+    mainProperties = processFile(filename, True, veryVerbose)
+    import JPEGDisplay
+    JPEGDisplay.displayMainProperties(mainProperties)
+
+if __name__ == "__main__" :
+
+    if len(sys.argv) == 1 :
+        print("No filename command line argument provided")
+        exit()
+
+    filename = sys.argv[1]
+    main(filename)
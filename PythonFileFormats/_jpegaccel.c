@@ -0,0 +1,179 @@
+/*
+ * Optional C implementations of the innermost loops of JPEG.py:
+ * - scanEntropyCodedData : search scan data for the marker which ends it, counting RST markers
+ * - unpackIFDEntries : unpack the 12-byte entries of a TIFF/Exif IFD
+ * Each produces exactly the same results as the pure Python function of the same name in JPEG.py, which is used
+ * if this module hasn't been built. Build with: python BuildAccelerator.py
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <string.h>
+
+/*
+ * scanEntropyCodedData(block, n, restartMarkerOffsets, blockOffset) -> (n, restartMarkerCount, markerByte)
+ */
+static PyObject *
+scanEntropyCodedData(PyObject *self, PyObject *args)
+{
+    Py_buffer view;
+    Py_ssize_t n;
+    PyObject *restartMarkerOffsets;
+    unsigned long long blockOffset;
+    long restartMarkerCount = 0;
+    int markerByte = -1;
+
+    if (!PyArg_ParseTuple(args, "y*nOK", &view, &n, &restartMarkerOffsets, &blockOffset))
+        return NULL;
+
+    const unsigned char *data = (const unsigned char *)view.buf;
+    Py_ssize_t length = view.len;
+    if (n < 0)
+        n = 0;
+
+    while (1) {
+        const unsigned char *p = (n < length) ? memchr(data + n, 0xFF, (size_t)(length - n)) : NULL;
+        if (p == NULL) {
+            n = length;
+            break;
+        }
+        n = p - data;
+        if (n == length - 1)
+            break;
+
+        unsigned char nextDataByte = data[n + 1];
+        if (nextDataByte == 0x00) {
+            n += 2;
+        }
+        else if (nextDataByte >= 0xD0 && nextDataByte <= 0xD7) {
+            restartMarkerCount++;
+            if (restartMarkerOffsets != Py_None) {
+                PyObject *result = PyObject_CallMethod(restartMarkerOffsets, "append", "K", blockOffset + (unsigned long long)n);
+                if (result == NULL) {
+                    PyBuffer_Release(&view);
+                    return NULL;
+                }
+                Py_DECREF(result);
+            }
+            n += 2;
+        }
+        else if (nextDataByte == 0xFF) {
+            n += 1;
+        }
+        else {
+            markerByte = nextDataByte;
+            break;
+        }
+    }
+
+    PyBuffer_Release(&view);
+    if (markerByte < 0)
+        return Py_BuildValue("nlO", n, restartMarkerCount, Py_None);
+    return Py_BuildValue("nli", n, restartMarkerCount, markerByte);
+}
+
+/*
+ * Read an unsigned integer of width bytes at pos, using only the bytes which are within the data - the same as
+ * int.from_bytes() of a slice which has been cut short by the end of the data.
+ */
+static unsigned long long
+readUInt(const unsigned char *data, Py_ssize_t length, Py_ssize_t pos, int width, int bigEndian)
+{
+    unsigned long long value = 0;
+    int available = 0;
+    if (pos >= 0 && pos < length)
+        available = (length - pos < width) ? (int)(length - pos) : width;
+    for (int i = 0; i < available; i++) {
+        if (bigEndian)
+            value = (value << 8) | data[pos + i];
+        else
+            value |= (unsigned long long)data[pos + i] << (8 * i);
+    }
+    return value;
+}
+
+/*
+ * unpackIFDEntries(TIFF, IFDOffset, elementCount, byteAlignmentIndicator)
+ *     -> [(tag, dataFormat, componentCount, dataBytes, dataBytesAsOffset), ...]
+ */
+static PyObject *
+unpackIFDEntries(PyObject *self, PyObject *args)
+{
+    Py_buffer view;
+    Py_ssize_t IFDOffset, elementCount;
+    const char *byteAlignmentIndicator;
+
+    if (!PyArg_ParseTuple(args, "y*nns", &view, &IFDOffset, &elementCount, &byteAlignmentIndicator))
+        return NULL;
+
+    /* A negative offset would read memory before the data */
+    if (IFDOffset < 0) {
+        PyBuffer_Release(&view);
+        PyErr_SetString(PyExc_ValueError, "IFD offset must not be negative");
+        return NULL;
+    }
+
+    /*
+     * The last byte looked at is at IFDOffset + 2 + 12 * (elementCount - 1) + 11. Check that this can be represented
+     * before working out any positions, comparing against what is left below the limit rather than adding (signed
+     * overflow is undefined behaviour, so can't be checked for after the event).
+     */
+    if (elementCount > 0 &&
+        (IFDOffset > PY_SSIZE_T_MAX - 14 || elementCount - 1 > (PY_SSIZE_T_MAX - 14 - IFDOffset) / 12)) {
+        PyBuffer_Release(&view);
+        PyErr_SetString(PyExc_ValueError, "IFD entry offset out of range");
+        return NULL;
+    }
+
+    const unsigned char *data = (const unsigned char *)view.buf;
+    Py_ssize_t length = view.len;
+    int bigEndian = strcmp(byteAlignmentIndicator, "MM") == 0;
+
+    PyObject *entries = PyList_New(elementCount > 0 ? elementCount : 0);
+    if (entries == NULL) {
+        PyBuffer_Release(&view);
+        return NULL;
+    }
+
+    for (Py_ssize_t i = 0; i < elementCount; i++) {
+        Py_ssize_t pos = IFDOffset + 2 + 12 * i;
+        Py_ssize_t dataPos = pos + 8;
+        Py_ssize_t dataLength = 0;
+        if (dataPos < length)
+            dataLength = (length - dataPos < 4) ? length - dataPos : 4;
+
+        PyObject *entry = Py_BuildValue("(KKKy#K)",
+                                        readUInt(data, length, pos, 2, bigEndian),
+                                        readUInt(data, length, pos + 2, 2, bigEndian),
+                                        readUInt(data, length, pos + 4, 4, bigEndian),
+                                        dataLength ? (const char *)(data + dataPos) : "", dataLength,
+                                        readUInt(data, length, dataPos, 4, bigEndian));
+        if (entry == NULL) {
+            Py_DECREF(entries);
+            PyBuffer_Release(&view);
+            return NULL;
+        }
+        PyList_SET_ITEM(entries, i, entry);
+    }
+
+    PyBuffer_Release(&view);
+    return entries;
+}
+
+static PyMethodDef methods[] = {
+    {"scanEntropyCodedData", scanEntropyCodedData, METH_VARARGS,
+     "Search scan data for the marker which ends it, returning (n, restartMarkerCount, markerByte)."},
+    {"unpackIFDEntries", unpackIFDEntries, METH_VARARGS,
+     "Unpack the 12-byte entries of an IFD."},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef module = {
+    PyModuleDef_HEAD_INIT, "_jpegaccel", "Optional C implementations of the inner loops of JPEG.py.", -1, methods
+};
+
+PyMODINIT_FUNC
+PyInit__jpegaccel(void)
+{
+    return PyModule_Create(&module);
+}